@@ -1,21 +1,106 @@
-from django.contrib import admin
-from .models import Proposal, User, Category, Product, ProductImage, Notification
+from django.contrib import admin, messages
+from .archive import archive_product_batch, product_candidates
+from .models import (
+    ArchivedNotification, ArchivedProduct, ArchivedProductImage, ArchivedProposal,
+    Proposal, User, Category, Product, ProductImage, Notification,
+)
 from django.contrib.auth.admin import UserAdmin as DefaultUserAdmin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.text import smart_split, unescape_string_literal
+
+
+def estimated_row_count(model):
+    """
+    Estimativa barata do total de linhas da tabela, pelas estatísticas do
+    banco (PostgreSQL/MySQL) ou pelo maior id (SQLite). None se não houver.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+            )
+        else:
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Evita o COUNT(*) nas tabelas grandes: sem filtro usa a estimativa do
+    banco; com filtro conta no máximo `count_limit` + 1 linhas.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        return self.object_list[:self.count_limit + 1].count()
+
+
+SEARCH_LOOKUPS = {'^': 'istartswith', '=': 'iexact'}
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Busca em que todo ramo do OR usa índice. `=<fk>__username` vira
+        `<fk> IN (usuários com esse username)`, resolvido pelo índice de
+        username; um OR com a coluna da outra tabela pelo JOIN faria o
+        banco varrer a tabela inteira. Os campos da própria tabela seguem
+        a sintaxe do admin ('^' prefixo, '=' igualdade, sem diferenciar
+        maiúsculas; ver os índices da migração 0020).
+        """
+        fields = self.get_search_fields(request)
+        user_fields = [f for f in fields if f.startswith('=') and f.endswith('__username')]
+        if not user_fields or not search_term:
+            return super().get_search_results(request, queryset, search_term)
+
+        own_fields = [f for f in fields if f not in user_fields]
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            users = User.objects.filter(username__iexact=bit).values('pk')
+            condition = Q()
+            for field in own_fields:
+                lookup = SEARCH_LOOKUPS.get(field[0])
+                name = field[1:] if lookup else field
+                condition |= Q(**{f'{name}__{lookup or "icontains"}': bit})
+            for field in user_fields:
+                condition |= Q(**{f'{field[1:].removesuffix("__username")}__in': users})
+            queryset = queryset.filter(condition)
+        return queryset, False
+
 
 @admin.register(User)
-class UserAdmin(DefaultUserAdmin):
+class UserAdmin(LargeTableAdmin, DefaultUserAdmin):
     list_display = ('id', 'username', 'email', 'avatar', 'reputation_level', 'password', 'fullName', 'city', 'state')
     list_filter  = ('reputation_level',)
-    search_fields = ('username', 'email')
+    search_fields = ('^username', '=email')
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'image_url')
+    list_display = ('id', 'name', 'image_url', 'available_count')
     search_fields = ('name',)
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'title',
@@ -25,35 +110,108 @@ class ProductAdmin(admin.ModelAdmin):
         'created_at',
         'updated_at',
     )
+    list_select_related = ('user', 'category')
     list_filter = ('status', 'category', 'created_at')
-    search_fields = ('title', 'description', 'user__username')
-    raw_id_fields = ('user', 'category')
+    # prefixo/igualdade usam os índices sem diferenciar maiúsculas; icontains em description não
+    search_fields = ('^title', '=user__username')
+    autocomplete_fields = ('user', 'category')
+    actions = ['archive_selected']
+
+    @admin.action(description='Arquivar produtos trocados selecionados')
+    def archive_selected(self, request, queryset):
+        # só trocados e sem proposta em aberto; o resto é ignorado
+        candidates = product_candidates(exchanged_before=timezone.now())
+        ids = list(candidates.filter(pk__in=queryset.values('pk')).values_list('id', flat=True))
+        if not ids:
+            self.message_user(request, 'Nenhum produto elegível para arquivamento.', messages.WARNING)
+            return
+        products = images = proposals = 0
+        for start in range(0, len(ids), 500):
+            batch = archive_product_batch(candidates, ids[start:start + 500])
+            products += batch.products
+            images += batch.images
+            proposals += batch.proposals
+        self.message_user(
+            request,
+            f'{products} produtos, {images} imagens e {proposals} propostas arquivados.',
+        )
 
 
 @admin.register(ProductImage)
-class ProductImageAdmin(admin.ModelAdmin):
+class ProductImageAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'product',
         'is_main',
         'url',
     )
-    list_filter = ('is_main', 'product')
-    search_fields = ('product__title',)
-    raw_id_fields = ('product',)
+    list_select_related = ('product',)
+    # filtrar por produto: ?product=<id> ou pela busca (o dropdown listava todos)
+    list_filter = ('is_main',)
+    search_fields = ('^product__title',)
+    autocomplete_fields = ('product',)
 
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'title',
+        'user',
+        'type',
+        'read',
+        'count',
+        'created_at',
     )
-    
+    list_select_related = ('user',)
+    list_filter = ('type', 'read')
+    search_fields = ('=user__username',)
+    autocomplete_fields = ('user',)
+
 
 @admin.register(Proposal)
-class ProposalAdmin(admin.ModelAdmin):
+class ProposalAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'message',
+        'from_user',
+        'to_user',
+        'product_offered',
+        'product_requested',
+        'status',
+        'updated_at',
     )
+    list_select_related = ('from_user', 'to_user', 'product_offered', 'product_requested')
+    list_filter = ('status',)
+    search_fields = ('=from_user__username', '=to_user__username')
+    autocomplete_fields = ('from_user', 'to_user', 'product_offered', 'product_requested')
+
+
+class ArchivedAdmin(LargeTableAdmin):
+    """Tabelas de arquivo: só leitura."""
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedProduct)
+class ArchivedProductAdmin(ArchivedAdmin):
+    list_display = ('id', 'title', 'user_id', 'status', 'updated_at', 'archived_at')
+    search_fields = ('title',)
+
+
+@admin.register(ArchivedProductImage)
+class ArchivedProductImageAdmin(ArchivedAdmin):
+    list_display = ('id', 'product_id', 'is_main', 'url', 'archived_at')
+
+
+@admin.register(ArchivedProposal)
+class ArchivedProposalAdmin(ArchivedAdmin):
+    list_display = ('id', 'from_user_id', 'to_user_id', 'status', 'updated_at', 'archived_at')
+
+
+@admin.register(ArchivedNotification)
+class ArchivedNotificationAdmin(ArchivedAdmin):
+    list_display = ('id', 'user_id', 'type', 'title', 'created_at', 'archived_at')
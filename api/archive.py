@@ -0,0 +1,137 @@
+# api/archive.py
+"""
+Arquivamento de produtos trocados/parados e notificações antigas.
+
+Cada lote roda numa transação própria: confere de novo, dentro dela, quais
+produtos do lote continuam elegíveis (travando as linhas), copia as linhas
+para as tabelas Archived* (mesmo id, `ignore_conflicts`) e apaga das
+tabelas principais. Um produto que recebeu proposta depois da seleção fica.
+Se o processo for interrompido, basta rodar de novo: o que já foi movido
+não é mais candidato e um lote pela metade foi desfeito pelo rollback.
+"""
+import time
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import stats
+from .models import (
+    ArchivedNotification, ArchivedProduct, ArchivedProductImage, ArchivedProposal,
+    Notification, Product, ProductImage, Proposal,
+)
+
+
+# propostas nesses status ainda estão em andamento: o produto fica
+OPEN_PROPOSAL_STATUSES = [Proposal.Status.PENDING, Proposal.Status.ACCEPTED]
+
+
+@dataclass
+class BatchResult:
+    products: int = 0
+    images: int = 0
+    proposals: int = 0
+    notifications: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows(self):
+        return self.products + self.images + self.proposals + self.notifications
+
+
+def product_candidates(exchanged_before, stale_before=None):
+    """
+    Produtos trocados antes de `exchanged_before` e, se informado, qualquer
+    produto sem atualização desde `stale_before`. Produtos com proposta em
+    aberto nunca são arquivados.
+    """
+    condition = Q(status=Product.Status.EXCHANGED, updated_at__lt=exchanged_before)
+    if stale_before is not None:
+        condition |= Q(updated_at__lt=stale_before)
+    return (
+        Product.objects.filter(condition)
+        .exclude(offers_made__status__in=OPEN_PROPOSAL_STATUSES)
+        .exclude(offers_received__status__in=OPEN_PROPOSAL_STATUSES)
+        .order_by('id')
+    )
+
+
+def _copy(archive_model, rows, fields):
+    archive_model.objects.bulk_create(
+        [archive_model(**{f: getattr(row, f) for f in fields}) for row in rows],
+        ignore_conflicts=True,
+    )
+    return len(rows)
+
+
+PRODUCT_FIELDS = ['id', 'title', 'description', 'category_id', 'user_id', 'acceptable_exchanges',
+                  'status', 'created_at', 'updated_at']
+IMAGE_FIELDS = ['id', 'product_id', 'url', 'is_main']
+PROPOSAL_FIELDS = ['id', 'product_offered_id', 'product_requested_id', 'from_user_id', 'to_user_id',
+                   'message', 'status', 'created_at', 'updated_at']
+NOTIFICATION_FIELDS = ['id', 'user_id', 'type', 'title', 'message', 'read', 'created_at',
+                       'link_to', 'related_id', 'count']
+
+
+def archive_product_batch(candidates, ids):
+    """
+    Move para o arquivo, com imagens e propostas, os produtos de `ids` que
+    ainda estão em `candidates` (ver product_candidates) no momento do lote.
+    """
+    result = BatchResult()
+    start = time.perf_counter()
+    with transaction.atomic():
+        # a elegibilidade é refeita sob lock: uma proposta criada entre a
+        # seleção e o lote tira o produto do lote (e espera o commit para
+        # referenciar um produto travado)
+        products = list(candidates.filter(pk__in=ids).select_for_update(of=('self',)))
+        ids = [product.pk for product in products]
+        images = list(ProductImage.objects.filter(product_id__in=ids))
+        # sem as propostas o histórico de trocas (e a reputação) se perderia no CASCADE
+        proposals = list(Proposal.objects.filter(Q(product_offered_id__in=ids) | Q(product_requested_id__in=ids)))
+
+        result.products = _copy(ArchivedProduct, products, PRODUCT_FIELDS)
+        result.images = _copy(ArchivedProductImage, images, IMAGE_FIELDS)
+        result.proposals = _copy(ArchivedProposal, proposals, PROPOSAL_FIELDS)
+        # CASCADE apaga imagens, propostas e entradas de feed
+        Product.objects.filter(pk__in=ids).delete()
+        # contadores dos donos e das partes, recalculados na transação do lote
+        # (propostas arquivadas continuam contando)
+        users = {product.user_id for product in products}
+        users.update(pk for proposal in proposals for pk in (proposal.from_user_id, proposal.to_user_id))
+        stats.reconcile(users)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def archive_products(exchanged_before, stale_before=None, batch_size=500, max_batches=None):
+    """Gera um BatchResult por lote até acabar os candidatos (ou `max_batches`)."""
+    done = 0
+    while max_batches is None or done < max_batches:
+        ids = list(product_candidates(exchanged_before, stale_before).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield archive_product_batch(product_candidates(exchanged_before, stale_before), ids)
+        done += 1
+
+
+def archive_notification_batch(ids):
+    result = BatchResult()
+    start = time.perf_counter()
+    with transaction.atomic():
+        rows = list(Notification.objects.filter(pk__in=ids))
+        result.notifications = _copy(ArchivedNotification, rows, NOTIFICATION_FIELDS)
+        Notification.objects.filter(pk__in=ids).delete()
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def archive_notifications(queryset, batch_size=1000, max_batches=None):
+    """Arquiva as notificações do `queryset` em lotes."""
+    done = 0
+    while max_batches is None or done < max_batches:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield archive_notification_batch(ids)
+        done += 1
@@ -0,0 +1,306 @@
+# api/cache.py
+"""
+Cache em dois níveis para as leituras quentes: categorias, produtos e
+usuários (perfil + média das avaliações) aninhados nas respostas.
+
+- L1: LRU em memória do processo, com TTL curto (CACHE_LOCAL_TTL);
+- L2: um cache do Django compartilhado entre os workers
+  (SHARED_CACHE_ALIAS: Redis/Memcached em produção; o FileBasedCache
+  'shared' das settings serve num host só). Sem alias, só o L1.
+
+Invalidação: `invalidate()` tira as chaves do L1 local e do L2 e publica
+uma mensagem num log guardado no próprio L2 (`<ns>:inv:<n>`). O número da
+mensagem sai de `incr` num contador (`<ns>:inv:head`) sem expiração. Cada
+worker lê o log no máximo a cada CACHE_INVALIDATION_POLL segundos e
+descarta as chaves do seu L1. Se ficou para trás mais que a retenção do
+log, ou se o contador recomeçou (L2 reiniciado ou chave despejada), limpa
+o L1 inteiro. Dentro de uma transação a invalidação é repetida no commit,
+para não sobrar no cache o valor lido antes dele. Um valor calculado
+enquanto a própria chave foi invalidada não é guardado.
+
+Single-flight: numa falta, só uma thread por processo calcula a chave (as
+outras esperam o resultado) e, com L2, só um processo (lock com
+`cache.add`); os outros esperam o valor aparecer no L2.
+
+Renovação antecipada probabilística (XFetch): cada entrada guarda quanto
+custou calculá-la e, perto de vencer, uma leitura decide renovar com
+probabilidade crescente. A chave quente é recalculada por um só, antes de
+expirar, em vez de por todos ao mesmo tempo depois; quem não renova segue
+servindo o valor atual.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+
+SHARED_ALIAS = getattr(settings, 'SHARED_CACHE_ALIAS', None)
+LOCAL_TTL = getattr(settings, 'CACHE_LOCAL_TTL', 10)
+POLL_INTERVAL = getattr(settings, 'CACHE_INVALIDATION_POLL', 1.0)
+# por quanto tempo uma mensagem de invalidação fica no log
+LOG_RETENTION = 300
+# quanto se espera outra thread/processo calcular a mesma chave
+WAIT_SECONDS = 5
+
+ALL = '*'
+_DEFAULT = object()
+
+STATS = ['local_hits', 'shared_hits', 'misses', 'coalesced', 'early_refreshes', 'invalidations']
+
+
+class TieredCache:
+    def __init__(self, namespace, ttl=300, local_ttl=LOCAL_TTL, max_entries=1000, beta=1.0, shared=_DEFAULT):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local_ttl = min(local_ttl, ttl)
+        self.max_entries = max_entries
+        self.beta = beta
+        self._shared = shared
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        # chave -> cálculos em andamento; a invalidação da chave descarta os tokens
+        self._computing = {}
+        self._log_id = None
+        self._log_position = None
+        self._polled_at = 0
+        self.stats = dict.fromkeys(STATS, 0)
+
+    @property
+    def shared(self):
+        if self._shared is _DEFAULT:
+            self._shared = caches[SHARED_ALIAS] if SHARED_ALIAS else None
+        return self._shared
+
+    def _key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def _log_key(self, n):
+        return f'{self.namespace}:inv:{n}'
+
+    # leitura
+
+    def get_or_compute(self, key, compute):
+        """Valor da chave; `compute()` só roda numa falta (ou renovação)."""
+        self._poll()
+        now = time.time()
+        entry = self._local_get(key, now)
+        if entry is not None:
+            self.stats['local_hits'] += 1
+        else:
+            entry = self._shared_get(key, now)
+            if entry is None:
+                return self._fill(key, compute)
+            self.stats['shared_hits'] += 1
+            self._local_set(key, entry, now)
+        if self._should_refresh(entry, now):
+            return self._fill(key, compute, current=entry)
+        return entry[0]
+
+    def _should_refresh(self, entry, now):
+        _value, delta, expires_at = entry
+        # XFetch: -log(u) é exponencial, cresce a chance conforme se aproxima do fim
+        return now - delta * self.beta * math.log(1.0 - random.random()) >= expires_at
+
+    def _local_get(self, key, now):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            entry, local_until = item
+            if local_until <= now:
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _local_set(self, key, entry, now):
+        with self._lock:
+            self._local[key] = (entry, min(now + self.local_ttl, entry[2]))
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def _shared_get(self, key, now):
+        if self.shared is None:
+            return None
+        entry = self.shared.get(self._key(key))
+        if entry is None or entry[2] <= now:
+            return None
+        return entry
+
+    # cálculo (single-flight)
+
+    def _fill(self, key, compute, current=None):
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            self.stats['coalesced'] += 1
+            if current is not None:
+                # outra thread já está renovando: serve o valor atual
+                return current[0]
+            event.wait(WAIT_SECONDS)
+            entry = self._local_get(key, time.time())
+            return entry[0] if entry is not None else self._compute(key, compute)[0]
+        try:
+            if current is not None:
+                self.stats['early_refreshes'] += 1
+            return self._lead(key, compute, current)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _lead(self, key, compute, current):
+        shared = self.shared
+        if shared is None:
+            return self._compute(key, compute)[0]
+
+        lock_key = self._key(f'{key}:lock')
+        token = uuid.uuid4().hex
+        if shared.add(lock_key, token, WAIT_SECONDS):
+            try:
+                return self._compute(key, compute)[0]
+            finally:
+                if shared.get(lock_key) == token:
+                    shared.delete(lock_key)
+
+        # outro processo está calculando
+        self.stats['coalesced'] += 1
+        if current is not None:
+            return current[0]
+        deadline = time.monotonic() + WAIT_SECONDS
+        pause = 0.005
+        while time.monotonic() < deadline:
+            time.sleep(pause)
+            pause = min(pause * 2, 0.05)
+            now = time.time()
+            entry = self._shared_get(key, now)
+            if entry is not None:
+                self._local_set(key, entry, now)
+                return entry[0]
+        return self._compute(key, compute)[0]
+
+    def _compute(self, key, compute):
+        token = object()
+        with self._lock:
+            self._computing.setdefault(key, set()).add(token)
+        started = time.perf_counter()
+        try:
+            value = compute()
+        finally:
+            with self._lock:
+                tokens = self._computing.get(key, set())
+                # chave invalidada enquanto calculava: o valor pode ser anterior à mudança
+                fresh = token in tokens
+                tokens.discard(token)
+                if not tokens:
+                    self._computing.pop(key, None)
+        now = time.time()
+        ttl = self.ttl if self.shared is not None else self.local_ttl
+        entry = (value, time.perf_counter() - started, now + ttl)
+        self.stats['misses'] += 1
+        if fresh:
+            self._local_set(key, entry, now)
+            if self.shared is not None:
+                self.shared.set(self._key(key), entry, ttl)
+        return entry
+
+    # invalidação
+
+    def invalidate(self, *keys):
+        keys = [key for key in keys if key is not None]
+        if not keys:
+            return
+        self._invalidate(keys)
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self._invalidate(keys))
+
+    def _invalidate(self, keys):
+        self._forget(keys)
+        shared = self.shared
+        if shared is not None:
+            shared.delete_many([self._key(key) for key in keys])
+            self._publish(keys)
+
+    def _forget(self, keys):
+        with self._lock:
+            if ALL in keys:
+                self._local.clear()
+                self._computing.clear()
+            for key in keys:
+                self._local.pop(key, None)
+                self._computing.pop(key, None)
+
+    def clear_local(self):
+        self._forget([ALL])
+
+    def _publish(self, keys):
+        shared = self.shared
+        while True:
+            n = self._next_log_number()
+            # o incr do FileBasedCache não é atômico: o add garante um número por mensagem
+            if shared.add(self._log_key(n), list(keys), LOG_RETENTION):
+                break
+        # o próprio processo já aplicou
+        if self._log_position is not None and n == self._log_position + 1:
+            self._log_position = n
+
+    def _next_log_number(self):
+        shared = self.shared
+        head = self._log_key('head')
+        try:
+            return shared.incr(head)
+        except ValueError:
+            # contador ainda não existe (ou foi despejado): recomeça, sem
+            # expiração, com outro id para os workers saberem que recomeçou
+            if shared.add(head, 0, None):
+                shared.set(self._log_key('id'), uuid.uuid4().hex, None)
+            return shared.incr(head)
+
+    def _poll(self):
+        shared = self.shared
+        if shared is None:
+            return
+        now = time.monotonic()
+        if now - self._polled_at < POLL_INTERVAL:
+            return
+        self._polled_at = now
+
+        state = shared.get_many([self._log_key('head'), self._log_key('id')])
+        head = state.get(self._log_key('head'), 0)
+        log_id = state.get(self._log_key('id'))
+        if self._log_position is None:
+            # primeira leitura do processo: o L1 ainda está vazio
+            self._log_id, self._log_position = log_id, head
+            return
+        if log_id != self._log_id or head < self._log_position:
+            # o log recomeçou: as mensagens novas não se relacionam com a posição antiga
+            self._forget([ALL])
+            self.stats['invalidations'] += 1
+            self._log_id, self._log_position = log_id, head
+            return
+        if head == self._log_position:
+            return
+        names = [self._log_key(n) for n in range(self._log_position + 1, head + 1)]
+        messages = shared.get_many(names)
+        if len(messages) < len(names):
+            # mensagens expiradas: não dá para saber o que mudou
+            self._forget([ALL])
+        else:
+            self._forget([key for name in names for key in messages[name]])
+        self.stats['invalidations'] += len(names)
+        self._log_position = head
+
+
+product_cache = TieredCache('product', ttl=getattr(settings, 'PRODUCT_CACHE_TTL', 300), max_entries=5000)
+user_cache = TieredCache('user', ttl=getattr(settings, 'USER_CACHE_TTL', 300), max_entries=5000)
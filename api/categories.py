@@ -0,0 +1,89 @@
+# api/categories.py
+"""
+Cache de categorias.
+
+São poucas dezenas de linhas: carregamos todas numa query só e servimos
+daqui tanto o endpoint /categories/ quanto a representação de produtos.
+Ficam no cache em dois níveis (api/cache.py) em duas chaves: 'all' (id,
+nome, imagem), usada pelos produtos, e 'counts' (`available_count`), que
+só o endpoint lê. Criar um produto ou mudar o status dele invalida só as
+contagens; a lista usada pelos produtos só cai quando uma categoria muda.
+A invalidação chega aos outros workers pelo log do cache compartilhado
+(ou pelo TTL, sem ele).
+"""
+import threading
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .cache import TieredCache
+from .models import Category, Product
+
+
+class CategoryCache:
+    fields = ('id', 'name', 'image_url')
+
+    def __init__(self, ttl=60):
+        self.tier = TieredCache('category', ttl=ttl, local_ttl=ttl, max_entries=2)
+        self._lock = threading.Lock()
+        # índice por id da última lista vista
+        self._index = (None, {})
+
+    def _load(self):
+        return list(Category.objects.order_by('name').values(*self.fields))
+
+    def _load_counts(self):
+        return dict(Category.objects.values_list('id', 'available_count'))
+
+    def _counts(self):
+        return self.tier.get_or_compute('counts', self._load_counts)
+
+    def _by_id(self):
+        rows = self.tier.get_or_compute('all', self._load)
+        with self._lock:
+            if self._index[0] is not rows:
+                self._index = (rows, {row['id']: row for row in rows})
+            return self._index
+
+    def all(self):
+        """Lista de categorias com `available_count`."""
+        rows, _ = self._by_id()
+        counts = self._counts()
+        return [dict(row, available_count=counts.get(row['id'], 0)) for row in rows]
+
+    def get(self, pk, with_count=False):
+        """Categoria no formato do CategorySerializer (None se não existir)."""
+        _, by_id = self._by_id()
+        row = by_id.get(pk)
+        if row is None:
+            return None
+        data = dict(row)
+        if with_count:
+            data['available_count'] = self._counts().get(pk, 0)
+        return data
+
+    def invalidate(self):
+        self.tier.invalidate('all', 'counts')
+
+    def invalidate_counts(self):
+        self.tier.invalidate('counts')
+
+
+category_cache = CategoryCache(ttl=getattr(settings, 'CATEGORY_CACHE_TTL', 60))
+
+
+def recount_categories(category_ids=None):
+    """
+    Recalcula `available_count` a partir da tabela de produtos. Usado após
+    operações em massa que não disparam signals (queryset.update/delete).
+    """
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+    counts = categories.annotate(
+        n=Count('products', filter=Q(products__status=Product.Status.AVAILABLE))
+    ).values_list('pk', 'n', 'available_count')
+    for pk, n, current in counts:
+        if n != current:
+            Category.objects.filter(pk=pk).update(available_count=n)
+    category_cache.invalidate_counts()
@@ -0,0 +1,23 @@
+# api/cloud.py
+"""
+Acesso ao Cloudinary.
+
+O SDK (e o urllib3/certifi que ele puxa) só é importado e configurado no
+primeiro upload, e não no boot de cada worker.
+"""
+from functools import cache
+
+from django.conf import settings
+
+
+@cache
+def uploader():
+    import cloudinary
+    import cloudinary.uploader
+
+    cloudinary.config(**settings.CLOUDINARY)
+    return cloudinary.uploader
+
+
+def upload(file, **options):
+    return uploader().upload(file, **options)
@@ -0,0 +1,241 @@
+# api/export.py
+"""
+Exportação incremental das tabelas do marketplace para arquivos colunares.
+
+Cada execução grava um novo arquivo por tabela só com as linhas novas ou
+alteradas desde a última marca d'água (`updated_at`, `id`). Tabelas sem
+marca d'água são exportadas inteiras a cada execução (`<tabela>-snapshot-*`;
+gravado o novo, os anteriores são apagados): é o caso das notificações,
+que são apagadas e reescritas o tempo todo (retenção, digests,
+arquivamento) e cujas exclusões uma marca d'água não enxergaria.
+
+Exclusões nas tabelas incrementais chegam por tabelas próprias:
+`proposal_deleted` (ProposalTombstone: propostas apagadas pela API,
+canceladas em cascata ou arquivadas) e `product_archived` (produtos
+movidos pelo arquivamento). Produtos apagados pela API não deixam rastro
+e não são exportados. Os tombstones são purgados depois de
+PROPOSAL_TOMBSTONE_DAYS: o export precisa rodar com intervalo menor. A leitura é em blocos com
+`.iterator()` e cada bloco vira um row group, então a memória fica limitada
+ao tamanho do bloco.
+
+As marcas dependem de `updated_at` (auto_now): `.update()` em queryset não
+o atualiza, então quem altera essas tabelas assim precisa passar
+`updated_at` junto.
+
+Formatos: Parquet ou Arrow IPC quando o `pyarrow` está instalado; CSV
+sempre disponível. Textos livres (mensagens, descrições, comentários) não
+são exportados.
+"""
+import csv
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import ArchivedProduct, Notification, Product, Proposal, ProposalTombstone, UserRating
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - depende do ambiente
+    pa = None
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    name: str
+    model: type
+    # (coluna, tipo): int, float, str, bool, ts, json
+    columns: tuple
+    # coluna de data usada na marca d'água (None = snapshot completo a cada execução)
+    watermark: str = None
+
+
+TABLES = {
+    t.name: t for t in [
+        ExportTable('product', Product, (
+            ('id', 'int'), ('title', 'str'), ('category_id', 'int'), ('user_id', 'int'),
+            ('acceptable_exchanges', 'json'), ('status', 'str'),
+            ('created_at', 'ts'), ('updated_at', 'ts'),
+        ), watermark='updated_at'),
+        ExportTable('proposal', Proposal, (
+            ('id', 'int'), ('product_offered_id', 'int'), ('product_requested_id', 'int'),
+            ('from_user_id', 'int'), ('to_user_id', 'int'), ('status', 'str'),
+            ('created_at', 'ts'), ('updated_at', 'ts'),
+        ), watermark='updated_at'),
+        # avaliações são editadas (PATCH); só são apagadas junto com o usuário
+        ExportTable('userrating', UserRating, (
+            ('id', 'int'), ('from_user_id', 'int'), ('to_user_id', 'int'),
+            ('rating', 'int'), ('created_at', 'ts'), ('updated_at', 'ts'),
+        ), watermark='updated_at'),
+        ExportTable('notification', Notification, (
+            ('id', 'int'), ('user_id', 'int'), ('type', 'str'), ('read', 'bool'),
+            ('count', 'int'), ('related_id', 'int'), ('created_at', 'ts'),
+        )),
+        # exclusões das tabelas incrementais
+        ExportTable('proposal_deleted', ProposalTombstone, (
+            ('id', 'int'), ('proposal_id', 'int'), ('from_user_id', 'int'), ('to_user_id', 'int'),
+            ('deleted_at', 'ts'),
+        ), watermark='deleted_at'),
+        ExportTable('product_archived', ArchivedProduct, (
+            ('id', 'int'), ('category_id', 'int'), ('user_id', 'int'), ('status', 'str'),
+            ('created_at', 'ts'), ('updated_at', 'ts'), ('archived_at', 'ts'),
+        ), watermark='archived_at'),
+    ]
+}
+
+FORMATS = ('parquet', 'arrow', 'csv')
+
+
+def available_formats():
+    return FORMATS if pa is not None else ('csv',)
+
+
+class CsvWriter:
+    def __init__(self, path, table):
+        self.columns = table.columns
+        self.fh = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.fh)
+        self.writer.writerow([name for name, _ in self.columns])
+
+    def write(self, rows):
+        for row in rows:
+            self.writer.writerow([
+                json.dumps(v) if kind == 'json' else ('' if v is None else v.isoformat() if kind == 'ts' else v)
+                for (_, kind), v in zip(self.columns, row)
+            ])
+
+    def close(self):
+        self.fh.close()
+
+
+class ArrowWriter:
+    """Parquet (um row group por bloco) ou Arrow IPC (um record batch por bloco)."""
+
+    def __init__(self, path, table, fmt):
+        if pa is None:
+            raise RuntimeError('pyarrow não está instalado; use --format csv.')
+        types = {
+            'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(), 'json': pa.string(),
+            'bool': pa.bool_(), 'ts': pa.timestamp('us', tz='UTC'),
+        }
+        self.columns = table.columns
+        self.schema = pa.schema([(name, types[kind]) for name, kind in self.columns])
+        if fmt == 'parquet':
+            self.writer = pa.parquet.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            self.sink = pa.OSFile(str(path), 'wb')
+            self.writer = pa.ipc.new_file(self.sink, self.schema)
+
+    def write(self, rows):
+        arrays = []
+        for i, (_, kind) in enumerate(self.columns):
+            values = [row[i] for row in rows]
+            if kind == 'json':
+                values = [json.dumps(v) for v in values]
+            arrays.append(values)
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(arrays, self.schema)],
+            schema=self.schema,
+        )
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+        if hasattr(self, 'sink'):
+            self.sink.close()
+
+
+def make_writer(path, table, fmt):
+    if fmt == 'csv':
+        return CsvWriter(path, table)
+    return ArrowWriter(path, table, fmt)
+
+
+class ExportState:
+    """Marcas d'água por tabela, num JSON dentro do diretório de saída."""
+
+    def __init__(self, directory):
+        self.path = Path(directory) / '_state.json'
+        self.data = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def get(self, table):
+        return self.data.get(table, {})
+
+    def set(self, table, mark):
+        self.data[table] = mark
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.data, indent=2))
+        os.replace(tmp, self.path)
+
+
+def pending_rows(table, mark):
+    """Queryset ordenado das linhas depois da marca d'água."""
+    qs = table.model.objects.all()
+    if table.watermark:
+        since = parse_datetime(mark['ts']) if mark.get('ts') else None
+        if since is not None:
+            qs = qs.filter(
+                Q(**{f'{table.watermark}__gt': since})
+                | Q(**{table.watermark: since, 'id__gt': mark.get('id', 0)})
+            )
+        return qs.order_by(table.watermark, 'id')
+    return qs.order_by('id')
+
+
+def export_table(table, directory, mark, fmt='parquet', chunk_size=5000):
+    """
+    Exporta as linhas pendentes de uma tabela a partir da marca `mark`.
+    Retorna (linhas, caminho, nova marca); quem chama grava a marca no
+    ExportState, só depois que o arquivo foi fechado e renomeado.
+    """
+    columns = [name for name, _ in table.columns]
+    # a coluna da marca d'água precisa vir no select mesmo se não exportada
+    select = columns + ([table.watermark] if table.watermark and table.watermark not in columns else [])
+    wm_index = select.index(table.watermark) if table.watermark else None
+    id_index = select.index('id')
+
+    out_dir = Path(directory) / table.name
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(dt_timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    kind = '' if table.watermark else '-snapshot'
+    final_path = out_dir / f'{table.name}{kind}-{stamp}.{fmt}'
+    tmp_path = final_path.with_name(final_path.name + '.part')
+
+    writer, total, last = None, 0, None
+    chunk = []
+    try:
+        for row in pending_rows(table, mark).values_list(*select).iterator(chunk_size=chunk_size):
+            chunk.append(row[:len(columns)])
+            last = row
+            if len(chunk) >= chunk_size:
+                writer = writer or make_writer(tmp_path, table, fmt)
+                writer.write(chunk)
+                total += len(chunk)
+                chunk = []
+        # snapshot vazio também é gravado: a tabela pode ter sido esvaziada
+        if chunk or not table.watermark:
+            writer = writer or make_writer(tmp_path, table, fmt)
+            writer.write(chunk)
+            total += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if wm_index is None:
+        os.replace(tmp_path, final_path)
+        # os snapshots anteriores ficaram obsoletos (o nome ordena pela data)
+        for old in out_dir.glob(f'{table.name}-snapshot-*.{fmt}'):
+            if old.name < final_path.name:
+                old.unlink(missing_ok=True)
+        return total, final_path, {'snapshot': stamp}
+    if not total:
+        return 0, None, mark
+    os.replace(tmp_path, final_path)
+    new_mark = {'id': last[id_index], 'ts': last[wm_index].astimezone(dt_timezone.utc).isoformat()}
+    return total, final_path, new_mark
@@ -0,0 +1,327 @@
+# api/feed.py
+"""
+Ranking do feed da home.
+
+Os candidatos de cada usuário ficam pré-calculados em `FeedEntry`; servir
+uma página é só uma leitura no índice (user, -score). O feed só é montado
+na leitura no primeiro acesso do usuário (ainda sem perfil).
+
+score = recência + afinidade de categoria + reputação do dono + localidade
+
+A recência entra como termo linear na data de criação (RECENCY_WEIGHT
+pontos por dia), então a ordem entre produtos não muda com o passar do
+tempo e os scores gravados não precisam ser recalculados periodicamente.
+A afinidade com uma categoria é n / (n + AFFINITY_HALF), com n as
+interações ponderadas do usuário nela: mudar uma categoria não mexe no
+score das entradas das outras.
+
+Manutenção incremental: as requisições só gravam `FeedEvent` (produto
+novo ou que mudou de categoria/status, delta de afinidade) e o
+`refresh_feeds` aplica os eventos em lote, fora da requisição:
+- produto disponível: entra no feed de quem tem afinidade com a categoria
+  ou é da mesma cidade/estado do dono, e é reavaliado em quem já o tinha;
+  indisponível ou apagado, sai de todos os feeds;
+- afinidade: desloca o score das entradas da categoria no feed do usuário
+  e traz os produtos mais recentes dela.
+Cada feed que recebeu entradas é cortado em MAX_CANDIDATES. Perfis
+marcados `stale` (mudança de cidade/estado) são reconstruídos pelo comando.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import FeedEntry, FeedEvent, FeedProfile, Product, Proposal
+
+
+MAX_CANDIDATES = getattr(settings, 'FEED_MAX_CANDIDATES', 500)
+RECENCY_WEIGHT = getattr(settings, 'FEED_RECENCY_WEIGHT', 1.0)
+AFFINITY_WEIGHT = getattr(settings, 'FEED_AFFINITY_WEIGHT', 3.0)
+REPUTATION_WEIGHT = getattr(settings, 'FEED_REPUTATION_WEIGHT', 2.0)
+CITY_WEIGHT = getattr(settings, 'FEED_CITY_WEIGHT', 1.5)
+STATE_WEIGHT = getattr(settings, 'FEED_STATE_WEIGHT', 0.5)
+# reputação em que o termo chega à metade do peso
+REPUTATION_HALF = getattr(settings, 'FEED_REPUTATION_HALF', 50.0)
+# interações numa categoria em que a afinidade chega à metade
+AFFINITY_HALF = getattr(settings, 'FEED_AFFINITY_HALF', 5.0)
+# produtos recentes trazidos quando a afinidade com uma categoria cresce
+DELTA_CANDIDATES = getattr(settings, 'FEED_DELTA_CANDIDATES', 50)
+EVENT_BATCH = getattr(settings, 'FEED_EVENT_BATCH', 500)
+
+
+def _norm(value):
+    return (value or '').strip().lower()
+
+
+def affinity(n):
+    return n / (n + AFFINITY_HALF) if n > 0 else 0.0
+
+
+def build_profile(user):
+    """
+    Conta as interações por categoria (produtos do usuário e propostas que
+    ele enviou/recebeu) e grava no FeedProfile.
+    """
+    counts = {}
+
+    def add(rows, key, weight):
+        for row in rows:
+            if row[key] is not None:
+                counts[row[key]] = counts.get(row[key], 0) + row['n'] * weight
+
+    add(Product.objects.filter(user=user).values('category_id').annotate(n=Count('id')), 'category_id', 1)
+    add(Proposal.objects.filter(from_user=user)
+        .values('product_requested__category_id').annotate(n=Count('id')),
+        'product_requested__category_id', 2)
+    add(Proposal.objects.filter(to_user=user)
+        .values('product_offered__category_id').annotate(n=Count('id')),
+        'product_offered__category_id', 1)
+
+    profile, _ = FeedProfile.objects.update_or_create(
+        user=user,
+        defaults={
+            'affinities': {str(cat): n for cat, n in counts.items()},
+            'city': _norm(user.city),
+            'state': _norm(user.state),
+            'stale': False,
+        },
+    )
+    return profile
+
+
+def score_product(product, profile):
+    """`product` precisa ter `user` carregado (select_related)."""
+    owner = product.user
+    score = RECENCY_WEIGHT * product.created_at.timestamp() / 86400
+    score += AFFINITY_WEIGHT * affinity(profile.affinities.get(str(product.category_id), 0))
+    reputation = max(owner.reputation_score, 0)
+    score += REPUTATION_WEIGHT * reputation / (reputation + REPUTATION_HALF)
+    if profile.city and _norm(owner.city) == profile.city:
+        score += CITY_WEIGHT
+    elif profile.state and _norm(owner.state) == profile.state:
+        score += STATE_WEIGHT
+    return score
+
+
+def _available():
+    return (
+        Product.objects
+        .filter(status=Product.Status.AVAILABLE)
+        .select_related('user')
+        .only('id', 'category_id', 'created_at', 'user_id',
+              'user__reputation_score', 'user__city', 'user__state')
+        .order_by('-created_at')
+    )
+
+
+def _candidates(user, profile):
+    """Mais recentes + mais recentes das categorias de afinidade + da mesma cidade."""
+    base = _available().exclude(user=user)
+    found = {p.id: p for p in base[:MAX_CANDIDATES]}
+    if profile.affinities:
+        top_categories = sorted(profile.affinities, key=profile.affinities.get, reverse=True)[:5]
+        found.update((p.id, p) for p in base.filter(category_id__in=top_categories)[:MAX_CANDIDATES])
+    if profile.city:
+        found.update((p.id, p) for p in base.filter(user__city__iexact=profile.city)[:MAX_CANDIDATES])
+    return found.values()
+
+
+def rebuild_user_feed(user):
+    """Recalcula perfil e candidatos do usuário, mantendo só os MAX_CANDIDATES melhores."""
+    profile = build_profile(user)
+    scored = sorted(
+        ((score_product(p, profile), p.id) for p in _candidates(user, profile)),
+        reverse=True,
+    )[:MAX_CANDIDATES]
+    with transaction.atomic():
+        FeedEntry.objects.filter(user=user).delete()
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user=user, product_id=pid, score=score) for score, pid in scored],
+            batch_size=500,
+        )
+    return profile
+
+
+def get_user_feed(user):
+    """Queryset ordenado do feed; monta o feed só no primeiro acesso."""
+    if not FeedProfile.objects.filter(user=user).exists():
+        rebuild_user_feed(user)
+    # produto que saiu de disponível ainda não processado pelo refresh_feeds
+    return (
+        FeedEntry.objects
+        .filter(user=user, product__status=Product.Status.AVAILABLE)
+        .order_by('-score', '-product_id')
+    )
+
+
+# manutenção incremental
+
+def queue(products=(), affinities=()):
+    """
+    Registra mudanças para o próximo `refresh_feeds`: ids de produtos e
+    deltas de afinidade (user_id, category_id, peso). Um INSERT só.
+    """
+    events = [FeedEvent(product_id=pk) for pk in products]
+    events += [
+        FeedEvent(user_id=user_id, category_id=category_id, weight=weight)
+        for user_id, category_id, weight in affinities
+        if user_id is not None and category_id is not None and weight
+    ]
+    if events:
+        FeedEvent.objects.bulk_create(events, batch_size=500)
+
+
+def process_events(batch_size=EVENT_BATCH):
+    """Aplica os FeedEvent pendentes, um lote por transação. Retorna quantos aplicou."""
+    applied = 0
+    while True:
+        events = list(FeedEvent.objects.order_by('id')[:batch_size])
+        if not events:
+            return applied
+        products = {event.product_id for event in events if event.product_id is not None}
+        deltas = defaultdict(float)
+        for event in events:
+            if event.user_id is not None:
+                deltas[event.user_id, event.category_id] += event.weight
+        with transaction.atomic():
+            touched = apply_affinities(deltas)
+            touched |= fan_out_products(products)
+            trim_feeds(user_ids=touched)
+            FeedEvent.objects.filter(id__lte=events[-1].id).delete()
+        applied += len(events)
+
+
+def apply_affinities(deltas):
+    """
+    Aplica {(user_id, category_id): peso} aos perfis existentes (sem perfil
+    o feed sai completo no primeiro acesso). Retorna os usuários afetados.
+    """
+    by_user = defaultdict(dict)
+    for (user_id, category_id), weight in deltas.items():
+        if weight:
+            by_user[user_id][str(category_id)] = weight
+    if not by_user:
+        return set()
+
+    profiles = list(FeedProfile.objects.filter(user_id__in=by_user).only('user_id', 'affinities', 'city', 'state'))
+    grown = defaultdict(list)
+    for profile in profiles:
+        for category, weight in by_user[profile.user_id].items():
+            old = profile.affinities.get(category, 0)
+            new = max(old + weight, 0)
+            if new:
+                profile.affinities[category] = new
+            else:
+                profile.affinities.pop(category, None)
+            shift = AFFINITY_WEIGHT * (affinity(new) - affinity(old))
+            if shift:
+                FeedEntry.objects.filter(
+                    user_id=profile.user_id, product__category_id=category,
+                ).update(score=F('score') + shift)
+            if new > old:
+                grown[int(category)].append(profile)
+    FeedProfile.objects.bulk_update(profiles, ['affinities'])
+
+    entries = []
+    for category_id, interested in grown.items():
+        recent = list(_available().filter(category_id=category_id)[:DELTA_CANDIDATES])
+        for profile in interested:
+            entries.extend(
+                FeedEntry(user_id=profile.user_id, product_id=p.id, score=score_product(p, profile))
+                for p in recent if p.user_id != profile.user_id
+            )
+    _upsert(entries)
+    return {profile.user_id for profile in profiles}
+
+
+def fan_out_products(product_ids, batch_size=1000):
+    """
+    Coloca os produtos nos feeds de quem se interessa por eles: afinidade
+    com a categoria, mesma cidade/estado do dono ou já os tinha no feed
+    (reavaliados). Os que não estão mais disponíveis saem de todos os
+    feeds. Retorna os usuários que receberam entradas.
+    """
+    if not product_ids:
+        return set()
+    products = {p.id: p for p in _available().filter(pk__in=product_ids)}
+    gone = set(product_ids) - set(products)
+    if gone:
+        FeedEntry.objects.filter(product_id__in=gone).delete()
+    if not products:
+        return set()
+
+    by_category, by_city, by_state = defaultdict(list), defaultdict(list), defaultdict(list)
+    for product in products.values():
+        by_category[str(product.category_id)].append(product)
+        if _norm(product.user.city):
+            by_city[_norm(product.user.city)].append(product)
+        if _norm(product.user.state):
+            by_state[_norm(product.user.state)].append(product)
+    holding = FeedEntry.objects.filter(product_id__in=products)
+    held = defaultdict(list)
+    for user_id, product_id in holding.values_list('user_id', 'product_id'):
+        held[user_id].append(products[product_id])
+
+    relevant = (
+        Q(affinities__has_any_keys=list(by_category))
+        | Q(city__in=list(by_city))
+        | Q(state__in=list(by_state))
+        | Q(user_id__in=holding.values('user_id'))
+    )
+    profiles = FeedProfile.objects.filter(relevant).only('user_id', 'affinities', 'city', 'state')
+    touched, batch = set(), []
+    for profile in profiles.iterator(chunk_size=batch_size):
+        targets = {p.id: p for category in profile.affinities for p in by_category.get(category, ())}
+        targets.update((p.id, p) for p in by_city.get(profile.city, ()) if profile.city)
+        targets.update((p.id, p) for p in by_state.get(profile.state, ()) if profile.state)
+        targets.update((p.id, p) for p in held.get(profile.user_id, ()))
+        for product in targets.values():
+            if product.user_id != profile.user_id:
+                batch.append(FeedEntry(user_id=profile.user_id, product_id=product.id,
+                                       score=score_product(product, profile)))
+                touched.add(profile.user_id)
+        if len(batch) >= batch_size:
+            _upsert(batch)
+            batch = []
+    _upsert(batch)
+    return touched
+
+
+def _upsert(entries):
+    if not entries:
+        return
+    FeedEntry.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['user', 'product'],
+        update_fields=['score'],
+        batch_size=1000,
+    )
+
+
+def mark_stale(*user_ids):
+    FeedProfile.objects.filter(user_id__in=user_ids).update(stale=True)
+
+
+def trim_feeds(max_candidates=MAX_CANDIDATES, user_ids=None):
+    """Remove as entradas além de `max_candidates` de cada usuário (ou só dos informados)."""
+    if user_ids is None:
+        scopes = [FeedEntry.objects.all()]
+    else:
+        user_ids = list(user_ids)
+        scopes = [FeedEntry.objects.filter(user_id__in=user_ids[i:i + 500]) for i in range(0, len(user_ids), 500)]
+    removed = 0
+    over = [
+        row
+        for entries in scopes
+        for row in entries.values('user_id').annotate(n=Count('id')).filter(n__gt=max_candidates)
+    ]
+    for row in over:
+        cutoff = (
+            FeedEntry.objects.filter(user_id=row['user_id'])
+            .order_by('-score', '-product_id')
+            .values_list('score', flat=True)[max_candidates - 1]
+        )
+        removed += FeedEntry.objects.filter(user_id=row['user_id'], score__lt=cutoff).delete()[0]
+    return removed
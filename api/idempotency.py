@@ -0,0 +1,203 @@
+# api/idempotency.py
+"""
+Suporte ao header `Idempotency-Key` em POST/PATCH.
+
+A primeira requisição com uma chave grava um registro "em andamento"
+(a constraint única em (user, key) serializa duplicatas concorrentes entre
+processos; dentro do processo um lock por chave evita a disputa no banco),
+executa a view e guarda status + corpo da resposta. Repetições com a
+mesma chave e o mesmo payload recebem a resposta guardada, sem passar por
+serializers, uploads ou notificações; com outro payload (arquivos entram
+pelo conteúdo), 422. Os registros expiram após IDEMPOTENCY_TTL segundos.
+
+O registro em andamento tem uma concessão (`locked_at` +
+IDEMPOTENCY_LEASE_SECONDS): se o processo morre no meio da requisição,
+vencida a concessão a próxima repetição assume a chave e executa de novo,
+em vez de receber 409 até o registro expirar. Falhas (exceção ou 5xx)
+liberam a chave na hora.
+"""
+import hashlib
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+TTL = getattr(settings, 'IDEMPOTENCY_TTL', 24 * 3600)
+# quanto uma duplicata espera a original terminar antes de desistir com 409
+WAIT_SECONDS = getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10)
+# depois disso um registro ainda em andamento é dado como abandonado
+# (processo morto); maior que o timeout das requisições
+LEASE_SECONDS = getattr(settings, 'IDEMPOTENCY_LEASE_SECONDS', 120)
+METHODS = ('POST', 'PATCH')
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+class _KeyLock:
+    """Lock por chave, removido do dicionário quando ninguém mais usa."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        with _locks_guard:
+            entry = _locks.setdefault(self.name, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+
+    def __exit__(self, *exc):
+        with _locks_guard:
+            entry = _locks[self.name]
+            entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[self.name]
+
+
+def fingerprint(request):
+    digest = hashlib.sha256(f'{request.method} {request.path}'.encode())
+    for name, value in sorted(request.data.items()) if hasattr(request.data, 'items') else []:
+        if hasattr(value, 'chunks'):
+            # arquivos pelo conteúdo: outra imagem com mesmo nome e tamanho é outro payload
+            digest.update(f'\0{name}=file:'.encode())
+            for chunk in value.chunks():
+                digest.update(chunk)
+            value.seek(0)
+            continue
+        digest.update(f'\0{name}={value!r}'.encode())
+    return digest.hexdigest()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(user, key, print_):
+    """Cria o registro em andamento ou devolve o existente (e False)."""
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=print_, locked_at=now,
+                    expires_at=now + timedelta(seconds=TTL),
+                ), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if record is None:
+                continue
+            if record.expires_at <= now:
+                record.delete()
+                continue
+            return record, False
+    raise IntegrityError('Não foi possível reservar a chave de idempotência.')
+
+
+def _lease_expired(record):
+    return record.locked_at <= timezone.now() - timedelta(seconds=LEASE_SECONDS)
+
+
+def _reclaim(record):
+    """Assume um registro abandonado; só um dos concorrentes consegue."""
+    now = timezone.now()
+    taken = IdempotencyKey.objects.filter(
+        pk=record.pk, response_status__isnull=True, locked_at=record.locked_at,
+    ).update(locked_at=now)
+    record.locked_at = now
+    return bool(taken)
+
+
+def run_idempotent(request, handler):
+    key = request.headers.get(HEADER)
+    if not key or request.method not in METHODS or not request.user.is_authenticated:
+        return handler()
+    if len(key) > 255:
+        return Response({'detail': f'{HEADER} muito longo.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    print_ = fingerprint(request)
+    # duplicatas no mesmo processo esperam aqui; entre processos, a constraint única
+    with _KeyLock(f'{request.user.pk}:{key}'):
+        for _ in range(3):
+            record, created = _claim(request.user, key, print_)
+            if created:
+                return _execute(record, handler)
+            if record.fingerprint != print_:
+                return Response(
+                    {'detail': f'{HEADER} já usado com outro payload.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            record = _wait(record)
+            if record is None:
+                # a original falhou e liberou a chave
+                continue
+            if record.response_status is not None:
+                return _replay(record)
+            if _lease_expired(record) and _reclaim(record):
+                return _execute(record, handler)
+            break
+    return Response(
+        {'detail': 'Requisição original ainda em processamento.'},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def _execute(record, handler):
+    try:
+        response = handler()
+    except Exception:
+        # falhou: libera a chave para o cliente tentar de novo
+        record.delete()
+        raise
+    if response.status_code >= 500:
+        record.delete()
+        return response
+    record.response_status = response.status_code
+    record.response_body = response.data
+    record.save(update_fields=['response_status', 'response_body'])
+    return response
+
+
+def _wait(record):
+    """
+    Espera a original (em outro processo) terminar, ser liberada ou ter a
+    concessão vencida, até WAIT_SECONDS. Devolve o registro atual (None se
+    foi apagado).
+    """
+    deadline = time.monotonic() + WAIT_SECONDS
+    while record.response_status is None and not _lease_expired(record) and time.monotonic() < deadline:
+        time.sleep(0.1)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None:
+            return None
+    return record
+
+
+class IdempotentMixin:
+    """Aplica `Idempotency-Key` em create (POST) e partial_update (PATCH)."""
+
+    def create(self, request, *args, **kwargs):
+        return run_idempotent(request, lambda: super(IdempotentMixin, self).create(request, *args, **kwargs))
+
+    def partial_update(self, request, *args, **kwargs):
+        return run_idempotent(request, lambda: super(IdempotentMixin, self).partial_update(request, *args, **kwargs))
+
+
+def purge_expired(batch_size=5000):
+    removed = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,99 @@
+# api/images.py
+"""
+Pré-processamento das imagens enviadas antes do upload para o Cloudinary.
+
+Normaliza a orientação (EXIF), remove metadados, reduz para uma dimensão
+máxima, recodifica em WebP/JPEG e calcula o sha256 dos bytes já
+normalizados, usado para não reenviar a mesma imagem. Só arquivos
+idênticos depois da normalização contam como repetidos: fotos apenas
+parecidas são imagens diferentes.
+"""
+import hashlib
+from dataclasses import dataclass
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+from rest_framework import serializers
+
+
+MAX_UPLOAD_SIZE = getattr(settings, 'IMAGE_MAX_UPLOAD_SIZE', 15 * 1024 * 1024)
+MAX_PIXELS = getattr(settings, 'IMAGE_MAX_PIXELS', 40_000_000)
+# formatos sem `draft` são decodificados em resolução cheia: limite menor
+MAX_PIXELS_FULL_DECODE = getattr(settings, 'IMAGE_MAX_PIXELS_FULL_DECODE', 16_000_000)
+DRAFT_FORMATS = {'JPEG', 'MPO'}
+MAX_DIMENSION = getattr(settings, 'IMAGE_MAX_DIMENSION', 1600)
+QUALITY = getattr(settings, 'IMAGE_QUALITY', 82)
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF', 'MPO'}
+
+WEBP_SUPPORTED = features.check('webp')
+
+
+@dataclass
+class ProcessedImage:
+    file: ContentFile
+    content_hash: str
+    width: int
+    height: int
+
+
+def preprocess_image(upload, max_dimension=MAX_DIMENSION, quality=QUALITY):
+    """
+    Valida e normaliza o arquivo enviado.
+
+    A decodificação é limitada: o cabeçalho é lido e o total de pixels
+    conferido antes de carregar a imagem. JPEG usa o `draft`, que decodifica
+    já em escala reduzida (até MAX_PIXELS); os demais formatos, decodificados
+    inteiros, têm o limite menor MAX_PIXELS_FULL_DECODE. A orientação (EXIF)
+    é aplicada depois da redução, sobre a imagem pequena.
+    Levanta `serializers.ValidationError` para arquivos inválidos.
+    """
+    if upload.size and upload.size > MAX_UPLOAD_SIZE:
+        raise serializers.ValidationError(
+            f'Imagem muito grande (máximo {MAX_UPLOAD_SIZE // (1024 * 1024)} MB).'
+        )
+
+    upload.seek(0)
+    try:
+        img = Image.open(upload)
+    except (Image.DecompressionBombError, OSError):
+        raise serializers.ValidationError('Arquivo de imagem inválido.')
+
+    if img.format not in ALLOWED_FORMATS:
+        raise serializers.ValidationError(f'Formato de imagem não suportado: {img.format}.')
+    limit = MAX_PIXELS if img.format in DRAFT_FORMATS else MAX_PIXELS_FULL_DECODE
+    if img.width * img.height > limit:
+        raise serializers.ValidationError('Imagem com resolução acima do permitido.')
+
+    # JPEG: decodifica direto numa escala próxima do tamanho final
+    img.draft('RGB', (max_dimension, max_dimension))
+    try:
+        # a caixa é quadrada: reduzir antes de girar dá o mesmo limite
+        img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        ImageOps.exif_transpose(img, in_place=True)
+    except (Image.DecompressionBombError, OSError):
+        raise serializers.ValidationError('Arquivo de imagem inválido.')
+
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    img = img.convert('RGBA' if has_alpha else 'RGB')
+
+    # salva sem exif/icc: os metadados ficam para trás
+    out = BytesIO()
+    if WEBP_SUPPORTED:
+        img.save(out, format='WEBP', quality=quality, method=4)
+        ext = 'webp'
+    else:
+        if has_alpha:
+            img = img.convert('RGB')
+        img.save(out, format='JPEG', quality=quality, optimize=True, progressive=True)
+        ext = 'jpg'
+
+    content = out.getvalue()
+    base_name = (getattr(upload, 'name', None) or 'image').rsplit('.', 1)[0]
+    return ProcessedImage(
+        file=ContentFile(content, name=f'{base_name}.{ext}'),
+        content_hash=hashlib.sha256(content).hexdigest(),
+        width=img.width,
+        height=img.height,
+    )
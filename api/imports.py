@@ -0,0 +1,327 @@
+# api/imports.py
+"""
+Importação em massa de produtos a partir de CSV ou JSON lines.
+
+A requisição só copia o arquivo para IMPORT_SPOOL_DIR e cria o
+`ProductImport` na fila (QUEUED); o cliente acompanha pelo job. Quem
+processa a fila é o comando `process_imports` e, com
+IMPORT_RUN_IN_PROCESS, também um pool de threads no próprio worker web,
+disparado no commit. Cada job é pego por um só (update condicional
+QUEUED -> RUNNING). O arquivo é lido linha a linha (nunca inteiro na
+memória) e processado em lotes: cada lote é validado pelo serializer, com
+as categorias resolvidas pelo cache em memória, e gravado com um único
+`bulk_create`. O progresso e o `heartbeat_at` são salvos no job a cada
+lote; um job RUNNING sem sinal há IMPORT_STALE_SECONDS (worker reiniciado
+no meio) é marcado como FAILED pelo `process_imports`.
+
+`bulk_create` não dispara signals, então o importador faz a manutenção
+que eles fariam: os produtos de cada lote entram na fila dos feeds e os
+contadores do dono (UserStats) são recalculados, na transação do lote; no
+fim, as contagens das categorias são recalculadas.
+
+As imagens informadas por URL são enviadas ao Cloudinary (que busca a URL
+remota) em outro pool, depois do commit de cada lote; o job só termina
+depois delas. Os pools só são criados no primeiro uso.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from functools import cache
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import cloud, feed, inbox, stats
+from .cache import product_cache
+from .categories import category_cache, recount_categories
+from .models import Product, ProductImage, ProductImport
+from .serializers import ProductImportRowSerializer
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'IMPORT_BATCH_SIZE', 500)
+MAX_ERRORS = getattr(settings, 'IMPORT_MAX_ERRORS', 1000)
+
+IMAGE_WORKERS = getattr(settings, 'IMPORT_IMAGE_WORKERS', 4)
+IMPORT_WORKERS = getattr(settings, 'IMPORT_WORKERS', 2)
+SPOOL_DIR = Path(getattr(settings, 'IMPORT_SPOOL_DIR', Path(settings.BASE_DIR) / '.imports'))
+RUN_IN_PROCESS = getattr(settings, 'IMPORT_RUN_IN_PROCESS', True)
+STALE_SECONDS = getattr(settings, 'IMPORT_STALE_SECONDS', 600)
+
+INTERRUPTED = 'Importação interrompida (o processo parou no meio); envie o arquivo de novo.'
+
+
+@cache
+def _image_pool():
+    return ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='import-images')
+
+
+@cache
+def _import_pool():
+    return ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix='import')
+
+
+def enqueue_import(user, upload, fmt):
+    """
+    Cria o job na fila com uma cópia do arquivo enviado (o Django o
+    descarta no fim da requisição).
+    """
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    path = SPOOL_DIR / f'{uuid.uuid4().hex}.{fmt}'
+    with open(path, 'wb') as fh:
+        for chunk in upload.chunks():
+            fh.write(chunk)
+    job = ProductImport.objects.create(user=user, format=fmt, source=str(path))
+    if RUN_IN_PROCESS:
+        transaction.on_commit(lambda: _import_pool().submit(_run_in_pool, job.pk))
+    return job
+
+
+def _run_in_pool(job_id):
+    """Roda no pool, com conexão própria."""
+    close_old_connections()
+    try:
+        run_job(job_id)
+    except Exception:
+        # o job já ficou como FAILED
+        logger.exception('Falha na importação %s', job_id)
+    finally:
+        connection.close()
+
+
+def claim(job_id):
+    """QUEUED -> RUNNING; False se outro processo já pegou o job."""
+    return bool(ProductImport.objects.filter(pk=job_id, status=ProductImport.Status.QUEUED).update(
+        status=ProductImport.Status.RUNNING, heartbeat_at=timezone.now(),
+    ))
+
+
+def run_job(job_id, serializer_class=ProductImportRowSerializer):
+    """Processa um job da fila; None se outro processo já o pegou."""
+    if not claim(job_id):
+        return None
+    job = ProductImport.objects.select_related('user').get(pk=job_id)
+    try:
+        try:
+            fileobj = open(job.source, 'rb')
+        except OSError:
+            job.status = ProductImport.Status.FAILED
+            job.finished_at = timezone.now()
+            job.error_count += 1
+            job.errors.append({'row': None, 'errors': {'non_field_errors': ['Arquivo da importação não encontrado.']}})
+            job.save()
+            return job
+        with fileobj:
+            return ProductImporter(job, serializer_class, {}).run(fileobj, job.format)
+    finally:
+        _discard(job.source)
+
+
+def _discard(path):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def fail_stale(max_age=STALE_SECONDS):
+    """
+    Marca como FAILED os jobs RUNNING sem sinal há `max_age` segundos (o
+    worker que os processava morreu). Retorna quantos.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=max_age)
+    stale = ProductImport.objects.filter(status=ProductImport.Status.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at=None, created_at__lt=cutoff)
+    )
+    failed = 0
+    for job in stale:
+        error = {'row': None, 'errors': {'non_field_errors': [INTERRUPTED]}}
+        # condicional: um job que voltou a dar sinal nesse meio tempo fica
+        if ProductImport.objects.filter(pk=job.pk, status=job.status, heartbeat_at=job.heartbeat_at).update(
+            status=ProductImport.Status.FAILED, finished_at=now,
+            error_count=F('error_count') + 1, errors=job.errors + [error],
+        ):
+            failed += 1
+            _discard(job.source)
+            # os lotes já gravados contam; os contadores do dono já saíram no lote
+            stats.reconcile([job.user_id])
+    if failed:
+        recount_categories()
+    return failed
+
+
+def _split_list(value):
+    """CSV: aceita lista JSON ('["a", "b"]') ou itens separados por '|'."""
+    if value is None or isinstance(value, list):
+        return value or []
+    value = value.strip()
+    if not value:
+        return []
+    if value.startswith('['):
+        return json.loads(value)
+    return [item.strip() for item in value.split('|') if item.strip()]
+
+
+def read_rows(fileobj, fmt):
+    """Gera (número da linha, dict) sem carregar o arquivo todo."""
+    # newline='': só \n/\r separam linhas (U+2028 dentro de um texto JSON não)
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        yield from _parse_rows(text, fmt)
+    finally:
+        # o arquivo continua sendo de quem chamou
+        text.detach()
+
+
+def _parse_rows(text, fmt):
+    if fmt == 'csv':
+        for n, row in enumerate(csv.DictReader(text), start=2):
+            try:
+                row['acceptable_exchanges'] = _split_list(row.get('acceptable_exchanges'))
+                row['image_urls'] = _split_list(row.get('image_urls'))
+            except ValueError:
+                yield n, ValueError('acceptable_exchanges/image_urls inválido.')
+                continue
+            yield n, {k: v for k, v in row.items() if k is not None and v not in (None, '')}
+    else:
+        for n, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield n, ValueError('JSON inválido.')
+                continue
+            if not isinstance(row, dict):
+                yield n, ValueError('Cada linha deve ser um objeto JSON.')
+                continue
+            yield n, row
+
+
+def resolve_category(value):
+    """Categoria por id ou por nome (sem diferenciar maiúsculas), pelo cache."""
+    if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+        return int(value) if category_cache.get(int(value)) else None
+    if isinstance(value, str):
+        wanted = value.strip().lower()
+        for category in category_cache.all():
+            if category['name'].lower() == wanted:
+                return category['id']
+    return None
+
+
+class ProductImporter:
+    def __init__(self, job, serializer_class, context, batch_size=BATCH_SIZE):
+        self.job = job
+        self.serializer_class = serializer_class
+        self.context = context
+        self.batch_size = batch_size
+        self.category_ids = set()
+        self.image_jobs = []
+
+    def run(self, fileobj, fmt):
+        batch = []
+        try:
+            for n, row in read_rows(fileobj, fmt):
+                self.job.total_rows += 1
+                if isinstance(row, Exception):
+                    self._error(n, {'non_field_errors': [str(row)]})
+                    continue
+                batch.append((n, row))
+                if len(batch) >= self.batch_size:
+                    self._flush(batch)
+                    batch = []
+            if batch:
+                self._flush(batch)
+            # o job só termina com as imagens enviadas
+            wait(self.image_jobs)
+            self.job.status = ProductImport.Status.DONE
+        except Exception:
+            self.job.status = ProductImport.Status.FAILED
+            raise
+        finally:
+            self.job.finished_at = timezone.now()
+            self.job.save()
+            if self.category_ids:
+                # bulk_create não dispara signals: o que eles manteriam é recalculado aqui
+                recount_categories(self.category_ids)
+        return self.job
+
+    def _error(self, n, errors):
+        self.job.error_count += 1
+        if len(self.job.errors) < MAX_ERRORS:
+            self.job.errors.append({'row': n, 'errors': errors})
+
+    def _flush(self, batch):
+        valid = []
+        for n, row in batch:
+            if 'category' in row:
+                row['category'] = resolve_category(row['category']) or row['category']
+            serializer = self.serializer_class(data=row, context=self.context)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+            else:
+                self._error(n, serializer.errors)
+
+        if valid:
+            with transaction.atomic():
+                products = Product.objects.bulk_create([
+                    Product(user=self.job.user, **{k: v for k, v in data.items() if k != 'image_urls'})
+                    for data in valid
+                ])
+                pending = [
+                    (product.pk, data.get('image_urls') or [])
+                    for product, data in zip(products, valid) if data.get('image_urls')
+                ]
+                if pending:
+                    transaction.on_commit(lambda: self.image_jobs.extend(queue_images(pending)))
+                # feeds (fan-out e afinidade do dono) pelo refresh_feeds
+                categories = Counter(product.category_id for product in products)
+                feed.queue(
+                    products=[product.pk for product in products],
+                    affinities=[(self.job.user_id, category, n) for category, n in categories.items()],
+                )
+                # contadores do dono, na transação do lote
+                stats.reconcile([self.job.user_id])
+            self.job.created_count += len(products)
+            self.category_ids.update(p.category_id for p in products)
+        # progresso visível para quem consulta o job durante a importação
+        self.job.heartbeat_at = timezone.now()
+        self.job.save(update_fields=['total_rows', 'created_count', 'error_count', 'errors', 'heartbeat_at'])
+
+
+def queue_images(pending):
+    return [_image_pool().submit(ingest_images, product_id, urls) for product_id, urls in pending]
+
+
+def ingest_images(product_id, urls):
+    """Roda no pool: o Cloudinary busca cada URL remota."""
+    close_old_connections()
+    try:
+        images = []
+        for url in urls:
+            try:
+                result = cloud.upload(url, folder=f'products/{product_id}/', overwrite=True)
+            except Exception:
+                logger.exception('Falha ao importar imagem %s do produto %s', url, product_id)
+                continue
+            # a primeira que subir vira a principal
+            images.append(ProductImage(product_id=product_id, url=result['secure_url'], is_main=not images))
+        ProductImage.objects.bulk_create(images)
+        # bulk_create não dispara signals
+        product_cache.invalidate(product_id)
+        inbox.bump_for_product(product_id)
+    finally:
+        # conexão própria da thread do pool
+        connection.close()
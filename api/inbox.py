@@ -0,0 +1,93 @@
+# api/inbox.py
+"""
+Caixa de propostas: versão por usuário (ETag) e sync incremental.
+
+`User.proposals_version` sobe a cada proposta criada, alterada ou apagada
+e quando muda algo que aparece aninhado nelas: produto ou imagens de um
+produto envolvido, perfil, média de avaliações ou reputação de uma das
+partes. Como o usuário já vem carregado
+pela autenticação, o ETag sai sem nenhuma query e uma caixa sem mudanças
+responde 304 sem tocar nas tabelas de propostas.
+
+Com `updated_since`, a listagem devolve só o que mudou desde então, mais
+os ids removidos: propostas apagadas (ProposalTombstone) ou canceladas.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Proposal, ProposalTombstone, User
+
+
+TOMBSTONE_DAYS = getattr(settings, 'PROPOSAL_TOMBSTONE_DAYS', 30)
+# campos do User que aparecem nas propostas (UserSerializer)
+USER_FIELDS = {
+    'username', 'email', 'avatar', 'reputation_level', 'reputation_score',
+    'phone', 'fullName', 'city', 'state',
+}
+
+
+def bump_versions(*user_ids):
+    user_ids = {pk for pk in user_ids if pk}
+    if user_ids:
+        User.objects.filter(pk__in=user_ids).update(proposals_version=F('proposals_version') + 1)
+
+
+def bump_for_product(product_id):
+    """Os dados do produto aparecem aninhados nas propostas que o envolvem."""
+    rows = Proposal.objects.filter(
+        Q(product_offered_id=product_id) | Q(product_requested_id=product_id)
+    ).values_list('from_user_id', 'to_user_id')
+    bump_versions(*{pk for row in rows for pk in row})
+
+
+def bump_for_users(*user_ids):
+    """Os perfis aparecem aninhados nas propostas de que os usuários participam."""
+    user_ids = {pk for pk in user_ids if pk}
+    if not user_ids:
+        return
+    rows = Proposal.objects.filter(
+        Q(from_user_id__in=user_ids) | Q(to_user_id__in=user_ids)
+    ).values_list('from_user_id', 'to_user_id')
+    bump_versions(*{pk for row in rows for pk in row})
+
+
+def record_tombstone(proposal):
+    ProposalTombstone.objects.create(
+        proposal_id=proposal.pk,
+        from_user_id=proposal.from_user_id,
+        to_user_id=proposal.to_user_id,
+    )
+
+
+def etag_for(user, tab, updated_since=None):
+    return f'W/"inbox-{user.pk}-{user.proposals_version}-{tab or ""}-{updated_since or ""}"'
+
+
+def sync_horizon():
+    """Antes disso não há mais tombstones: o cliente precisa de sync completo."""
+    return timezone.now() - timedelta(days=TOMBSTONE_DAYS)
+
+
+def removed_since(user, tab, since):
+    """Ids apagados ou cancelados desde `since`, para a aba pedida."""
+    field = 'to_user_id' if tab == 'recebidas' else 'from_user_id'
+    deleted = ProposalTombstone.objects.filter(**{field: user.pk}, deleted_at__gt=since).values_list(
+        'proposal_id', flat=True
+    )
+    canceled = Proposal.objects.filter(
+        **{field: user.pk}, status=Proposal.Status.CANCELED, updated_at__gt=since
+    ).values_list('id', flat=True)
+    return sorted(set(deleted) | set(canceled))
+
+
+def purge_tombstones(days=TOMBSTONE_DAYS, batch_size=5000):
+    cutoff = timezone.now() - timedelta(days=days)
+    removed = 0
+    while True:
+        ids = list(ProposalTombstone.objects.filter(deleted_at__lt=cutoff).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += ProposalTombstone.objects.filter(pk__in=ids).delete()[0]
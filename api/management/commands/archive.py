@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.archive import archive_notifications, archive_products
+from api.models import Notification
+
+
+class Command(BaseCommand):
+    help = (
+        'Move produtos trocados/parados (com imagens e propostas) e notificações '
+        'antigas para as tabelas de arquivo, em lotes. Pode ser interrompido e '
+        'rodado de novo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exchanged-days', type=int, default=30,
+                            help='Arquiva produtos trocados há mais de N dias (padrão: 30).')
+        parser.add_argument('--stale-days', type=int, default=None,
+                            help='Arquiva também qualquer produto sem atualização há N dias.')
+        parser.add_argument('--notification-days', type=int, default=180,
+                            help='Arquiva notificações com mais de N dias (padrão: 180).')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Para depois de N lotes de cada tipo (execução incremental).')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        stale_days = options['stale_days']
+
+        self._run('produtos', archive_products(
+            exchanged_before=now - timedelta(days=options['exchanged_days']),
+            stale_before=now - timedelta(days=stale_days) if stale_days else None,
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        ))
+        self._run('notificações', archive_notifications(
+            Notification.objects.filter(created_at__lt=now - timedelta(days=options['notification_days'])),
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        ))
+
+    def _run(self, label, batches):
+        total_rows, total_seconds = 0, 0.0
+        for n, batch in enumerate(batches, start=1):
+            total_rows += batch.rows
+            total_seconds += batch.seconds
+            self.stdout.write(
+                f'[{label}] lote {n}: {batch.products} produtos, {batch.images} imagens, '
+                f'{batch.proposals} propostas, {batch.notifications} notificações '
+                f'({batch.rows / batch.seconds if batch.seconds else 0:.0f} linhas/s)'
+            )
+        rate = total_rows / total_seconds if total_seconds else 0
+        self.stdout.write(self.style.SUCCESS(f'[{label}] {total_rows} linhas arquivadas em {total_seconds:.2f}s ({rate:.0f} linhas/s).'))
@@ -0,0 +1,163 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from itertools import accumulate
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management.base import BaseCommand
+
+from api.cache import STATS, TieredCache
+
+
+MODES = ['none', 'local', 'tiered']
+
+
+class Origin:
+    """Origem sintética (o "banco"): custa `cost` segundos e conta as cargas."""
+
+    def __init__(self, cost):
+        self.cost = cost
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            self.loads += 1
+        time.sleep(self.cost)
+        return {'key': key, 'loaded_at': time.time()}
+
+
+def _worker(mode, options, location, start_barrier, herd_barrier, results):
+    origin = Origin(options['origin_ms'] / 1000)
+    cache = None
+    if mode != 'none':
+        shared = FileBasedCache(location, {'OPTIONS': {'MAX_ENTRIES': options['keys'] * 4}}) if mode == 'tiered' else None
+        cache = TieredCache('bench', ttl=options['ttl'], local_ttl=options['local_ttl'],
+                            max_entries=options['local_entries'], shared=shared)
+
+    def read(key):
+        if cache is None:
+            return origin.load(key)
+        return cache.get_or_compute(key, lambda: origin.load(key))
+
+    weights = list(accumulate(1 / (rank + 1) ** options['zipf'] for rank in range(options['keys'])))
+    reads = [0] * options['threads']
+
+    def traffic(n, deadline):
+        rng = random.Random()
+        while time.monotonic() < deadline:
+            for key in rng.choices(range(options['keys']), cum_weights=weights, k=100):
+                if rng.random() < options['write_ratio']:
+                    if cache is not None:
+                        cache.invalidate(key)
+                else:
+                    read(key)
+                    reads[n] += 1
+
+    def herd(round_):
+        # chave nova para todos ao mesmo tempo: o que acontece quando uma chave quente vence
+        herd_barrier.wait()
+        read(f'hot:{round_}')
+
+    # todos os workers começam o tráfego juntos
+    start_barrier.wait()
+    deadline = time.monotonic() + options['duration']
+    threads = [threading.Thread(target=traffic, args=(n, deadline)) for n in range(options['threads'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    before_herd = origin.loads
+    for round_ in range(options['herd_rounds']):
+        threads = [threading.Thread(target=herd, args=(round_,)) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    results.put({
+        'reads': sum(reads),
+        'origin': before_herd,
+        'herd_origin': origin.loads - before_herd,
+        'stats': cache.stats if cache is not None else dict.fromkeys(STATS, 0),
+    })
+
+
+def run(mode, options):
+    context = multiprocessing.get_context('fork')
+    start_barrier = context.Barrier(options['workers'])
+    herd_barrier = context.Barrier(options['workers'] * options['threads'])
+    results = context.Queue()
+    with tempfile.TemporaryDirectory(dir=options['location']) as location:
+        processes = [
+            context.Process(target=_worker, args=(mode, options, location, start_barrier, herd_barrier, results))
+            for _ in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        rows = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    total = {'reads': 0, 'origin': 0, 'herd_origin': 0, **dict.fromkeys(STATS, 0)}
+    for row in rows:
+        for name in ('reads', 'origin', 'herd_origin'):
+            total[name] += row[name]
+        for name in STATS:
+            total[name] += row['stats'][name]
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        'Simula vários workers lendo (e invalidando) chaves com distribuição '
+        'Zipf contra uma origem lenta e compara sem cache, só L1 por processo '
+        'e L1 + L2 compartilhado (FileBasedCache): taxa de acerto, carga na '
+        'origem e cargas por chave quente que vence (efeito manada).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+        parser.add_argument('--workers', type=int, default=4, help='Processos.')
+        parser.add_argument('--threads', type=int, default=4, help='Threads por processo.')
+        parser.add_argument('--duration', type=float, default=5.0, help='Segundos de tráfego por modo.')
+        parser.add_argument('--keys', type=int, default=2000)
+        parser.add_argument('--zipf', type=float, default=1.1, help='Expoente da distribuição das chaves.')
+        parser.add_argument('--write-ratio', type=float, default=0.01, help='Fração de operações que invalidam.')
+        parser.add_argument('--origin-ms', type=float, default=5.0, help='Custo de cada carga na origem.')
+        parser.add_argument('--ttl', type=float, default=3.0, help='Curto, para ver expiração e renovação no teste.')
+        parser.add_argument('--local-ttl', type=float, default=1.0)
+        parser.add_argument('--local-entries', type=int, default=1000)
+        parser.add_argument('--herd-rounds', type=int, default=5)
+        parser.add_argument('--location', default='/dev/shm' if os.path.isdir('/dev/shm') else None,
+                            help='Onde criar o diretório do L2 (padrão: /dev/shm, em memória).')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['workers']} workers x {options['threads']} threads, {options['keys']} chaves "
+            f"(zipf {options['zipf']}), {options['write_ratio']:.1%} de escritas, "
+            f"origem {options['origin_ms']} ms, {options['duration']} s por modo"
+        )
+        header = (
+            f"{'modo':<8}{'leituras':>10}{'leit/s':>10}{'origem':>9}{'acerto':>9}"
+            f"{'L1':>9}{'L2':>9}{'coalesc.':>10}{'renov.':>8}{'manada':>8}"
+        )
+        self.stdout.write(header)
+        for mode in options['modes']:
+            total = run(mode, options)
+            reads = total['reads'] or 1
+            herd = total['herd_origin'] / options['herd_rounds'] if options['herd_rounds'] else 0
+            self.stdout.write(
+                f"{mode:<8}{total['reads']:>10}{total['reads'] / options['duration']:>10.0f}"
+                f"{total['origin']:>9}{1 - total['origin'] / reads:>9.1%}"
+                f"{total['local_hits']:>9}{total['shared_hits']:>9}{total['coalesced']:>10}"
+                f"{total['early_refreshes']:>8}{herd:>8.1f}"
+            )
+        self.stdout.write(
+            'origem: cargas durante o tráfego; acerto: 1 - origem/leituras; '
+            'manada: cargas na origem por chave quente que vence com todos lendo.'
+        )
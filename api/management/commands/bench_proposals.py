@@ -0,0 +1,126 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import Category, Product, User
+from api.proposals import MAX_OPEN, MAX_OPEN_PER_RECIPIENT
+from api.views import ProposalViewSet
+from api.writes import group_commit
+
+
+MODES = ['serial', 'group']
+
+
+def make_jobs(n, tag):
+    """
+    Pares (remetente, produto oferecido, destinatário, produto pedido) sem
+    repetição e dentro dos limites de propostas em aberto.
+    """
+    per_sender = min(MAX_OPEN, 40)
+    senders = -(-n // per_sender)
+    category = Category.objects.create(name=f'bench-{tag}', image_url='https://example.com/c.png')
+    users = User.objects.bulk_create(
+        [User(username=f'bench-{tag}-s{i}', fullName=f'Remetente {i}') for i in range(senders)]
+        + [User(username=f'bench-{tag}-r{i}', fullName=f'Destinatário {i}') for i in range(per_sender)]
+    )
+    products = Product.objects.bulk_create([
+        Product(title=f'item {user.username}', description='', category=category, user=user) for user in users
+    ])
+    pairs = list(zip(users, products))
+    senders, recipients = pairs[:senders], pairs[senders:]
+    assert MAX_OPEN_PER_RECIPIENT >= 1
+    jobs = [(s, sp, r, rp) for s, sp in senders for r, rp in recipients]
+    return jobs[:n]
+
+
+def run(mode, jobs, threads):
+    view = ProposalViewSet.as_view({'post': 'create'}, throttle_classes=[])
+    factory = APIRequestFactory()
+    group_commit.enabled = mode == 'group'
+    group_commit.stats.update(writes=0, commits=0)
+    pending = list(reversed(jobs))
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    sender, offered, recipient, requested = pending.pop()
+                request = factory.post('/api/proposal/', {
+                    'product_offered_id': offered.pk,
+                    'product_requested_id': requested.pk,
+                    'to_user_id': recipient.pk,
+                    'message': 'Topa trocar?',
+                }, format='json')
+                force_authenticate(request, user=sender)
+                started = time.perf_counter()
+                response = view(request)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if response.status_code != 201:
+                        errors.append(response.status_code)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'proposals': len(latencies) - len(errors),
+        'errors': len(errors),
+        'per_second': (len(latencies) - len(errors)) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'commits': group_commit.stats['commits'] if mode == 'group' else len(latencies),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de escrita: cria propostas por N threads concorrentes (view completa, '
+        'sem throttling) num banco SQLite temporário em disco e mede propostas/s, '
+        'com uma transação por requisição (serial) e com group commit.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+        parser.add_argument('--proposals', type=int, default=2000, help='Propostas por modo.')
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        enabled = group_commit.enabled
+        with tempfile.TemporaryDirectory() as directory:
+            # banco descartável, em disco (o custo do commit é o que se mede)
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            with connection.cursor() as cursor:
+                # como em produção (core/settings_production.py)
+                cursor.execute('PRAGMA journal_mode=WAL')
+            try:
+                self.stdout.write(f"{options['threads']} threads, {options['proposals']} propostas por modo")
+                self.stdout.write(f"{'modo':<8}{'propostas':>10}{'erros':>7}{'prop/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'commits':>9}")
+                for mode in options['modes']:
+                    jobs = make_jobs(options['proposals'], mode)
+                    result = run(mode, jobs, options['threads'])
+                    self.stdout.write(
+                        f"{mode:<8}{result['proposals']:>10}{result['errors']:>7}{result['per_second']:>9.0f}"
+                        f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['commits']:>9}"
+                    )
+            finally:
+                group_commit.enabled = enabled
+                connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,82 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# o que um worker faz no boot: carrega a aplicação WSGI e as URLs
+BOOT = 'import core.wsgi; from django.urls import get_resolver; get_resolver().url_patterns'
+
+
+def parse_importtime(stderr):
+    """Soma o tempo próprio (µs) por pacote raiz a partir da saída de -X importtime."""
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, _cumulative, name = line[len('import time:'):].split('|', 2)
+        packages[name.strip().split('.')[0]] += int(own)
+    return packages
+
+
+def measure(settings_module, runs):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    # o perfil de produção não sobe sem chave; para medir o boot qualquer uma serve
+    env.setdefault('DJANGO_SECRET_KEY', 'bench-startup')
+    walls, totals, packages = [], [], defaultdict(list)
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        walls.append(time.perf_counter() - started)
+        if result.returncode:
+            raise CommandError(f'{settings_module}: o boot falhou.\n{result.stderr[-2000:]}')
+        per_package = parse_importtime(result.stderr)
+        totals.append(sum(per_package.values()))
+        for name, own in per_package.items():
+            packages[name].append(own)
+    return {
+        'settings': settings_module,
+        'runs': runs,
+        'wall_ms': round(statistics.median(walls) * 1000, 1),
+        'import_ms': round(statistics.median(totals) / 1000, 1),
+        'packages_ms': {
+            name: round(statistics.median(values) / 1000, 1)
+            for name, values in sorted(packages.items(), key=lambda item: -statistics.median(item[1]))
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o boot de um worker (import da aplicação WSGI e das URLs) com '
+        '`python -X importtime`, por perfil de settings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settings-modules', nargs='+', default=['core.settings', 'core.settings_production'])
+        parser.add_argument('--runs', type=int, default=5, help='Mediana de N execuções.')
+        parser.add_argument('--top', type=int, default=10, help='Pacotes mais caros a listar.')
+        parser.add_argument('--json', action='store_true', help='Saída em JSON, para acompanhar entre versões.')
+
+    def handle(self, *args, **options):
+        results = [measure(module, options['runs']) for module in options['settings_modules']]
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            self.stdout.write(self.style.SUCCESS(
+                f"{result['settings']}: boot {result['wall_ms']} ms, "
+                f"imports {result['import_ms']} ms (mediana de {result['runs']})"
+            ))
+            for name, ms in list(result['packages_ms'].items())[:options['top']]:
+                self.stdout.write(f'  {name:<24} {ms:>8} ms')
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.export import TABLES, ExportState, available_formats, export_table
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta Product, Proposal, UserRating e Notification para Parquet/Arrow '
+        '(ou CSV), para análises fora do banco de produção: incremental por '
+        'updated_at, e Notification inteira a cada execução (snapshot). Propostas '
+        'apagadas e produtos arquivados saem em proposal_deleted e product_archived.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Diretório de saída (guarda também as marcas d\'água).')
+        parser.add_argument('--format', choices=['parquet', 'arrow', 'csv'], default=None,
+                            help='Padrão: parquet se o pyarrow estiver instalado, senão csv.')
+        parser.add_argument('--tables', nargs='+', choices=sorted(TABLES), default=sorted(TABLES))
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--jobs', type=int, default=1, help='Tabelas exportadas em paralelo.')
+        parser.add_argument('--full', action='store_true', help='Ignora as marcas d\'água e exporta tudo.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or available_formats()[0]
+        if fmt not in available_formats():
+            raise CommandError(f'Formato {fmt} indisponível: instale o pyarrow ou use --format csv.')
+
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+        state = ExportState(output)
+
+        def run(name):
+            mark = {} if options['full'] else state.get(name)
+            try:
+                return name, export_table(TABLES[name], output, mark, fmt=fmt, chunk_size=options['chunk_size'])
+            finally:
+                # cada thread abre a própria conexão
+                if options['jobs'] > 1:
+                    connection.close()
+
+        if options['jobs'] > 1:
+            with ThreadPoolExecutor(max_workers=options['jobs']) as pool:
+                results = list(pool.map(run, options['tables']))
+        else:
+            results = [run(name) for name in options['tables']]
+
+        for name, (rows, path, mark) in results:
+            if path is not None:
+                state.set(name, mark)
+                self.stdout.write(f'{name}: {rows} linhas -> {path}')
+            else:
+                self.stdout.write(f'{name}: nada novo')
+        self.stdout.write(self.style.SUCCESS('Export concluído.'))
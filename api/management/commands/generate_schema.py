@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import schema
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera o schema OpenAPI (swagger.json) em OPENAPI_SCHEMA_FILE; rode a cada deploy. '
+        'Com --check só confere se o arquivo bate com o schema gerado agora.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Padrão: settings.OPENAPI_SCHEMA_FILE.')
+        parser.add_argument('--check', action='store_true', help='Falha se o arquivo estiver desatualizado.')
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.OPENAPI_SCHEMA_FILE
+        content = schema.generate()
+
+        if options['check']:
+            try:
+                with open(path, 'rb') as fh:
+                    current = fh.read()
+            except FileNotFoundError:
+                raise CommandError(f'{path} não existe; rode `manage.py generate_schema`.')
+            if current != content:
+                raise CommandError(f'{path} está desatualizado; rode `manage.py generate_schema`.')
+            self.stdout.write(self.style.SUCCESS(f'{path} está em dia.'))
+            return
+
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        self.stdout.write(self.style.SUCCESS(f'Schema gravado em {path} ({len(content)} bytes).'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api import imports
+from api.models import ProductImport
+
+
+class Command(BaseCommand):
+    help = (
+        'Processa as importações de produtos na fila e marca como falhas as que '
+        'ficaram sem sinal (worker reiniciado no meio). Rode periodicamente '
+        '(ex.: a cada minuto); com IMPORT_RUN_IN_PROCESS=0 é quem processa a fila.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-seconds', type=int, default=imports.STALE_SECONDS,
+                            help='Idade do último sinal para dar um job RUNNING como perdido.')
+
+    def handle(self, *args, **options):
+        failed = imports.fail_stale(options['stale_seconds'])
+        processed = 0
+        queued = ProductImport.objects.filter(status=ProductImport.Status.QUEUED).order_by('id')
+        for job_id in list(queued.values_list('id', flat=True)):
+            job = imports.run_job(job_id)
+            if job is not None:
+                processed += 1
+                self.stdout.write(f'Importação {job.pk}: {job.status}, {job.created_count} produtos, {job.error_count} erros')
+        self.stdout.write(self.style.SUCCESS(
+            f'{processed} importações processadas, {failed} marcadas como interrompidas.'
+        ))
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api import notifications
+
+
+class Command(BaseCommand):
+    help = 'Aplica a retenção das notificações: expira lidas antigas, agrupa rajadas e limita por usuário.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=notifications.RETENTION_DAYS,
+                            help='Idade máxima das notificações lidas, em dias.')
+        parser.add_argument('--max-per-user', type=int, default=notifications.MAX_PER_USER)
+        parser.add_argument('--settle-minutes', type=int,
+                            default=int(notifications.DIGEST_SETTLE.total_seconds() // 60),
+                            help='Só agrupa notificações mais velhas que isso.')
+        parser.add_argument('--archive', action='store_true',
+                            help='Move para ArchivedNotification em vez de apagar.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expired = notifications.expire_read(
+            days=options['days'], archive=options['archive'], batch_size=options['batch_size'],
+        )
+        digested = notifications.digest_bursts(settle=timedelta(minutes=options['settle_minutes']))
+        capped = notifications.enforce_user_cap(
+            max_per_user=options['max_per_user'], archive=options['archive'], batch_size=options['batch_size'],
+        )
+        action = 'arquivadas' if options['archive'] else 'removidas'
+        self.stdout.write(self.style.SUCCESS(
+            f'{expired} lidas {action}, {digested} agrupadas em digests, {capped} {action} pelo limite por usuário.'
+        ))
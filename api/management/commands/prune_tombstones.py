@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.inbox import TOMBSTONE_DAYS, purge_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Remove tombstones de propostas mais antigos que o horizonte do sync incremental.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=TOMBSTONE_DAYS)
+
+    def handle(self, *args, **options):
+        removed = purge_tombstones(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f'{removed} tombstones removidos.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.models import User
+from api.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os contadores de UserStats a partir das tabelas (corrige divergências).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--block-size', type=int, default=2000)
+        parser.add_argument('--users', nargs='+', type=int, help='Só estes ids de usuário.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['users']:
+            users = users.filter(pk__in=options['users'])
+
+        total, last = 0, 0
+        while True:
+            ids = list(users.filter(pk__gt=last).values_list('pk', flat=True)[:options['block_size']])
+            if not ids:
+                break
+            total += reconcile(ids)
+            last = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'{total} usuários reconciliados.'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api import feed
+from api.models import FeedProfile, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Aplica as mudanças pendentes dos feeds (produtos novos/alterados e deltas de '
+        'afinidade), reconstrói os perfis desatualizados e corta as entradas excedentes. '
+        'Rode periodicamente (ex.: a cada minuto).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reconstrói o feed de todos os usuários com perfil.')
+        parser.add_argument('--batch-size', type=int, default=feed.EVENT_BATCH, help='Eventos por transação.')
+
+    def handle(self, *args, **options):
+        applied = feed.process_events(options['batch_size'])
+
+        profiles = FeedProfile.objects.all()
+        if not options['all']:
+            profiles = profiles.filter(stale=True)
+
+        rebuilt = 0
+        for user in User.objects.filter(pk__in=profiles.values('user_id')).iterator(chunk_size=500):
+            feed.rebuild_user_feed(user)
+            rebuilt += 1
+
+        removed = feed.trim_feeds()
+        self.stdout.write(self.style.SUCCESS(
+            f'{applied} eventos aplicados, {rebuilt} feeds reconstruídos, {removed} entradas removidas.'
+        ))
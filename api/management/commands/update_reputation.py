@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api import reputation
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula reputação e nível dos usuários: incremental (só quem teve avaliação ou proposta '
+        'alterada desde a última rodada) ou --full. O decaimento dos demais só entra nas rodadas '
+        'completas; a rodada vira completa sozinha se a última tiver mais de '
+        'REPUTATION_FULL_EVERY_DAYS dias.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recalcula todos os usuários (aplica o decaimento).')
+        parser.add_argument('--block-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        record = reputation.run(full=options['full'], block_size=options['block_size'])
+        seconds = (record.finished_at - record.started_at).total_seconds()
+        mode = 'completa' if record.full else 'incremental'
+        self.stdout.write(self.style.SUCCESS(
+            f'Rodada {mode}: {record.users_updated} usuários atualizados, '
+            f'{record.level_ups} subiram de nível, em {seconds:.1f}s.'
+        ))
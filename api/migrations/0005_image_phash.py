@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_remove_product_image_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='phash',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_phash',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 12:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_image_phash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('affinities', models.JSONField(default=dict)),
+                ('city', models.TextField(blank=True, default='')),
+                ('state', models.TextField(blank=True, default='')),
+                ('stale', models.BooleanField(default=True)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='feed_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='api.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-score', '-product'], name='feed_entry_user_score')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'product'), name='feed_entry_user_product')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-19 12:55
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_available_count(apps, schema_editor):
+    Category = apps.get_model('api', 'Category')
+    for category in Category.objects.annotate(n=Count('products', filter=Q(products__status='available'))):
+        Category.objects.filter(pk=category.pk).update(available_count=category.n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='available_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_available_count, migrations.RunPython.noop),
+    ]
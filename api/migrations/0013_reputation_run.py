@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_product_import'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReputationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('full', models.BooleanField(default=False)),
+                ('users_updated', models.PositiveIntegerField(default=0)),
+                ('level_ups', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='userrating',
+            index=models.Index(fields=['created_at'], name='userrating_created'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='proposals_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ProposalTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('proposal_id', models.BigIntegerField()),
+                ('from_user_id', models.BigIntegerField()),
+                ('to_user_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['from_user_id', 'deleted_at'], name='tombstone_from_deleted'), models.Index(fields=['to_user_id', 'deleted_at'], name='tombstone_to_deleted'), models.Index(fields=['deleted_at'], name='tombstone_deleted')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 13:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_proposal_delta_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('active_listings', models.PositiveIntegerField(default=0)),
+                ('proposals_sent', models.PositiveIntegerField(default=0)),
+                ('proposals_received', models.PositiveIntegerField(default=0)),
+                ('completed_exchanges', models.PositiveIntegerField(default=0)),
+                ('ratings_received', models.PositiveIntegerField(default=0)),
+                ('ratings_sum', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-19 13:06
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.db.models.functions import Now
+
+
+def cancel_duplicate_pending(apps, schema_editor):
+    # mantém a proposta pendente mais antiga de cada par; as demais são canceladas
+    Proposal = apps.get_model('api', 'Proposal')
+    pairs = (
+        Proposal.objects.filter(status='pending')
+        .values('product_offered', 'product_requested')
+        .annotate(n=Count('id'), first=Min('id'))
+        .filter(n__gt=1)
+    )
+    for pair in pairs:
+        Proposal.objects.filter(
+            status='pending',
+            product_offered=pair['product_offered'],
+            product_requested=pair['product_requested'],
+        ).exclude(pk=pair['first']).update(status='canceled', updated_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_user_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_pending, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='proposal',
+            index=models.Index(fields=['from_user', 'status', 'to_user'], name='proposal_sender_status'),
+        ),
+        migrations.AddConstraint(
+            model_name='proposal',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('product_offered', 'product_requested'), name='proposal_unique_pending_pair'),
+        ),
+    ]
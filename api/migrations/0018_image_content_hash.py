@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+def clear_perceptual_hashes(apps, schema_editor):
+    # os dHash antigos não se comparam com sha256: os registros ficam sem hash
+    apps.get_model('api', 'ProductImage').objects.update(content_hash='')
+    apps.get_model('api', 'User').objects.update(avatar_hash='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_proposal_spam_guard'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='productimage',
+            old_name='phash',
+            new_name='content_hash',
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RenameField(
+            model_name='user',
+            old_name='avatar_phash',
+            new_name='avatar_hash',
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(clear_perceptual_hashes, migrations.RunPython.noop),
+    ]
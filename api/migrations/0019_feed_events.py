@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 13:36
+
+from django.db import migrations, models
+
+
+def mark_profiles_stale(apps, schema_editor):
+    # afinidades passam de pesos normalizados para contagens: o refresh_feeds reconstrói
+    apps.get_model('api', 'FeedProfile').objects.update(stale=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField(blank=True, null=True)),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('category_id', models.BigIntegerField(blank=True, null=True)),
+                ('weight', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(mark_profiles_stale, migrations.RunPython.noop),
+    ]
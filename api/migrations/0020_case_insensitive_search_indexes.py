@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-19 14:40
+
+from django.db import migrations
+
+
+# Índices que servem as buscas sem diferenciar maiúsculas do admin
+# (istartswith/iexact). O SQL dessas buscas depende do banco, e o índice
+# também:
+# - SQLite: `col LIKE %s` usa só índice com COLLATE NOCASE;
+# - PostgreSQL: `UPPER(col::text) LIKE UPPER(%s)` usa índice na mesma
+#   expressão, com text_pattern_ops para o LIKE por prefixo.
+INDEXES = [
+    ('product_title_ci', 'api_product', 'title'),
+    ('user_username_ci', 'api_user', 'username'),
+    ('user_email_ci', 'api_user', 'email'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    quote = schema_editor.quote_name
+    for name, table, column in INDEXES:
+        if vendor == 'sqlite':
+            expression = f'{quote(column)} COLLATE NOCASE'
+        elif vendor == 'postgresql':
+            expression = f'(UPPER({quote(column)}::text)) text_pattern_ops'
+        else:
+            continue
+        schema_editor.execute(f'CREATE INDEX {quote(name)} ON {quote(table)} ({expression})')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    for name, _table, _column in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_feed_events'),
+    ]
+
+    operations = [
+        # não serve busca sem diferenciar maiúsculas
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_title',
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
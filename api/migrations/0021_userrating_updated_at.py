@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 14:55
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # sem histórico de edições: considera a data da avaliação
+    apps.get_model('api', 'UserRating').objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_case_insensitive_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userrating',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='userrating',
+            index=models.Index(fields=['updated_at', 'id'], name='userrating_updated_id'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 13:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_userrating_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedproduct',
+            index=models.Index(fields=['archived_at', 'id'], name='archivedproduct_archived_id'),
+        ),
+    ]
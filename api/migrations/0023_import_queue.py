@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-19 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_archived_product_export'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimport',
+            name='format',
+            field=models.CharField(default='csv', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='productimport',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimport',
+            name='source',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AlterField(
+            model_name='productimport',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10),
+        ),
+    ]
@@ -1,5 +1,18 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+
+class AtomicSaveMixin:
+    """
+    save() e os post_save na mesma transação: os deltas dos contadores
+    (api/stats.py) são gravados junto com a linha ou não são gravados.
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
 
 class User(AbstractUser):
@@ -11,6 +24,10 @@ class User(AbstractUser):
     city = models.TextField(blank=True, null=True)
     state = models.TextField(blank=True, null=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    # sha256 do avatar atual já normalizado (evita reenviar a mesma imagem)
+    avatar_hash = models.CharField(max_length=64, blank=True, default='')
+    # incrementado a cada mudança nas propostas do usuário (ETag da caixa de propostas)
+    proposals_version = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return self.username
@@ -19,12 +36,14 @@ class User(AbstractUser):
 class Category(models.Model):
     name = models.CharField(max_length=100)
     image_url = models.URLField()
+    # mantido pelos signals de Product (ver api/signals.py)
+    available_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
 
 
-class Product(models.Model):
+class Product(AtomicSaveMixin, models.Model):
     class Status(models.TextChoices):
         AVAILABLE = 'available', 'Available'
         RESERVED = 'reserved', 'Reserved'
@@ -43,6 +62,23 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # seleção de candidatos ao arquivamento
+            models.Index(fields=['status', 'updated_at'], name='product_status_updated'),
+            # export incremental (marca d'água)
+            models.Index(fields=['updated_at', 'id'], name='product_updated_id'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # guarda categoria/status carregados para os signals calcularem o delta
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'category_id' in loaded and 'status' in loaded:
+            instance._loaded_state = (loaded['category_id'], loaded['status'])
+        return instance
+
     def __str__(self):
         return self.title
 
@@ -51,12 +87,14 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     url = models.URLField()
     is_main = models.BooleanField(default=False)
+    # sha256 da imagem normalizada (ver api/images.py)
+    content_hash = models.CharField(max_length=64, blank=True, default='')
 
     def __str__(self):
         return f"Image for {self.product.title}: {self.url}"
 
 
-class UserRating(models.Model):
+class UserRating(AtomicSaveMixin, models.Model):
     from_user = models.ForeignKey(
         User,
         related_name='given_ratings',
@@ -70,6 +108,24 @@ class UserRating(models.Model):
     rating = models.PositiveSmallIntegerField()
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # usuários afetados desde a última rodada de reputação
+            models.Index(fields=['created_at'], name='userrating_created'),
+            # export incremental (marca d'água)
+            models.Index(fields=['updated_at', 'id'], name='userrating_updated_id'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # nota carregada, para os contadores de UserStats
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'rating' in loaded:
+            instance._loaded_rating = loaded['rating']
+        return instance
 
     def __str__(self):
         return f"{self.from_user.username} → {self.to_user.username}: {self.rating}"
@@ -94,12 +150,20 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     link_to = models.CharField(max_length=255, blank=True, null=True)
     related_id = models.PositiveIntegerField(blank=True, null=True)
+    # quantas notificações este registro resume (>1 em digests)
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='notification_created'),
+            models.Index(fields=['user', '-created_at'], name='notification_user_created'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user.username}: {self.title}"
 
 
-class Proposal(models.Model):
+class Proposal(AtomicSaveMixin, models.Model):
     class Status(models.TextChoices):
         PENDING = 'pending', 'Pending'
         ACCEPTED = 'accepted', 'Accepted'
@@ -136,5 +200,245 @@ class Proposal(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='proposal_updated_id'),
+            # limites de propostas em aberto por remetente (e por destinatário)
+            models.Index(fields=['from_user', 'status', 'to_user'], name='proposal_sender_status'),
+        ]
+        constraints = [
+            # a mesma troca só pode estar pendente uma vez
+            models.UniqueConstraint(
+                fields=['product_offered', 'product_requested'],
+                condition=models.Q(status='pending'),
+                name='proposal_unique_pending_pair',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # status carregado, para os contadores de UserStats
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'status' in loaded:
+            instance._loaded_status = loaded['status']
+        return instance
+
     def __str__(self):
         return f"Proposal {self.id}: {self.from_user.username} → {self.to_user.username}"
+
+
+class FeedProfile(models.Model):
+    """Resumo do usuário usado no ranking do feed (afinidade e localidade)."""
+    user = models.OneToOneField(User, related_name='feed_profile', on_delete=models.CASCADE)
+    # {category_id: interações ponderadas na categoria}
+    affinities = models.JSONField(default=dict)
+    city = models.TextField(blank=True, default='')
+    state = models.TextField(blank=True, default='')
+    stale = models.BooleanField(default=True)
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Feed profile for {self.user_id}"
+
+
+class FeedEntry(models.Model):
+    """Produto candidato pré-ranqueado para o feed de um usuário."""
+    user = models.ForeignKey(User, related_name='feed_entries', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='feed_entries', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='feed_entry_user_product'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-score', '-product'], name='feed_entry_user_score'),
+        ]
+
+    def __str__(self):
+        return f"Feed {self.user_id}: {self.product_id} ({self.score:.2f})"
+
+
+class FeedEvent(models.Model):
+    """
+    Mudança pendente para os feeds (ver api/feed.py): um produto a
+    distribuir (`product_id`) ou um delta de afinidade de um usuário numa
+    categoria (`user_id`, `category_id`, `weight`). Gravada na requisição,
+    aplicada em lote pelo `refresh_feeds`.
+    """
+    product_id = models.BigIntegerField(blank=True, null=True)
+    user_id = models.BigIntegerField(blank=True, null=True)
+    category_id = models.BigIntegerField(blank=True, null=True)
+    weight = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        if self.product_id is not None:
+            return f"Feed event: product {self.product_id}"
+        return f"Feed event: user {self.user_id}, category {self.category_id} ({self.weight:+g})"
+
+
+# Tabelas de arquivo: cópias "frias" das linhas removidas das tabelas
+# principais (ver api/archive.py). Mantêm o id original e guardam as
+# referências como inteiros, sem FK para as tabelas quentes.
+
+class ArchivedProduct(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField()
+    category_id = models.BigIntegerField(db_index=True)
+    user_id = models.BigIntegerField(db_index=True)
+    acceptable_exchanges = models.JSONField(default=list)
+    status = models.CharField(max_length=10)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # export incremental (marca d'água)
+            models.Index(fields=['archived_at', 'id'], name='archivedproduct_archived_id'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class ArchivedProductImage(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    product_id = models.BigIntegerField(db_index=True)
+    url = models.URLField()
+    is_main = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived image for {self.product_id}: {self.url}"
+
+
+class ArchivedProposal(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    product_offered_id = models.BigIntegerField()
+    product_requested_id = models.BigIntegerField()
+    from_user_id = models.BigIntegerField(db_index=True)
+    to_user_id = models.BigIntegerField(db_index=True)
+    message = models.TextField()
+    status = models.CharField(max_length=10)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived proposal {self.id}"
+
+
+class ArchivedNotification(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField(db_index=True)
+    type = models.CharField(max_length=20)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    read = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    link_to = models.CharField(max_length=255, blank=True, null=True)
+    related_id = models.PositiveIntegerField(blank=True, null=True)
+    count = models.PositiveIntegerField(default=1)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived notification for {self.user_id}: {self.title}"
+
+
+class ProductImport(models.Model):
+    """Acompanhamento de uma importação em massa de produtos."""
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    user = models.ForeignKey(User, related_name='product_imports', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    format = models.CharField(max_length=5, default='csv')
+    # cópia do arquivo enviado (IMPORT_SPOOL_DIR), apagada no fim
+    source = models.CharField(max_length=500, blank=True)
+    # atualizado a cada lote: job RUNNING sem sinal é de um worker que morreu
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # [{'row': n, 'errors': {...}}], limitado às primeiras IMPORT_MAX_ERRORS
+    errors = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Import {self.id} by {self.user_id}: {self.status}"
+
+
+class ReputationRun(models.Model):
+    """Rodadas do motor de reputação (a última marca o início da próxima)."""
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(blank=True, null=True)
+    full = models.BooleanField(default=False)
+    users_updated = models.PositiveIntegerField(default=0)
+    level_ups = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Reputation run {self.id} ({self.started_at:%Y-%m-%d %H:%M})"
+
+
+class IdempotencyKey(models.Model):
+    """Resposta guardada para um `Idempotency-Key` (ver api/idempotency.py)."""
+    user = models.ForeignKey(User, related_name='idempotency_keys', on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # hash de método, caminho e corpo: mesma chave com outro payload é erro
+    fingerprint = models.CharField(max_length=64)
+    # nulos enquanto a primeira requisição ainda está em andamento
+    response_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    # início da concessão de quem está executando; vencida, outra requisição assume
+    locked_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
+
+
+class ProposalTombstone(models.Model):
+    """Proposta apagada, para o sync incremental (`updated_since`) avisar os clientes."""
+    proposal_id = models.BigIntegerField()
+    from_user_id = models.BigIntegerField()
+    to_user_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_user_id', 'deleted_at'], name='tombstone_from_deleted'),
+            models.Index(fields=['to_user_id', 'deleted_at'], name='tombstone_to_deleted'),
+            models.Index(fields=['deleted_at'], name='tombstone_deleted'),
+        ]
+
+    def __str__(self):
+        return f"Deleted proposal {self.proposal_id}"
+
+
+class UserStats(models.Model):
+    """Contadores do perfil, mantidos pelos signals (ver api/stats.py)."""
+    user = models.OneToOneField(User, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    active_listings = models.PositiveIntegerField(default=0)
+    proposals_sent = models.PositiveIntegerField(default=0)
+    proposals_received = models.PositiveIntegerField(default=0)
+    completed_exchanges = models.PositiveIntegerField(default=0)
+    ratings_received = models.PositiveIntegerField(default=0)
+    ratings_sum = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.user_id}"
@@ -0,0 +1,141 @@
+# api/notifications.py
+"""
+Retenção das notificações.
+
+- expire_read: remove (ou arquiva) as lidas mais velhas que N dias;
+- digest_bursts: junta rajadas de notificações parecidas e não lidas
+  (ex.: várias NEW_PROPOSAL para o mesmo produto) num único registro,
+  com `count` somado;
+- enforce_user_cap: mantém só as N mais recentes de cada usuário.
+
+Tudo roda em lotes, com o índice (user, -created_at).
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .archive import archive_notifications
+from .models import Notification, Proposal
+
+
+RETENTION_DAYS = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30)
+MAX_PER_USER = getattr(settings, 'NOTIFICATION_MAX_PER_USER', 200)
+# rajadas só são agrupadas depois de "assentarem"
+DIGEST_SETTLE = timedelta(minutes=getattr(settings, 'NOTIFICATION_DIGEST_SETTLE_MINUTES', 30))
+DIGEST_MIN_GROUP = getattr(settings, 'NOTIFICATION_DIGEST_MIN_GROUP', 3)
+
+DIGEST_TITLES = {
+    Notification.Type.NEW_PROPOSAL: '{n} novas propostas',
+    Notification.Type.PROPOSAL_REJECTED: '{n} propostas recusadas',
+    Notification.Type.NEW_RATING: '{n} novas avaliações',
+    Notification.Type.GENERAL: '{n} atualizações nas suas propostas',
+}
+
+
+def _remove(queryset, archive, batch_size):
+    """Apaga ou arquiva o queryset em lotes; retorna o total de linhas."""
+    if archive:
+        return sum(batch.notifications for batch in archive_notifications(queryset, batch_size=batch_size))
+    removed = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += Notification.objects.filter(pk__in=ids).delete()[0]
+
+
+def expire_read(days=RETENTION_DAYS, archive=False, batch_size=1000):
+    cutoff = timezone.now() - timedelta(days=days)
+    return _remove(Notification.objects.filter(read=True, created_at__lt=cutoff), archive, batch_size)
+
+
+def _proposal_products(related_ids):
+    """{proposal_id: (product_id, título)} numa query só."""
+    rows = Proposal.objects.filter(pk__in=related_ids).values_list(
+        'id', 'product_requested_id', 'product_requested__title'
+    )
+    return {pid: (product_id, title) for pid, product_id, title in rows}
+
+
+def digest_bursts(settle=DIGEST_SETTLE, min_group=DIGEST_MIN_GROUP):
+    """Retorna quantas notificações foram absorvidas em digests."""
+    cutoff = timezone.now() - settle
+    candidates = Notification.objects.filter(read=False, type__in=DIGEST_TITLES, created_at__lt=cutoff)
+    pairs = (
+        candidates.values('user_id', 'type')
+        .annotate(n=Count('id'))
+        .filter(n__gte=min_group)
+        .order_by()
+    )
+
+    absorbed = 0
+    for pair in list(pairs):
+        rows = list(
+            candidates.filter(user_id=pair['user_id'], type=pair['type'])
+            .order_by('-created_at')
+            .values('id', 'related_id', 'link_to', 'created_at', 'count')[:MAX_PER_USER]
+        )
+        products = {}
+        if pair['type'] == Notification.Type.NEW_PROPOSAL:
+            products = _proposal_products([r['related_id'] for r in rows if r['related_id']])
+
+        # NEW_PROPOSAL agrupa por produto; os outros tipos, por usuário
+        groups = defaultdict(list)
+        for row in rows:
+            groups[products.get(row['related_id'], (None, None))].append(row)
+
+        for (_, product_title), group in groups.items():
+            if len(group) < min_group:
+                continue
+            absorbed += _collapse(pair['user_id'], pair['type'], group, product_title)
+    return absorbed
+
+
+def _collapse(user_id, notif_type, group, product_title):
+    # group vem ordenado do mais novo para o mais velho
+    latest = group[0]
+    total = sum(row['count'] for row in group)
+    title = DIGEST_TITLES[notif_type].format(n=total)
+    if product_title:
+        title = f'{title} para {product_title}'
+    with transaction.atomic():
+        digest = Notification.objects.create(
+            user_id=user_id,
+            type=notif_type,
+            title=title[:200],
+            message=f'Você tem {total} notificações agrupadas.',
+            link_to=latest['link_to'],
+            related_id=latest['related_id'],
+            count=total,
+        )
+        # mantém a data da mais recente para não mudar a ordem da lista
+        Notification.objects.filter(pk=digest.pk).update(created_at=latest['created_at'])
+        Notification.objects.filter(pk__in=[row['id'] for row in group]).delete()
+    return len(group)
+
+
+def enforce_user_cap(max_per_user=MAX_PER_USER, archive=False, batch_size=1000):
+    """Remove o que passar de `max_per_user` notificações por usuário."""
+    removed = 0
+    over = (
+        Notification.objects.values('user_id')
+        .annotate(n=Count('id'))
+        .filter(n__gt=max_per_user)
+        .order_by()
+    )
+    for row in list(over):
+        newest = (
+            Notification.objects.filter(user_id=row['user_id'])
+            .order_by('-created_at', '-id')
+            .values_list('id', flat=True)[:max_per_user]
+        )
+        removed += _remove(
+            Notification.objects.filter(user_id=row['user_id']).exclude(pk__in=list(newest)),
+            archive, batch_size,
+        )
+    return removed
+
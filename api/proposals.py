@@ -0,0 +1,85 @@
+# api/proposals.py
+"""
+Proteção contra propostas duplicadas e spam.
+
+No banco, a constraint `proposal_unique_pending_pair` impede duas propostas
+pendentes para o mesmo par (produto oferecido → produto pedido), inclusive
+entre requisições concorrentes. Antes de gravar, `check_new_proposal` valida
+numa única consulta:
+
+- o produto oferecido é do remetente e está disponível;
+- o produto pedido é do destinatário e está disponível;
+- não existe proposta pendente igual;
+- o remetente não passou do limite de propostas em aberto, no total
+  (PROPOSAL_MAX_OPEN) e para o mesmo destinatário
+  (PROPOSAL_MAX_OPEN_PER_RECIPIENT). As contagens usam o índice
+  `proposal_sender_status`.
+"""
+from django.conf import settings
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from .models import Product, Proposal
+
+
+MAX_OPEN = getattr(settings, 'PROPOSAL_MAX_OPEN', 50)
+MAX_OPEN_PER_RECIPIENT = getattr(settings, 'PROPOSAL_MAX_OPEN_PER_RECIPIENT', 10)
+
+PENDING = Proposal.Status.PENDING
+AVAILABLE = Product.Status.AVAILABLE
+
+DUPLICATE_MESSAGE = 'Já existe uma proposta pendente para esta troca.'
+
+
+def _open_count(**filters):
+    pending = (
+        Proposal.objects.filter(from_user_id=OuterRef('user_id'), status=PENDING, **filters)
+        .order_by()
+        .values('from_user')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return Coalesce(Subquery(pending, output_field=IntegerField()), Value(0))
+
+
+def check_new_proposal(user, product_offered, product_requested, to_user):
+    if to_user.pk == user.pk:
+        raise ValidationError({'to_user_id': ['Não é possível enviar proposta para si mesmo.']})
+
+    row = (
+        Product.objects.filter(pk=product_offered.pk)
+        .annotate(
+            requested_ok=Exists(Product.objects.filter(
+                pk=product_requested.pk, user_id=to_user.pk, status=AVAILABLE,
+            )),
+            duplicate=Exists(Proposal.objects.filter(
+                product_offered_id=product_offered.pk,
+                product_requested_id=product_requested.pk,
+                status=PENDING,
+            )),
+            open_sent=_open_count(),
+            open_to_recipient=_open_count(to_user_id=to_user.pk),
+        )
+        .values('user_id', 'status', 'requested_ok', 'duplicate', 'open_sent', 'open_to_recipient')
+        .first()
+    )
+
+    if row is None or row['user_id'] != user.pk:
+        raise ValidationError({'product_offered_id': ['O produto oferecido deve ser seu.']})
+    if row['status'] != AVAILABLE:
+        raise ValidationError({'product_offered_id': ['O produto oferecido não está disponível.']})
+    if not row['requested_ok']:
+        raise ValidationError({
+            'product_requested_id': ['O produto pedido não está disponível ou não pertence ao destinatário.'],
+        })
+    if row['duplicate']:
+        raise ValidationError({'non_field_errors': [DUPLICATE_MESSAGE]})
+    if row['open_sent'] >= MAX_OPEN:
+        raise ValidationError({'non_field_errors': [
+            f'Limite de {MAX_OPEN} propostas em aberto atingido.',
+        ]})
+    if row['open_to_recipient'] >= MAX_OPEN_PER_RECIPIENT:
+        raise ValidationError({'non_field_errors': [
+            f'Limite de {MAX_OPEN_PER_RECIPIENT} propostas em aberto para este usuário atingido.',
+        ]})
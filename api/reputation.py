@@ -0,0 +1,173 @@
+# api/reputation.py
+"""
+Motor de reputação.
+
+    score = EXCHANGE_POINTS * Σ decaimento(trocas concluídas)
+          + RATING_POINTS   * Σ decaimento(avaliação) * (nota - 3) / 2
+
+com decaimento = 0.5 ** (idade em dias / HALF_LIFE_DAYS). O nível sai dos
+limites em LEVEL_THRESHOLDS. Trocas arquivadas (ArchivedProposal) contam.
+
+Os usuários são processados em blocos. O score de cada bloco sai de uma
+única consulta: cada termo é uma subconsulta agregada (Sum) correlacionada
+pelo índice da FK, com o decaimento calculado no próprio banco. Gravação
+com `bulk_update` e notificações de LEVEL_UP com `bulk_create`. No modo
+incremental só entram os usuários com avaliação criada ou editada
+(`updated_at`) ou proposta alterada (inclusive saindo de concluída) desde
+a última rodada. O decaimento de quem não teve atividade só é aplicado
+nas rodadas completas: por isso a rodada vira completa quando a última
+completa tem mais de REPUTATION_FULL_EVERY_DAYS dias.
+"""
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, F, FloatField, Func, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Power
+from django.utils import timezone
+
+from . import inbox
+from .cache import user_cache
+from .models import ArchivedProposal, Notification, Proposal, ReputationRun, User, UserRating
+
+
+HALF_LIFE_DAYS = getattr(settings, 'REPUTATION_HALF_LIFE_DAYS', 180)
+EXCHANGE_POINTS = getattr(settings, 'REPUTATION_EXCHANGE_POINTS', 10.0)
+RATING_POINTS = getattr(settings, 'REPUTATION_RATING_POINTS', 5.0)
+# score mínimo de cada nível: nível 1 a partir de 0, nível 2 a partir de 20...
+LEVEL_THRESHOLDS = getattr(settings, 'REPUTATION_LEVEL_THRESHOLDS', [0, 20, 50, 100, 200, 400])
+# todo usuário é recalculado (com o decaimento) pelo menos a cada N dias
+FULL_EVERY_DAYS = getattr(settings, 'REPUTATION_FULL_EVERY_DAYS', 7)
+
+COMPLETED = Proposal.Status.COMPLETED
+
+
+def level_for(score):
+    return max(1, bisect_right(LEVEL_THRESHOLDS, score))
+
+
+class AgeDays(Func):
+    """Idade em dias (fracionária) de uma coluna de data em relação a `now`."""
+
+    output_field = FloatField()
+    template = 'EXTRACT(EPOCH FROM (%(expressions)s)) / 86400.0'
+    arg_joiner = ' - '
+
+    def __init__(self, column, now):
+        super().__init__(Value(now, output_field=DateTimeField()), column)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='(julianday(%(expressions)s))', arg_joiner=') - julianday(', **extra_context
+        )
+
+
+def decay(column, now):
+    return Power(Value(0.5), AgeDays(column, now) / Value(float(HALF_LIFE_DAYS)))
+
+
+def _term(queryset, user_field, points):
+    """Subconsulta com a soma de `points` das linhas de `queryset` do usuário externo."""
+    total = (
+        queryset.filter(**{user_field: OuterRef('pk')})
+        .order_by().values(user_field)
+        .annotate(total=Sum(points)).values('total')
+    )
+    return Coalesce(Subquery(total, output_field=FloatField()), Value(0.0))
+
+
+def _score(users, now):
+    """Anota `score` em `users` com uma única consulta."""
+    score = _term(
+        UserRating.objects.all(), 'to_user_id',
+        Value(RATING_POINTS) * decay(F('created_at'), now) * (F('rating') - Value(3.0)) / Value(2.0),
+    )
+    exchange = Value(EXCHANGE_POINTS) * decay(F('updated_at'), now)
+    # cada troca conta para os dois lados
+    for model in (Proposal, ArchivedProposal):
+        completed = model.objects.filter(status=COMPLETED)
+        score = score + _term(completed, 'from_user_id', exchange) + _term(completed, 'to_user_id', exchange)
+    return users.annotate(score=score)
+
+
+def _apply(users):
+    """Grava só quem mudou e devolve (atualizados, notificações de nível)."""
+    changed, level_ups = [], []
+    for user in users:
+        score = round(max(user.score, 0.0), 2)
+        level = level_for(score)
+        if score == user.reputation_score and level == user.reputation_level:
+            continue
+        if level > user.reputation_level:
+            level_ups.append(Notification(
+                user_id=user.pk,
+                type=Notification.Type.LEVEL_UP,
+                title=f"Você subiu para o nível {level}!",
+                message=f"Sua reputação agora é {score:.0f}. Continue trocando!",
+                link_to="/profile",
+            ))
+        user.reputation_score = score
+        user.reputation_level = level
+        changed.append(user)
+    with transaction.atomic():
+        User.objects.bulk_update(changed, ['reputation_score', 'reputation_level'], batch_size=1000)
+        Notification.objects.bulk_create(level_ups, batch_size=1000)
+        # bulk_update não dispara signals
+        user_cache.invalidate(*[user.pk for user in changed])
+        inbox.bump_for_users(*[user.pk for user in changed])
+    return len(changed), len(level_ups)
+
+
+def touched_user_ids(since):
+    ids = set(UserRating.objects.filter(updated_at__gte=since).values_list('to_user_id', flat=True))
+    # sem filtro de status: uma troca que deixou de ser concluída também muda o score
+    for from_id, to_id in Proposal.objects.filter(updated_at__gte=since).values_list(
+        'from_user_id', 'to_user_id'
+    ):
+        ids.add(from_id)
+        ids.add(to_id)
+    return ids
+
+
+def _blocks(full, since, block_size):
+    """Gera os querysets de usuários de cada bloco."""
+    users = User.objects.only('id', 'reputation_score', 'reputation_level')
+    if full:
+        # blocos por faixa de id
+        last = 0
+        while True:
+            ids = list(User.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:block_size])
+            if not ids:
+                return
+            yield users.filter(pk__gte=ids[0], pk__lte=ids[-1])
+            last = ids[-1]
+    else:
+        touched = sorted(touched_user_ids(since))
+        for start in range(0, len(touched), block_size):
+            yield users.filter(pk__in=touched[start:start + block_size])
+
+
+def run(full=False, block_size=5000):
+    """
+    Executa uma rodada. Sem `full`, parte do início da última rodada
+    concluída; faz a completa se nunca rodou uma ou se a última tem mais
+    de FULL_EVERY_DAYS dias.
+    """
+    finished = ReputationRun.objects.filter(finished_at__isnull=False).order_by('-started_at')
+    previous = finished.first()
+    now = timezone.now()
+    last_full = finished.filter(full=True).values_list('started_at', flat=True).first()
+    # sem atividade o score só cai com o decaimento, aplicado nas completas
+    full = full or last_full is None or last_full < now - timedelta(days=FULL_EVERY_DAYS)
+    record = ReputationRun.objects.create(started_at=now, full=full)
+
+    for users in _blocks(full, previous and previous.started_at, block_size):
+        updated, level_ups = _apply(_score(users, now))
+        record.users_updated += updated
+        record.level_ups += level_ups
+
+    record.finished_at = timezone.now()
+    record.save()
+    return record
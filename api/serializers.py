@@ -1,8 +1,13 @@
 # api/serializers.py
 from rest_framework import serializers
-from .models import Category, Notification, Product, ProductImage, Proposal, User, UserRating
+from .models import Category, Notification, Product, ProductImage, ProductImport, Proposal, User, UserRating, UserStats
+from django.db import IntegrityError, transaction
 from django.db.models import Avg
-import cloudinary.uploader
+from . import cloud
+from .cache import product_cache, user_cache
+from .categories import category_cache
+from .images import preprocess_image
+from .proposals import DUPLICATE_MESSAGE, check_new_proposal
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -25,8 +30,12 @@ class UserSerializer(serializers.ModelSerializer):
             'fullName', 'city', 'state', 'rating'
         ]
 
+    def validate_avatar_file(self, value):
+        # normaliza, reduz e recodifica antes de subir
+        return preprocess_image(value)
+
     def _upload_to_cloudinary(self, file):
-        result = cloudinary.uploader.upload(
+        result = cloud.upload(
             file,
             folder='avatars/',
             overwrite=True,
@@ -36,7 +45,8 @@ class UserSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         avatar_file = validated_data.pop('avatar_file', None)
         if avatar_file:
-            validated_data['avatar'] = self._upload_to_cloudinary(avatar_file)
+            validated_data['avatar'] = self._upload_to_cloudinary(avatar_file.file)
+            validated_data['avatar_hash'] = avatar_file.content_hash
 
         password = validated_data.pop('password')
         # 3) cria o user (sem senha ainda)
@@ -48,8 +58,10 @@ class UserSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         avatar_file = validated_data.pop('avatar_file', None)
-        if avatar_file:
-            validated_data['avatar'] = self._upload_to_cloudinary(avatar_file)
+        # mesma imagem do avatar atual: não reenvia
+        if avatar_file and not (instance.avatar and avatar_file.content_hash == instance.avatar_hash):
+            validated_data['avatar'] = self._upload_to_cloudinary(avatar_file.file)
+            validated_data['avatar_hash'] = avatar_file.content_hash
         return super().update(instance, validated_data)
     
     def get_rating(self, obj):
@@ -57,6 +69,10 @@ class UserSerializer(serializers.ModelSerializer):
         Retorna a média de todos os UserRating recebidos por este usuário.
         Se não houver avaliações, retorna 0.
         """
+        # com select_related('...stats') usa os contadores, sem agregação por linha
+        stats = obj.stats if User.stats.is_cached(obj) else None
+        if stats is not None:
+            return round(stats.ratings_sum / stats.ratings_received, 2) if stats.ratings_received else 0
         agg = obj.received_ratings.aggregate(avg=Avg('rating'))
         # 'avg' virá como Decimal ou None
         return round(agg['avg'] or 0, 2)
@@ -66,6 +82,12 @@ class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'image_url']
+
+
+class CategoryCatalogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'image_url', 'available_count']
         
 
 class CategoryField(serializers.PrimaryKeyRelatedField):
@@ -96,17 +118,78 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'user', 'created_at', 'updated_at']
 
+    def __init__(self, *args, use_cache=True, **kwargs):
+        self.use_cache = use_cache
+        super().__init__(*args, **kwargs)
+
     def get_images(self, obj):
         return ProductImageSerializer(obj.images.all(), many=True).data
 
+    @property
+    def _readable_fields(self):
+        # o usuário tem cache próprio (ver to_representation)
+        for field in super()._readable_fields:
+            if not (self.use_cache and field.field_name == 'user'):
+                yield field
+
     def to_representation(self, instance):
         """
-        Primeiro geramos o dict normal e depois substituímos 'category'
-        pelo serializer completo de Category.
+        O produto (campos + imagens), o dono e a categoria vêm de caches
+        separados (api/cache.py), cada um invalidado pelos signals do que
+        o compõe: o produto pelos saves dele e das imagens, o usuário pelo
+        perfil e pelas avaliações, a categoria pelo cache de categorias.
+
+        Com use_cache=False tudo sai das linhas já carregadas: é o que as
+        propostas usam, porque o ETag delas vem do banco e o cache L1 de
+        outro worker pode ainda não ter visto a invalidação.
         """
-        data = super().to_representation(instance)
-        data['category'] = CategorySerializer(instance.category).data
-        return data
+        if not self.use_cache:
+            data = super().to_representation(instance)
+            data['category'] = CategorySerializer(instance.category).data
+            return data
+        data = dict(product_cache.get_or_compute(
+            instance.pk, lambda: dict(super(ProductSerializer, self).to_representation(instance))
+        ))
+        data['user'] = user_cache.get_or_compute(
+            instance.user_id, lambda: dict(UserSerializer(instance.user).data)
+        )
+        data['category'] = (
+            category_cache.get(instance.category_id)
+            or CategorySerializer(instance.category).data
+        )
+        return {name: data[name] for name in self.Meta.fields if name in data}
+
+
+class CachedCategoryField(serializers.PrimaryKeyRelatedField):
+    """Valida a categoria pelo cache em memória, sem query por linha."""
+    def to_internal_value(self, data):
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        cached = category_cache.get(pk)
+        if cached is None:
+            self.fail('does_not_exist', pk_value=data)
+        return Category(**cached)
+
+
+class ProductImportRowSerializer(ProductSerializer):
+    """Uma linha da importação em massa (ver api/imports.py)."""
+    category = CachedCategoryField(queryset=Category.objects.all())
+    image_urls = serializers.ListField(child=serializers.URLField(), required=False, write_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ['title', 'description', 'category', 'acceptable_exchanges', 'status', 'image_urls']
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductImport
+        fields = [
+            'id', 'status', 'total_rows', 'created_count', 'error_count',
+            'errors', 'created_at', 'finished_at',
+        ]
+        read_only_fields = fields
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
@@ -121,9 +204,13 @@ class ProductImageSerializer(serializers.ModelSerializer):
         model = ProductImage
         fields = ['id', 'url', 'image_file', 'is_main']
 
+    def validate_image_file(self, value):
+        # normaliza, reduz e recodifica antes de subir
+        return preprocess_image(value)
+
     def _upload_to_cloudinary(self, file, product_id):
         """Faz o upload do arquivo para Cloudinary e retorna a URL."""
-        result = cloudinary.uploader.upload(
+        result = cloud.upload(
             file,
             folder=f'products/{product_id}/',
             overwrite=True,
@@ -136,8 +223,17 @@ class ProductImageSerializer(serializers.ModelSerializer):
         is_main = validated_data.pop('is_main')
         # recupera o product via contexto (setado na view)
         product = self.context['product']
+        # o mesmo arquivo (após normalizar) já está no produto: devolve a
+        # imagem existente sem novo upload
+        existing = product.images.filter(content_hash=image_file.content_hash).first()
+        if existing is not None:
+            if is_main and not existing.is_main:
+                existing.is_main = True
+                existing.save(update_fields=['is_main'])
+            return existing
         # faz upload e preenche a URL
-        validated_data['url'] = self._upload_to_cloudinary(image_file, product.id)
+        validated_data['url'] = self._upload_to_cloudinary(image_file.file, product.id)
+        validated_data['content_hash'] = image_file.content_hash
         # vincula o product e is_main
         validated_data['product'] = product
         validated_data['is_main'] = is_main
@@ -146,8 +242,9 @@ class ProductImageSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         # se vier novo arquivo, faz upload e atualiza a URL
         image_file = validated_data.pop('image_file', None)
-        if image_file:
-            instance.url = self._upload_to_cloudinary(image_file, instance.product.id)
+        if image_file and image_file.content_hash != instance.content_hash:
+            instance.url = self._upload_to_cloudinary(image_file.file, instance.product_id)
+            instance.content_hash = image_file.content_hash
         # atualiza is_main se fornecido
         instance.is_main = validated_data.get('is_main', instance.is_main)
         instance.save()
@@ -166,11 +263,12 @@ class ProposalSerializer(serializers.ModelSerializer):
         write_only=True, source='to_user', queryset=User.objects.all()
     )
 
-    # campos de leitura aninhados
+    # campos de leitura aninhados; sem os caches por processo, para o corpo
+    # acompanhar o ETag da caixa (proposals_version, lido do banco)
     from_user  = UserSerializer(read_only=True)
     to_user  = UserSerializer(read_only=True)
-    product_offered = ProductSerializer(read_only=True)
-    product_requested = ProductSerializer(read_only=True)
+    product_offered = ProductSerializer(read_only=True, use_cache=False)
+    product_requested = ProductSerializer(read_only=True, use_cache=False)
 
     class Meta:
         model = Proposal
@@ -181,11 +279,48 @@ class ProposalSerializer(serializers.ModelSerializer):
             'status','created_at','updated_at',
         ]
         read_only_fields = ['id', 'created_at','updated_at']
+        # a unicidade do par pendente é checada em check_new_proposal (e pela constraint)
+        validators = []
+
+    # definidos na criação (e validados por check_new_proposal); fixos depois
+    FIXED_AFTER_CREATE = {
+        'product_offered': 'product_offered_id',
+        'product_requested': 'product_requested_id',
+        'to_user': 'to_user_id',
+    }
+
+    def validate(self, attrs):
+        if self.instance is None:
+            check_new_proposal(
+                self.context['request'].user,
+                attrs['product_offered'], attrs['product_requested'], attrs['to_user'],
+            )
+            return attrs
+        errors = {
+            field: ['Não pode ser alterado depois de criada a proposta.']
+            for source, field in self.FIXED_AFTER_CREATE.items()
+            if source in attrs and attrs[source] != getattr(self.instance, source)
+        }
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
 
     def create(self, validated_data):
         # o PrimaryKeyRelatedField já colocou product_offered, etc em validated_data
         validated_data['from_user'] = self.context['request'].user
-        return super().create(validated_data)
+        return self._guarded(super().create, validated_data)
+
+    def update(self, instance, validated_data):
+        # voltar para "pendente" também esbarra na constraint
+        return self._guarded(super().update, instance, validated_data)
+
+    def _guarded(self, save, *args):
+        # corrida entre requisições iguais: quem perde recebe 400, não 500
+        try:
+            with transaction.atomic():
+                return save(*args)
+        except IntegrityError:
+            raise serializers.ValidationError({'non_field_errors': [DUPLICATE_MESSAGE]})
     
     
 class NotificationSerializer(serializers.ModelSerializer):
@@ -200,7 +335,9 @@ class NotificationSerializer(serializers.ModelSerializer):
             'created_at',
             'link_to',
             'related_id',
+            'count',
         ]
+        read_only_fields = ['count']
         
 
 class UserRatingSerializer(serializers.ModelSerializer):
@@ -215,3 +352,24 @@ class UserRatingSerializer(serializers.ModelSerializer):
             'created_at',
         ]
 
+
+class UserStatsSerializer(serializers.ModelSerializer):
+    rating = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserStats
+        fields = [
+            'active_listings',
+            'proposals_sent',
+            'proposals_received',
+            'completed_exchanges',
+            'ratings_received',
+            'rating',
+            'updated_at',
+        ]
+
+    def get_rating(self, obj):
+        # mesma regra do UserSerializer.get_rating, sem agregação
+        if not obj.ratings_received:
+            return 0
+        return round(obj.ratings_sum / obj.ratings_received, 2)
@@ -0,0 +1,133 @@
+# api/signals.py
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import feed, inbox, stats
+from .cache import product_cache, user_cache
+from .categories import category_cache, recount_categories
+from .models import ArchivedProposal, Category, Product, ProductImage, Proposal, User, UserRating
+
+
+def _adjust_available_count(category_id, delta):
+    if category_id is None or not delta:
+        return
+    Category.objects.filter(pk=category_id).update(available_count=F('available_count') + delta)
+    # só a contagem: a lista usada na representação dos produtos continua válida
+    category_cache.invalidate_counts()
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    product_cache.invalidate(instance.pk)
+
+    # contagem de disponíveis por categoria: tira do estado antigo, soma no novo
+    new_state = (instance.category_id, instance.status)
+    if not created and not hasattr(instance, '_loaded_state'):
+        # instância não veio do banco: sem estado antigo, recalcula
+        old_state = None
+        recount_categories([instance.category_id])
+        stats.reconcile([instance.user_id])
+    else:
+        old_state = (None, None) if created else instance._loaded_state
+        old_category, old_status = old_state
+        if old_state != new_state:
+            was_available = old_status == Product.Status.AVAILABLE
+            is_available = instance.status == Product.Status.AVAILABLE
+            if was_available:
+                _adjust_available_count(old_category, -1)
+            if is_available:
+                _adjust_available_count(instance.category_id, 1)
+            stats.bump(instance.user_id, active_listings=is_available - was_available)
+    instance._loaded_state = new_state
+
+    # feeds: só categoria/status importam; aplicado depois pelo refresh_feeds
+    if old_state != new_state:
+        affinities = []
+        if old_state is not None and old_state[0] != instance.category_id:
+            # afinidade do dono passa da categoria antiga para a nova
+            affinities = [(instance.user_id, old_state[0], -1), (instance.user_id, instance.category_id, 1)]
+        feed.queue(products=[instance.pk], affinities=affinities)
+    if not created:
+        # propostas que mostram este produto mudaram de conteúdo
+        inbox.bump_for_product(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    product_cache.invalidate(instance.pk)
+    if instance.status == Product.Status.AVAILABLE:
+        _adjust_available_count(instance.category_id, -1)
+        stats.bump(instance.user_id, active_listings=-1)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, **kwargs):
+    # as imagens fazem parte da representação do produto
+    product_cache.invalidate(instance.product_id)
+    inbox.bump_for_product(instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, **kwargs):
+    category_cache.invalidate()
+
+
+@receiver(post_save, sender=Proposal)
+def proposal_saved(sender, instance, created, **kwargs):
+    inbox.bump_versions(instance.from_user_id, instance.to_user_id)
+    if created:
+        # quem pede um produto se interessa mais pela categoria dele
+        feed.queue(affinities=[
+            (instance.from_user_id, instance.product_requested.category_id, 2),
+            (instance.to_user_id, instance.product_offered.category_id, 1),
+        ])
+
+    completed = Proposal.Status.COMPLETED
+    was_completed = not created and getattr(instance, '_loaded_status', None) == completed
+    exchanges = (instance.status == completed) - was_completed
+    stats.bump(instance.from_user_id, proposals_sent=int(created), completed_exchanges=exchanges)
+    stats.bump(instance.to_user_id, proposals_received=int(created), completed_exchanges=exchanges)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Proposal)
+def proposal_deleted(sender, instance, **kwargs):
+    inbox.record_tombstone(instance)
+    inbox.bump_versions(instance.from_user_id, instance.to_user_id)
+    # arquivada (api/archive.py copia antes de apagar): continua contando
+    if ArchivedProposal.objects.filter(pk=instance.pk).exists():
+        return
+    exchanges = -int(instance.status == Proposal.Status.COMPLETED)
+    stats.bump(instance.from_user_id, proposals_sent=-1, completed_exchanges=exchanges)
+    stats.bump(instance.to_user_id, proposals_received=-1, completed_exchanges=exchanges)
+
+
+@receiver(post_save, sender=UserRating)
+def rating_saved(sender, instance, created, **kwargs):
+    # a média entra na representação do usuário
+    user_cache.invalidate(instance.to_user_id)
+    inbox.bump_for_users(instance.to_user_id)
+    old_rating = 0 if created else getattr(instance, '_loaded_rating', instance.rating)
+    stats.bump(instance.to_user_id, ratings_received=int(created), ratings_sum=instance.rating - old_rating)
+    instance._loaded_rating = instance.rating
+
+
+@receiver(post_delete, sender=UserRating)
+def rating_deleted(sender, instance, **kwargs):
+    user_cache.invalidate(instance.to_user_id)
+    inbox.bump_for_users(instance.to_user_id)
+    stats.bump(instance.to_user_id, ratings_received=-1, ratings_sum=-instance.rating)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    user_cache.invalidate(instance.pk)
+    if not created and (update_fields is None or inbox.USER_FIELDS & set(update_fields)):
+        inbox.bump_for_users(instance.pk)
+    # login só atualiza last_login: não mexe no feed
+    if created or (update_fields and not {'city', 'state'} & set(update_fields)):
+        return
+    feed.mark_stale(instance.pk)
@@ -0,0 +1,102 @@
+# api/stats.py
+"""
+Contadores do perfil (UserStats).
+
+Os signals aplicam deltas com F() a cada mudança relevante, na mesma
+transação da escrita (ver AtomicSaveMixin). A linha de cada usuário é
+criada, já calculada a partir das tabelas, no primeiro delta ou na
+primeira leitura (o que vier antes). Caminhos que não disparam signals
+(bulk_create do importador, arquivamento) chamam `reconcile` na própria
+transação. O `reconcile_user_stats` recalcula tudo a partir das tabelas
+(inclusive as de arquivo) para corrigir qualquer divergência.
+
+Definições:
+- active_listings: produtos disponíveis do usuário;
+- proposals_sent/received: propostas enviadas/recebidas (incluindo arquivadas);
+- completed_exchanges: propostas concluídas em que o usuário é uma das partes;
+- ratings_received/ratings_sum: avaliações recebidas e soma das notas.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import ArchivedProposal, Product, Proposal, User, UserRating, UserStats
+
+
+COUNTERS = [
+    'active_listings', 'proposals_sent', 'proposals_received',
+    'completed_exchanges', 'ratings_received', 'ratings_sum',
+]
+
+
+def bump(user_id, **deltas):
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not user_id or not deltas:
+        return
+    rows = UserStats.objects.filter(user_id=user_id)
+    changes = {name: F(name) + value for name, value in deltas.items()}
+    with transaction.atomic():
+        if rows.update(updated_at=timezone.now(), **changes):
+            return
+        # sem linha: criada a partir das tabelas, que já incluem esta mudança
+        # (estamos na transação da escrita). Se outra transação criou antes,
+        # o cálculo dela não viu esta mudança: aplica o delta.
+        _, created = _get_or_create(user_id)
+        if not created:
+            rows.update(updated_at=timezone.now(), **changes)
+
+
+def _get_or_create(user_id):
+    return UserStats.objects.get_or_create(user_id=user_id, defaults=compute([user_id])[user_id])
+
+
+def _grouped(queryset, field, **aggregates):
+    rows = queryset.values(field).annotate(**aggregates).order_by()
+    return {row[field]: row for row in rows}
+
+
+def compute(user_ids):
+    """{user_id: {contador: valor}} com algumas consultas agrupadas por bloco."""
+    ids = list(user_ids)
+    stats = {pk: dict.fromkeys(COUNTERS, 0) for pk in ids}
+
+    for pk, row in _grouped(Product.objects.filter(user_id__in=ids, status=Product.Status.AVAILABLE),
+                            'user_id', n=Count('id')).items():
+        stats[pk]['active_listings'] = row['n']
+
+    for model in (Proposal, ArchivedProposal):
+        for side, counter in (('from_user_id', 'proposals_sent'), ('to_user_id', 'proposals_received')):
+            for pk, row in _grouped(model.objects.filter(**{f'{side}__in': ids}), side, n=Count('id')).items():
+                stats[pk][counter] += row['n']
+            completed = model.objects.filter(**{f'{side}__in': ids}, status=Proposal.Status.COMPLETED)
+            for pk, row in _grouped(completed, side, n=Count('id')).items():
+                stats[pk]['completed_exchanges'] += row['n']
+
+    for pk, row in _grouped(UserRating.objects.filter(to_user_id__in=ids), 'to_user_id',
+                            n=Count('id'), total=Sum('rating')).items():
+        stats[pk]['ratings_received'] = row['n']
+        stats[pk]['ratings_sum'] = row['total'] or 0
+    return stats
+
+
+def reconcile(user_ids):
+    """Recalcula e grava (upsert) os contadores dos usuários informados."""
+    stats = compute(user_ids)
+    now = timezone.now()
+    with transaction.atomic():
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=pk, updated_at=now, **values) for pk, values in stats.items()],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=COUNTERS + ['updated_at'],
+        )
+    return len(stats)
+
+
+def get_stats(user_id):
+    """Uma leitura pela PK; cria a linha na primeira consulta."""
+    stats = UserStats.objects.filter(user_id=user_id).first()
+    if stats is None and User.objects.filter(pk=user_id).exists():
+        # get_or_create: não sobrescreve uma linha criada (e já com deltas) por um bump concorrente
+        stats, _ = _get_or_create(user_id)
+    return stats
@@ -1,3 +1,1022 @@
-from django.test import TestCase
+import csv
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.apps import apps
+from django.contrib import admin
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+from rest_framework import serializers
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core import schema
+
+from . import feed, idempotency, inbox, notifications, proposals, reputation, throttling
+from .archive import archive_product_batch, product_candidates
+from .cache import TieredCache, product_cache, user_cache
+from .categories import category_cache, recount_categories
+from .export import TABLES, export_table
+from .imports import ProductImporter, fail_stale, read_rows
+from .images import preprocess_image
+from .serializers import ProductImportRowSerializer
+from .stats import compute, get_stats
+from .writes import GroupCommitter
+from .models import (
+    ArchivedNotification, Category, FeedEntry, FeedEvent, IdempotencyKey, Notification, Product, ProductImage,
+    ProductImport, Proposal, ReputationRun, User, UserRating, UserStats,
+)
+
+
+class AdminChangelistQueryTests(TestCase):
+    """As changelists do admin não podem fazer query por linha."""
+
+    changelists = ['user', 'product', 'productimage', 'notification', 'proposal']
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha-forte')
+        self.client.force_login(self.admin)
+        self.category = Category.objects.create(name='Livros', image_url='https://example.com/c.png')
+        self.seq = 0
+
+    def add_rows(self, n):
+        for _ in range(n):
+            self.seq += 1
+            a = User.objects.create_user(f'a{self.seq}')
+            b = User.objects.create_user(f'b{self.seq}')
+            offered = Product.objects.create(title=f'p{self.seq}', description='', category=self.category, user=a)
+            requested = Product.objects.create(title=f'q{self.seq}', description='', category=self.category, user=b)
+            ProductImage.objects.create(product=offered, url='https://example.com/i.png')
+            proposal = Proposal.objects.create(
+                product_offered=offered, product_requested=requested,
+                from_user=a, to_user=b, message='troca?',
+            )
+            Notification.objects.create(
+                user=b, type=Notification.Type.NEW_PROPOSAL, title='Nova proposta',
+                message='troca?', related_id=proposal.id,
+            )
+
+    def changelist_queries(self, model_name):
+        url = reverse(f'admin:api_{model_name}_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_rows(3)
+        small = {name: self.changelist_queries(name) for name in self.changelists}
+        self.add_rows(12)
+        for name in self.changelists:
+            with self.subTest(changelist=name):
+                queries = self.changelist_queries(name)
+                self.assertEqual(queries, small[name])
+                self.assertLessEqual(queries, 8)
+
+
+    def test_search_uses_indexes(self):
+        factory = RequestFactory()
+        for name in self.changelists:
+            model = apps.get_model('api', name)
+            model_admin = admin.site._registry[model]
+            queryset, _ = model_admin.get_search_results(factory.get('/'), model.objects.all(), 'abc')
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[-1] for row in cursor.fetchall()]
+            with self.subTest(changelist=name, plan=plan):
+                self.assertFalse([step for step in plan if step.startswith('SCAN')])
+
+
+class SchemaTests(TestCase):
+    """Schema OpenAPI memorizado com ETag e arquivo pré-gerado em dia."""
+
+    def setUp(self):
+        schema.reset()
+        self.addCleanup(schema.reset)
+
+    def test_pregenerated_file_matches_generated_schema(self):
+        # falha com CommandError se openapi.json estiver desatualizado
+        call_command('generate_schema', '--check', stdout=StringIO())
+
+    def test_schema_is_memoized_with_etag(self):
+        response = self.client.get('/swagger.json')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.settings(OPENAPI_SCHEMA_SOURCE='file', OPENAPI_SCHEMA_FILE=Path('/nao/existe.json')):
+            # memorizado: não gera nem lê de novo
+            again = self.client.get('/swagger.json')
+            not_modified = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+
+
+class ImageHashTests(TestCase):
+    """Só o mesmo arquivo (após normalizar) conta como imagem repetida."""
+
+    def upload(self, color, shape='rectangle'):
+        img = Image.new('RGB', (400, 300), 'white')
+        getattr(ImageDraw.Draw(img), shape)((100, 75, 300, 225), fill=color)
+        out = BytesIO()
+        img.save(out, format='PNG')
+        return SimpleUploadedFile('foto.png', out.getvalue(), content_type='image/png')
+
+    def test_different_images_have_different_hashes(self):
+        hashes = {
+            preprocess_image(self.upload('red')).content_hash,
+            preprocess_image(self.upload('green')).content_hash,
+            preprocess_image(self.upload('blue', 'ellipse')).content_hash,
+        }
+        self.assertEqual(len(hashes), 3)
+
+    def test_same_image_has_same_hash(self):
+        self.assertEqual(
+            preprocess_image(self.upload('red')).content_hash,
+            preprocess_image(self.upload('red')).content_hash,
+        )
+
+
+class ImagePreprocessTests(TestCase):
+    def encode(self, size, fmt, **params):
+        out = BytesIO()
+        Image.new('RGB', size, 'white').save(out, format=fmt, **params)
+        return SimpleUploadedFile(f'foto.{fmt.lower()}', out.getvalue())
+
+    def test_exif_orientation_applied_after_reducing(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # girar 90°
+        processed = preprocess_image(self.encode((3200, 1600), 'JPEG', exif=exif.tobytes()))
+        self.assertEqual((processed.width, processed.height), (800, 1600))
+
+    def test_full_decode_formats_have_lower_pixel_limit(self):
+        with mock.patch('api.images.MAX_PIXELS_FULL_DECODE', 1000):
+            with self.assertRaises(serializers.ValidationError):
+                preprocess_image(self.encode((40, 40), 'PNG'))
+            # JPEG reduz no draft: vale o limite geral
+            preprocess_image(self.encode((40, 40), 'JPEG'))
+
+
+class ThrottleTests(TestCase):
+    """O IP do throttling não pode ser escolhido pelo cliente."""
+
+    def setUp(self):
+        throttling.store.clear()
+        self.addCleanup(throttling.store.clear)
+
+    def test_spoofed_forwarded_for_does_not_reset_login_limit(self):
+        statuses = [
+            self.client.post(
+                '/api-token-auth/', {'username': 'x', 'password': 'errada'},
+                HTTP_X_FORWARDED_FOR=f'10.0.0.{n}',
+            ).status_code
+            for n in range(11)
+        ]
+        self.assertEqual(statuses[:10], [400] * 10)
+        self.assertEqual(statuses[10], 429)
+
+    def test_cache_store_denies_while_another_owner_holds_the_lock(self):
+        store = throttling.CacheTokenBucketStore('default')
+        store.clear()
+        self.addCleanup(store.clear)
+        self.assertTrue(store.consume('k', 5, 1)[0])
+
+        store.cache.set('k:lock', 'outro-dono', 5)
+        allowed, _wait = store.consume('k', 5, 1)
+        self.assertFalse(allowed)
+        # o lock de outro dono fica onde estava
+        self.assertEqual(store.cache.get('k:lock'), 'outro-dono')
+
+
+class FeedFanOutTests(TestCase):
+    """Fan-out fora da requisição e só para quem se interessa pelo produto."""
+
+    def setUp(self):
+        self.books = Category.objects.create(name='Livros', image_url='https://example.com/l.png')
+        self.games = Category.objects.create(name='Jogos', image_url='https://example.com/j.png')
+        self.owner = User.objects.create_user('dono', city='Recife', state='PE')
+        self.neighbour = User.objects.create_user('vizinho', city='Recife', state='PE')
+        self.stranger = User.objects.create_user('longe', city='Porto Alegre', state='RS')
+        for user in (self.neighbour, self.stranger):
+            feed.rebuild_user_feed(user)
+
+    def feed_of(self, user):
+        return list(feed.get_user_feed(user).values_list('product_id', flat=True))
+
+    def test_new_product_reaches_only_relevant_feeds(self):
+        product = Product.objects.create(title='Duna', description='', category=self.books, user=self.owner)
+        # a requisição só registra o evento
+        self.assertTrue(FeedEvent.objects.filter(product_id=product.pk).exists())
+        self.assertFalse(FeedEntry.objects.filter(product=product).exists())
+
+        feed.process_events()
+        self.assertEqual(self.feed_of(self.neighbour), [product.pk])
+        self.assertEqual(self.feed_of(self.stranger), [])
+        self.assertFalse(FeedEvent.objects.exists())
+
+        product.status = Product.Status.EXCHANGED
+        product.save()
+        feed.process_events()
+        self.assertFalse(FeedEntry.objects.filter(product=product).exists())
+
+    def test_proposal_adds_category_affinity_incrementally(self):
+        games = Product.objects.create(title='Xadrez', description='', category=self.games, user=self.owner)
+        offered = Product.objects.create(title='Livro', description='', category=self.books, user=self.stranger)
+        feed.process_events()
+        self.assertNotIn(games.pk, self.feed_of(self.stranger))
+
+        Proposal.objects.create(
+            product_offered=offered, product_requested=games,
+            from_user=self.stranger, to_user=self.owner, message='troca?',
+        )
+        feed.process_events()
+        self.assertIn(games.pk, self.feed_of(self.stranger))
+        profile = self.stranger.feed_profile
+        profile.refresh_from_db()
+        self.assertEqual(profile.affinities[str(self.games.pk)], 2)
+
+
+class CategoryTests(TestCase):
+    def setUp(self):
+        category_cache.invalidate()
+        self.books = Category.objects.create(name='Livros', image_url='https://example.com/l.png')
+        self.records = Category.objects.create(name='Discos', image_url='https://example.com/d.png')
+        self.user = User.objects.create_user('a')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counts(self):
+        return {row['name']: row['available_count'] for row in self.client.get('/api/categories/').data}
+
+    def test_counts_follow_product_changes(self):
+        product = Product.objects.create(title='livro', description='', category=self.books, user=self.user)
+        Product.objects.create(title='disco', description='', category=self.records, user=self.user)
+        self.assertEqual(self.counts(), {'Livros': 1, 'Discos': 1})
+
+        product.status = Product.Status.EXCHANGED
+        product.save()
+        self.assertEqual(self.counts(), {'Livros': 0, 'Discos': 1})
+        detail = self.client.get(f'/api/categories/{self.records.pk}/').data
+        self.assertEqual(detail['available_count'], 1)
+
+    def test_recount_fixes_drift(self):
+        Product.objects.create(title='livro', description='', category=self.books, user=self.user)
+        Category.objects.filter(pk=self.books.pk).update(available_count=7)
+        recount_categories()
+        self.assertEqual(self.counts()['Livros'], 1)
+
+    def test_product_changes_keep_category_data_cached(self):
+        self.counts()
+        Product.objects.create(title='livro', description='', category=self.books, user=self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(category_cache.get(self.books.pk)['name'], 'Livros')
+        # a contagem foi invalidada e recarrega numa query
+        with self.assertNumQueries(1):
+            self.assertEqual(category_cache.get(self.books.pk, with_count=True)['available_count'], 1)
+
+    def test_category_change_invalidates_list(self):
+        self.counts()
+        self.books.name = 'Livros e HQs'
+        self.books.save()
+        self.assertIn('Livros e HQs', self.counts())
+
+
+class ArchiveTests(TestCase):
+    def test_product_with_new_open_proposal_is_not_archived(self):
+        category = Category.objects.create(name='Livros', image_url='https://example.com/c.png')
+        a = User.objects.create_user('a')
+        b = User.objects.create_user('b')
+        exchanged = Product.objects.create(
+            title='trocado', description='', category=category, user=a, status=Product.Status.EXCHANGED,
+        )
+        other = Product.objects.create(title='outro', description='', category=category, user=b)
+        candidates = product_candidates(exchanged_before=timezone.now())
+        ids = list(candidates.values_list('id', flat=True))
+        self.assertEqual(ids, [exchanged.pk])
+
+        # proposta criada entre a seleção e o lote
+        Proposal.objects.create(
+            product_offered=other, product_requested=exchanged, from_user=b, to_user=a, message='ainda?',
+        )
+        result = archive_product_batch(candidates, ids)
+        self.assertEqual(result.products, 0)
+        self.assertTrue(Product.objects.filter(pk=exchanged.pk).exists())
+        self.assertEqual(Proposal.objects.count(), 1)
+
+
+class InboxETagTests(TestCase):
+    """Mudanças no que aparece aninhado nas propostas invalidam o ETag."""
+
+    def setUp(self):
+        category = Category.objects.create(name='Livros', image_url='https://example.com/c.png')
+        self.a = User.objects.create_user('a', fullName='Ana')
+        self.b = User.objects.create_user('b', fullName='Bia')
+        self.offered = Product.objects.create(title='livro', description='', category=category, user=self.a)
+        self.requested = Product.objects.create(title='disco', description='', category=category, user=self.b)
+        Proposal.objects.create(
+            product_offered=self.offered, product_requested=self.requested,
+            from_user=self.a, to_user=self.b, message='troca?',
+        )
+        self.client = APIClient()
+
+    def get_inbox(self, etag=''):
+        self.a.refresh_from_db()
+        self.client.force_authenticate(self.a)
+        return self.client.get('/api/proposal/', {'tab': 'enviadas'}, HTTP_IF_NONE_MATCH=etag)
+
+    def assertChanged(self, change):
+        etag = self.get_inbox()['ETag']
+        self.assertEqual(self.get_inbox(etag).status_code, 304)
+        change()
+        response = self.get_inbox(etag)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_counterpart_profile_edit(self):
+        def rename():
+            self.client.force_authenticate(self.b)
+            self.client.patch(f'/api/users/{self.b.pk}/', {'fullName': 'Beatriz'})
+
+        response = self.assertChanged(rename)
+        self.assertEqual(response.data[0]['to_user']['fullName'], 'Beatriz')
+
+    def test_counterpart_rating(self):
+        self.assertChanged(lambda: UserRating.objects.create(from_user=self.a, to_user=self.b, rating=4, comment=''))
+
+    def test_product_image(self):
+        self.assertChanged(lambda: ProductImage.objects.create(product=self.requested, url='https://example.com/i.png'))
+
+    def test_reputation_update(self):
+        UserRating.objects.create(from_user=self.a, to_user=self.b, rating=5, comment='')
+        response = self.assertChanged(lambda: reputation.run(full=True))
+        self.assertGreater(response.data[0]['to_user']['reputation_score'], 0)
+
+    def test_body_ignores_stale_process_cache(self):
+        # este processo guarda produto e dono no L1 (/products/ usa os caches)
+        self.client.force_authenticate(self.a)
+        self.client.get(f'/api/products/{self.requested.pk}/')
+        self.addCleanup(product_cache.invalidate, self.requested.pk)
+        self.addCleanup(user_cache.invalidate, self.b.pk)
+
+        def edit_elsewhere():
+            # outro worker gravou e subiu a versão; a invalidação ainda não chegou aqui
+            Product.objects.filter(pk=self.requested.pk).update(title='vinil')
+            User.objects.filter(pk=self.b.pk).update(fullName='Beatriz')
+            inbox.bump_for_product(self.requested.pk)
+
+        response = self.assertChanged(edit_elsewhere)
+        self.assertEqual(response.data[0]['product_requested']['title'], 'vinil')
+        self.assertEqual(response.data[0]['product_requested']['user']['fullName'], 'Beatriz')
+        self.assertEqual(response.data[0]['to_user']['fullName'], 'Beatriz')
+
+    def test_body_queries_do_not_grow_with_rows(self):
+        UserRating.objects.create(from_user=self.a, to_user=self.b, rating=4, comment='')
+
+        def queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.get_inbox()
+            self.assertEqual(response.data[-1]['to_user']['rating'], 4)
+            return len(ctx.captured_queries)
+
+        single = queries()
+        for n in range(3):
+            offered = Product.objects.create(title=f'l{n}', description='', category=self.offered.category, user=self.a)
+            Proposal.objects.create(
+                product_offered=offered, product_requested=self.requested,
+                from_user=self.a, to_user=self.b, message='troca?',
+            )
+        self.assertEqual(queries(), single)
+
+
+class ProposalValidationTests(TestCase):
+    """Regras de check_new_proposal e campos fixos depois da criação."""
+
+    def setUp(self):
+        throttling.store.clear()
+        self.addCleanup(throttling.store.clear)
+        self.category = Category.objects.create(name='Livros', image_url='https://example.com/c.png')
+        self.a = User.objects.create_user('a', fullName='Ana')
+        self.b = User.objects.create_user('b', fullName='Bia')
+        self.c = User.objects.create_user('c', fullName='Caio')
+        self.offered = self.product(self.a)
+        self.requested = self.product(self.b)
+        self.client = APIClient()
+        self.client.force_authenticate(self.a)
+
+    def product(self, user):
+        return Product.objects.create(title='item', description='', category=self.category, user=user)
+
+    def propose(self, offered=None, requested=None, to_user=None):
+        return self.client.post('/api/proposal/', {
+            'product_offered_id': (offered or self.offered).pk,
+            'product_requested_id': (requested or self.requested).pk,
+            'to_user_id': (to_user or self.b).pk,
+            'message': 'troca?',
+        }, format='json')
+
+    def test_valid_proposal(self):
+        self.assertEqual(self.propose().status_code, 201)
+
+    def test_duplicate_pending_pair(self):
+        self.assertEqual(self.propose().status_code, 201)
+        response = self.propose()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], [proposals.DUPLICATE_MESSAGE])
+
+    def test_duplicate_race_hits_constraint(self):
+        self.assertEqual(self.propose().status_code, 201)
+        # a outra requisição passou pela checagem antes desta gravar
+        with mock.patch('api.serializers.check_new_proposal'):
+            response = self.propose()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], [proposals.DUPLICATE_MESSAGE])
+        self.assertEqual(Proposal.objects.count(), 1)
+
+    def test_open_proposal_caps(self):
+        with mock.patch.object(proposals, 'MAX_OPEN_PER_RECIPIENT', 1):
+            self.assertEqual(self.propose().status_code, 201)
+            response = self.propose(offered=self.product(self.a))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('para este usuário', response.data['non_field_errors'][0])
+
+        with mock.patch.object(proposals, 'MAX_OPEN', 1):
+            response = self.propose(offered=self.product(self.a), requested=self.product(self.c), to_user=self.c)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Limite de 1 propostas', response.data['non_field_errors'][0])
+
+    def test_self_proposal(self):
+        response = self.propose(requested=self.product(self.a), to_user=self.a)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('to_user_id', response.data)
+
+    def test_ownership(self):
+        response = self.propose(offered=self.product(self.c))
+        self.assertIn('product_offered_id', response.data)
+        response = self.propose(requested=self.product(self.c))
+        self.assertIn('product_requested_id', response.data)
+
+    def test_patch_cannot_repoint_proposal(self):
+        proposal_id = self.propose().data['id']
+        for field, value in [
+            ('product_offered_id', self.product(self.c).pk),
+            ('product_requested_id', self.product(self.c).pk),
+            ('to_user_id', self.c.pk),
+        ]:
+            response = self.client.patch(f'/api/proposal/{proposal_id}/', {field: value}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(field, response.data)
+        proposal = Proposal.objects.get(pk=proposal_id)
+        self.assertEqual(
+            (proposal.product_offered_id, proposal.product_requested_id, proposal.to_user_id),
+            (self.offered.pk, self.requested.pk, self.b.pk),
+        )
+        # reenviar os mesmos valores não é alteração
+        response = self.client.patch(
+            f'/api/proposal/{proposal_id}/', {'to_user_id': self.b.pk, 'message': 'e agora?'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@mock.patch('api.cache.POLL_INTERVAL', 0)
+class TieredCacheInvalidationTests(TestCase):
+    """Dois workers (dois TieredCache) sobre o mesmo L2."""
+
+    def setUp(self):
+        self.shared = LocMemCache(f'tiered-{self.id()}', {})
+        self.worker1 = TieredCache('t', shared=self.shared)
+        self.worker2 = TieredCache('t', shared=self.shared)
+        self.value = 'v1'
+
+    def read(self, worker):
+        return worker.get_or_compute('k', lambda: self.value)
+
+    def test_invalidation_reaches_other_worker(self):
+        self.assertEqual(self.read(self.worker1), 'v1')
+        self.assertEqual(self.read(self.worker2), 'v1')
+        self.value = 'v2'
+        self.worker1.invalidate('k')
+        self.assertEqual(self.read(self.worker2), 'v2')
+
+    def test_log_restart_resets_workers(self):
+        for _ in range(5):
+            self.worker1.invalidate('outra')
+        self.read(self.worker1)
+        self.read(self.worker2)
+        # L2 reiniciado: contador e mensagens somem; a mensagem de 'k' fica
+        # abaixo da posição antiga do worker 2 e o contador já passou dela
+        self.shared.clear()
+        self.value = 'v2'
+        self.worker1.invalidate('k')
+        for _ in range(10):
+            self.worker1.invalidate('outra')
+        self.assertEqual(self.read(self.worker2), 'v2')
+
+    def test_head_has_no_expiry_and_advances(self):
+        for worker in (self.worker1, self.worker2, self.worker1):
+            worker.invalidate('k')
+        self.assertEqual(self.shared.get('t:inv:head'), 3)
+        self.assertIsNone(self.shared._expire_info[self.shared.make_and_validate_key('t:inv:head')])
+
+    def test_unrelated_invalidation_does_not_drop_fill(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            self.worker1.invalidate('outra')
+            return 'v1'
+
+        self.worker1.get_or_compute('k', compute)
+        self.worker1.get_or_compute('k', compute)
+        self.assertEqual(len(calls), 1)
+
+    def test_fill_invalidated_while_computing_is_dropped(self):
+        def compute():
+            self.worker1.invalidate('k')
+            return 'antigo'
+
+        self.worker1.get_or_compute('k', compute)
+        self.assertEqual(self.worker1.get_or_compute('k', lambda: 'novo'), 'novo')
+
+
+class ReputationTests(TestCase):
+    def setUp(self):
+        self.a = User.objects.create_user('a')
+        self.b = User.objects.create_user('b')
+
+    def test_score_matches_decay_formula(self):
+        old = timezone.now() - timezone.timedelta(days=reputation.HALF_LIFE_DAYS)
+        rating = UserRating.objects.create(from_user=self.a, to_user=self.b, rating=5, comment='')
+        UserRating.objects.filter(pk=rating.pk).update(created_at=old)
+        reputation.run(full=True)
+        self.b.refresh_from_db()
+        # meia-vida: metade dos pontos de uma nota 5
+        self.assertAlmostEqual(self.b.reputation_score, reputation.RATING_POINTS / 2, places=1)
+
+    def test_incremental_run_rescores_edited_rating(self):
+        rating = UserRating.objects.create(from_user=self.a, to_user=self.b, rating=5, comment='')
+        reputation.run()
+        self.b.refresh_from_db()
+        self.assertGreater(self.b.reputation_score, 0)
+
+        rating.rating = 3
+        rating.save()
+        record = reputation.run()
+        self.assertFalse(record.full)
+        self.b.refresh_from_db()
+        self.assertEqual(self.b.reputation_score, 0)
+
+    def test_incremental_run_rescores_exchange_leaving_completed(self):
+        category = Category.objects.create(name='Livros', image_url='https://example.com/c.png')
+        proposal = Proposal.objects.create(
+            product_offered=Product.objects.create(title='x', description='', category=category, user=self.a),
+            product_requested=Product.objects.create(title='y', description='', category=category, user=self.b),
+            from_user=self.a, to_user=self.b, message='troca?', status=Proposal.Status.COMPLETED,
+        )
+        reputation.run()
+        self.a.refresh_from_db()
+        self.assertGreater(self.a.reputation_score, 0)
+
+        proposal.status = Proposal.Status.CANCELED
+        proposal.save()
+        self.assertFalse(reputation.run().full)
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.reputation_score, 0)
+
+    def test_run_becomes_full_when_last_full_is_old(self):
+        reputation.run()
+        self.assertFalse(reputation.run().full)
+        ReputationRun.objects.update(started_at=timezone.now() - timezone.timedelta(days=reputation.FULL_EVERY_DAYS + 1))
+        self.assertTrue(reputation.run().full)
+
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Livros', image_url='https://example.com/c.png')
+        self.user = User.objects.create_user('a')
+
+    def assertReconciled(self, user):
+        expected = compute([user.pk])[user.pk]
+        row = UserStats.objects.get(user=user)
+        self.assertEqual({name: getattr(row, name) for name in expected}, expected)
+
+    def test_first_delta_creates_row_without_losing_history(self):
+        Product.objects.create(title='livro', description='', category=self.category, user=self.user)
+        UserStats.objects.all().delete()
+        # linha ainda não existe: o delta não pode se perder nem contar em dobro
+        Product.objects.create(title='disco', description='', category=self.category, user=self.user)
+        self.assertEqual(UserStats.objects.get(user=self.user).active_listings, 2)
+
+    def test_archive_keeps_counters(self):
+        other = User.objects.create_user('b')
+        product = Product.objects.create(title='livro', description='', category=self.category, user=self.user)
+        offered = Product.objects.create(title='disco', description='', category=self.category, user=other)
+        Proposal.objects.create(
+            product_offered=offered, product_requested=product, from_user=other, to_user=self.user,
+            message='troca?', status=Proposal.Status.COMPLETED,
+        )
+        for user in (self.user, other):
+            get_stats(user.pk)
+        archive_product_batch(Product.objects.all(), [product.pk, offered.pk])
+        for user in (self.user, other):
+            self.assertReconciled(user)
+        self.assertEqual(get_stats(other.pk).completed_exchanges, 1)
+
+
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('a')
+        self.other = User.objects.create_user('b')
+        self.long_ago = timezone.now() - timezone.timedelta(days=notifications.RETENTION_DAYS + 1)
+
+    def notify(self, created_at=None, read=False, type=Notification.Type.GENERAL, related_id=None, count=1):
+        notification = Notification.objects.create(
+            user=self.user, type=type, title='t', message='m', read=read, related_id=related_id, count=count,
+        )
+        if created_at is not None:
+            Notification.objects.filter(pk=notification.pk).update(created_at=created_at)
+        return notification.pk
+
+    def proposals_for(self, title, n):
+        category = Category.objects.get_or_create(name='Livros', image_url='https://example.com/c.png')[0]
+        requested = Product.objects.create(title=title, description='', category=category, user=self.user)
+        offered = Product.objects.create(title='oferta', description='', category=category, user=self.other)
+        # recusadas: o par só pode ficar pendente uma vez
+        return [
+            Proposal.objects.create(
+                product_offered=offered, product_requested=requested, from_user=self.other, to_user=self.user,
+                message='troca?', status=Proposal.Status.REJECTED,
+            ).pk
+            for _ in range(n)
+        ]
+
+    def test_expire_read_only_removes_old_read(self):
+        old_read = self.notify(self.long_ago, read=True)
+        old_unread = self.notify(self.long_ago)
+        recent_read = self.notify(read=True)
+        self.assertEqual(notifications.expire_read(), 1)
+        remaining = set(Notification.objects.values_list('pk', flat=True))
+        self.assertEqual(remaining, {old_unread, recent_read})
+        self.assertNotIn(old_read, remaining)
+
+    def test_new_proposal_digest_per_product(self):
+        hour = timezone.timedelta(hours=1)
+        times = [self.long_ago + i * hour for i in range(3)]
+        for when, pk, count in zip(times, self.proposals_for('livro', 3), (1, 2, 1)):
+            self.notify(when, type=Notification.Type.NEW_PROPOSAL, related_id=pk, count=count)
+        # outro produto, abaixo do mínimo: fica como está
+        kept = [
+            self.notify(self.long_ago, type=Notification.Type.NEW_PROPOSAL, related_id=pk)
+            for pk in self.proposals_for('disco', 2)
+        ]
+
+        self.assertEqual(notifications.digest_bursts(), 3)
+        digest = Notification.objects.get(count__gt=1)
+        self.assertEqual(digest.count, 4)
+        self.assertIn('livro', digest.title)
+        self.assertEqual(digest.created_at, times[-1])
+        self.assertEqual(set(Notification.objects.exclude(pk=digest.pk).values_list('pk', flat=True)), set(kept))
+
+        # segunda rodada: nada a agrupar
+        self.assertEqual(notifications.digest_bursts(), 0)
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_user_cap_keeps_newest(self):
+        ids = [self.notify(self.long_ago + timezone.timedelta(minutes=i)) for i in range(5)]
+        self.assertEqual(notifications.enforce_user_cap(max_per_user=3), 2)
+        self.assertEqual(set(Notification.objects.values_list('pk', flat=True)), set(ids[2:]))
+
+    def test_command_archive_moves_rows(self):
+        expired = self.notify(self.long_ago, read=True)
+        ids = [self.notify(timezone.now() - timezone.timedelta(minutes=i)) for i in range(3)]
+        call_command('prune_notifications', '--archive', '--max-per-user', '2', stdout=StringIO())
+        self.assertEqual(set(Notification.objects.values_list('pk', flat=True)), set(ids[:2]))
+        self.assertEqual(set(ArchivedNotification.objects.values_list('pk', flat=True)), {expired, ids[2]})
+
+
+class ExportTests(TestCase):
+    """Edições e exclusões em tabelas mutáveis chegam ao export."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.a = User.objects.create_user('a')
+        self.b = User.objects.create_user('b')
+
+    def export(self, name, mark):
+        rows, path, mark = export_table(TABLES[name], self.directory, mark, fmt='csv')
+        with open(path, newline='') as fh:
+            return list(csv.DictReader(fh)), mark
+
+    def test_edited_rating_is_exported_again(self):
+        rating = UserRating.objects.create(from_user=self.a, to_user=self.b, rating=2, comment='')
+        rows, mark = self.export('userrating', {})
+        self.assertEqual([row['rating'] for row in rows], ['2'])
+
+        rating.rating = 5
+        rating.save()
+        rows, _ = self.export('userrating', mark)
+        self.assertEqual([(row['id'], row['rating']) for row in rows], [(str(rating.pk), '5')])
+
+    def test_notification_snapshot_drops_deleted_rows(self):
+        kept, gone = [
+            Notification.objects.create(user=self.a, type=Notification.Type.SYSTEM, title=t, message='')
+            for t in ('fica', 'sai')
+        ]
+        rows, mark = self.export('notification', {})
+        self.assertEqual(len(rows), 2)
+
+        gone.delete()
+        rows, _ = self.export('notification', mark)
+        self.assertEqual([row['id'] for row in rows], [str(kept.pk)])
+        # só o snapshot mais recente fica no disco
+        snapshots = list((Path(self.directory) / 'notification').glob('notification-snapshot-*'))
+        self.assertEqual(len(snapshots), 1)
+
+    def test_deletes_reach_the_export(self):
+        category = Category.objects.create(name='Livros', image_url='https://example.com/c.png')
+        offered = Product.objects.create(title='livro', description='', category=category, user=self.a)
+        requested = Product.objects.create(
+            title='disco', description='', category=category, user=self.b, status=Product.Status.EXCHANGED,
+        )
+        proposal = Proposal.objects.create(
+            product_offered=offered, product_requested=requested, from_user=self.a, to_user=self.b,
+            message='troca?', status=Proposal.Status.COMPLETED,
+        )
+
+        # o arquivamento apaga a proposta em cascata
+        archive_product_batch(Product.objects.all(), [requested.pk])
+        rows, _ = self.export('proposal_deleted', {})
+        self.assertEqual([row['proposal_id'] for row in rows], [str(proposal.pk)])
+        rows, _ = self.export('product_archived', {})
+        self.assertEqual([row['id'] for row in rows], [str(requested.pk)])
+
+
+class ImportMaintenanceTests(TestCase):
+    """A importação faz o que os signals fariam para cada produto."""
+
+    def test_import_updates_stats_and_queues_feed(self):
+        category = Category.objects.create(name='Livros', image_url='https://example.com/c.png')
+        user = User.objects.create_user('importador')
+        self.assertEqual(get_stats(user.pk).active_listings, 0)
+
+        lines = '\n'.join(
+            f'{{"title": "Livro {n}", "description": "usado", "category": {category.pk}, "acceptable_exchanges": []}}'
+            for n in range(2)
+        )
+        job = ProductImport.objects.create(user=user)
+        ProductImporter(job, ProductImportRowSerializer, {}).run(BytesIO(lines.encode()), 'jsonl')
+
+        self.assertEqual(job.created_count, 2)
+        self.assertEqual(get_stats(user.pk).active_listings, 2)
+        queued = set(FeedEvent.objects.exclude(product_id=None).values_list('product_id', flat=True))
+        self.assertEqual(queued, set(Product.objects.filter(user=user).values_list('pk', flat=True)))
+        self.assertTrue(FeedEvent.objects.filter(user_id=user.pk, category_id=category.pk, weight=2).exists())
+
+
+class ImportQueueTests(TestCase):
+    """Jobs de importação sobrevivem ao worker: fila processada pelo comando."""
+
+    def setUp(self):
+        spool = mock.patch('api.imports.SPOOL_DIR', Path(tempfile.mkdtemp()))
+        spool.start()
+        self.addCleanup(spool.stop)
+        self.category = Category.objects.create(name='Livros', image_url='https://example.com/c.png')
+        self.user = User.objects.create_user('importador')
+
+    def test_command_processes_queued_job(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        data = f'{{"title": "Livro", "description": "usado", "category": {self.category.pk}, "acceptable_exchanges": []}}\n'.encode()
+        response = client.post('/api/products/import/', {'file': SimpleUploadedFile('p.jsonl', data)})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], ProductImport.Status.QUEUED)
+        job = ProductImport.objects.get(pk=response.data['id'])
+
+        call_command('process_imports', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.created_count), (ProductImport.Status.DONE, 1))
+        self.assertFalse(Path(job.source).exists())
+        # já processado: uma segunda rodada não pega o job de novo
+        out = StringIO()
+        call_command('process_imports', stdout=out)
+        self.assertIn('0 importações processadas', out.getvalue())
+
+    def test_stale_running_job_is_failed(self):
+        old = timezone.now() - timezone.timedelta(hours=1)
+        stale = ProductImport.objects.create(user=self.user, status=ProductImport.Status.RUNNING, heartbeat_at=old)
+        alive = ProductImport.objects.create(
+            user=self.user, status=ProductImport.Status.RUNNING, heartbeat_at=timezone.now(),
+        )
+        self.assertEqual(fail_stale(), 1)
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(stale.status, ProductImport.Status.FAILED)
+        self.assertIsNotNone(stale.finished_at)
+        self.assertEqual(stale.error_count, 1)
+        self.assertEqual(alive.status, ProductImport.Status.RUNNING)
+
+
+class ReadRowsTests(TestCase):
+    def test_jsonl_keeps_unicode_line_separators_inside_strings(self):
+        data = '{"title": "a\u2028b"}\r\n{"title": "c"}\n'.encode()
+        rows = list(read_rows(BytesIO(data), 'jsonl'))
+        self.assertEqual(rows, [(1, {'title': 'a\u2028b'}), (2, {'title': 'c'})])
+
+    def test_csv_with_bom_and_quoted_newline(self):
+        data = '\ufefftitle,description\r\nlivro,"linha 1\nlinha 2"\r\n'.encode()
+        fileobj = BytesIO(data)
+        rows = list(read_rows(fileobj, 'csv'))
+        self.assertEqual(rows, [(2, {
+            'title': 'livro', 'description': 'linha 1\nlinha 2', 'acceptable_exchanges': [], 'image_urls': [],
+        })])
+        self.assertFalse(fileobj.closed)
+
+
+class IdempotencyMixin:
+    def setUp(self):
+        self.user = User.objects.create_user(username='idem', password='x')
+        self.calls = 0
+
+    def request(self, data, key='chave-1', fmt='json'):
+        request = APIRequestFactory().post('/api/products/', data, format=fmt, HTTP_IDEMPOTENCY_KEY=key)
+        request = Request(request, parsers=[JSONParser(), MultiPartParser()])
+        request.user = self.user
+        return request
+
+    def handler(self, status_code=201):
+        def run():
+            self.calls += 1
+            return Response({'call': self.calls}, status=status_code)
+        return run
+
+
+class IdempotencyTests(IdempotencyMixin, TestCase):
+    def test_retry_replays_stored_response(self):
+        first = idempotency.run_idempotent(self.request({'title': 'a'}), self.handler())
+        again = idempotency.run_idempotent(self.request({'title': 'a'}), self.handler())
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((again.status_code, again.data), (201, first.data))
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+
+    def test_other_payload_with_same_key_is_rejected(self):
+        idempotency.run_idempotent(self.request({'title': 'a'}), self.handler())
+        response = idempotency.run_idempotent(self.request({'title': 'b'}), self.handler())
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_files_are_compared_by_content(self):
+        def upload(content):
+            return self.request({'image': SimpleUploadedFile('a.png', content)}, fmt='multipart')
+
+        idempotency.run_idempotent(upload(b'aaaa'), self.handler())
+        # mesmo nome e tamanho, outro conteúdo
+        self.assertEqual(idempotency.run_idempotent(upload(b'bbbb'), self.handler()).status_code, 422)
+        self.assertEqual(idempotency.run_idempotent(upload(b'aaaa'), self.handler()).status_code, 201)
+        self.assertEqual(self.calls, 1)
+
+    def test_server_error_releases_the_key(self):
+        failed = idempotency.run_idempotent(self.request({'title': 'a'}), self.handler(503))
+        self.assertEqual(failed.status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        response = idempotency.run_idempotent(self.request({'title': 'a'}), self.handler())
+        self.assertEqual((response.status_code, self.calls), (201, 2))
+
+    def test_abandoned_record_is_reclaimed_after_lease(self):
+        request = self.request({'title': 'a'})
+        # processo que morreu no meio da requisição
+        IdempotencyKey.objects.create(
+            user=self.user, key='chave-1', fingerprint=idempotency.fingerprint(request),
+            locked_at=timezone.now() - timezone.timedelta(seconds=idempotency.LEASE_SECONDS + 1),
+            expires_at=timezone.now() + timezone.timedelta(hours=1),
+        )
+        response = idempotency.run_idempotent(request, self.handler())
+        self.assertEqual((response.status_code, self.calls), (201, 1))
+        self.assertEqual(IdempotencyKey.objects.get().response_status, 201)
+
+    def test_live_record_answers_conflict(self):
+        request = self.request({'title': 'a'})
+        IdempotencyKey.objects.create(
+            user=self.user, key='chave-1', fingerprint=idempotency.fingerprint(request),
+            expires_at=timezone.now() + timezone.timedelta(hours=1),
+        )
+        with mock.patch.object(idempotency, 'WAIT_SECONDS', 0.2):
+            response = idempotency.run_idempotent(request, self.handler())
+        self.assertEqual((response.status_code, self.calls), (409, 0))
+
+
+class IdempotencyConcurrencyTests(IdempotencyMixin, TransactionTestCase):
+    """Duplicatas simultâneas, com threads e conexões de verdade."""
+
+    def test_concurrent_duplicates_run_the_handler_once(self):
+        started = threading.Event()
+        release = threading.Event()
+        responses = []
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return self.handler()()
+
+        def send(handler):
+            try:
+                responses.append(idempotency.run_idempotent(self.request({'title': 'a'}), handler))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=send, args=(slow,))]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        threads += [threading.Thread(target=send, args=(self.handler(),)) for _ in range(2)]
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(sorted(r.status_code for r in responses), [201, 201, 201])
+        self.assertEqual(sum(r.has_header('Idempotent-Replayed') for r in responses), 2)
+
+
+class GroupCommitTests(TransactionTestCase):
+    """
+    Group commit com threads de verdade (no TestCase tudo roda dentro de
+    uma transação e o run() grava direto, sem fila).
+    """
+
+    def setUp(self):
+        self.committer = GroupCommitter(enabled=True)
+        self.leading = threading.Event()
+        self.release = threading.Event()
+        self.callbacks = {}
+
+    def write(self, name, fail=False):
+        def fn():
+            if name == 'lider':
+                # segura a líder até as outras escritas entrarem na fila
+                self.leading.set()
+                self.release.wait(5)
+            if fail:
+                raise ValueError(name)
+            category = Category.objects.create(name=name, image_url='https://example.com/c.png')
+            transaction.on_commit(lambda: self.callbacks.__setitem__(name, threading.get_ident()))
+            return category.pk
+        return fn
+
+    def run_writes(self, followers):
+        outcomes = {}
+
+        def request(name, fn):
+            try:
+                outcomes[name] = (self.committer.run(fn), threading.get_ident())
+            except Exception as exc:
+                outcomes[name] = (exc, threading.get_ident())
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=request, args=('lider', self.write('lider')))]
+        threads[0].start()
+        self.assertTrue(self.leading.wait(5))
+        for name, fail in followers:
+            threads.append(threading.Thread(target=request, args=(name, self.write(name, fail))))
+            threads[-1].start()
+        deadline = time.monotonic() + 5
+        while len(self.committer._queue) < len(followers) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_queued_writes_share_one_commit(self):
+        outcomes = self.run_writes([('b', False), ('c', False)])
+        # a líder grava sozinha; as duas que esperaram vão num commit só
+        self.assertEqual(self.committer.stats, {'writes': 3, 'commits': 2})
+        self.assertEqual(
+            set(Category.objects.values_list('name', flat=True)), {'lider', 'b', 'c'},
+        )
+        for name, (result, _ident) in outcomes.items():
+            self.assertEqual(result, Category.objects.get(name=name).pk)
+
+    def test_errors_and_callbacks_stay_with_their_request(self):
+        outcomes = self.run_writes([('b', True), ('c', False)])
+        self.assertIsInstance(outcomes['b'][0], ValueError)
+        self.assertEqual(outcomes['c'][0], Category.objects.get(name='c').pk)
+        self.assertFalse(Category.objects.filter(name='b').exists())
+        # on_commit roda na thread da própria requisição, não na líder do lote
+        self.assertEqual(set(self.callbacks), {'lider', 'c'})
+        for name, ident in self.callbacks.items():
+            self.assertEqual(ident, outcomes[name][1])
 
-# Create your tests here.
@@ -0,0 +1,202 @@
+# api/throttling.py
+"""
+Throttling por token bucket.
+
+Cada chave (IP, usuário ou escopo+identidade) tem um balde com capacidade
+igual ao número de requisições da taxa ('5/min' -> 5 fichas) que é
+reabastecido continuamente. O estado de cada balde são só dois números,
+atualizados em O(1).
+
+Por padrão o estado fica em memória no processo (LRU com tamanho máximo);
+definindo `THROTTLE_CACHE_ALIAS` nas settings ele passa a ficar num cache
+do Django compartilhado entre os workers.
+
+O IP vem de `get_ident` do DRF, que só confia em X-Forwarded-For até
+NUM_PROXIES proxies (0: usa REMOTE_ADDR). Sem isso o cliente escolheria
+a própria chave mandando um X-Forwarded-For diferente a cada tentativa.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/min' -> (5, 60). None desativa o throttle."""
+    if rate is None:
+        return None, None
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+def _refill(tokens, last, now, capacity, refill_rate):
+    return min(capacity, tokens + (now - last) * refill_rate)
+
+
+class MemoryTokenBucketStore:
+    """Baldes em memória, com lock e no máximo `max_entries` chaves (LRU)."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        """
+        Tenta consumir uma ficha. Retorna (permitido, segundos até a
+        próxima ficha).
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = capacity
+                if len(self._buckets) >= self.max_entries:
+                    self._buckets.popitem(last=False)
+            else:
+                tokens = _refill(bucket[0], bucket[1], now, capacity, refill_rate)
+                self._buckets.move_to_end(key)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+        return allowed, 0 if allowed else (1 - tokens) / refill_rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheTokenBucketStore:
+    """
+    Baldes num cache do Django (ex.: Redis/Memcached) compartilhado entre
+    processos. A atualização de cada chave é serializada com um lock curto
+    via `cache.add` (atômico nesses backends) que guarda um token do dono:
+    só quem pegou o lock o apaga, mesmo que ele tenha expirado no meio.
+    Se o lock não sai a tempo, a chave está sendo martelada e a requisição
+    é negada, não liberada.
+    """
+
+    lock_timeout = 2
+    lock_wait = 0.1
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        lock_key = f'{key}:lock'
+        token = uuid.uuid4().hex
+        if not self._acquire(lock_key, token):
+            return False, self.lock_wait
+        try:
+            now = time.time() if now is None else now
+            ttl = int(capacity / refill_rate) + 1
+            bucket = self.cache.get(key)
+            tokens = capacity if bucket is None else _refill(bucket[0], bucket[1], now, capacity, refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.cache.set(key, (tokens, now), ttl)
+        finally:
+            if self.cache.get(lock_key) == token:
+                self.cache.delete(lock_key)
+        return allowed, 0 if allowed else (1 - tokens) / refill_rate
+
+    def _acquire(self, lock_key, token):
+        deadline = time.monotonic() + self.lock_wait
+        pause = 0.001
+        while not self.cache.add(lock_key, token, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(pause)
+            pause = min(pause * 2, 0.01)
+        return True
+
+    def clear(self):
+        self.cache.clear()
+
+
+def get_store():
+    alias = getattr(settings, 'THROTTLE_CACHE_ALIAS', None)
+    if alias:
+        return CacheTokenBucketStore(alias)
+    return MemoryTokenBucketStore(getattr(settings, 'THROTTLE_MAX_ENTRIES', 10000))
+
+
+store = get_store()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Base: subclasses definem `scope` e como montar a chave."""
+    scope = None
+    store = store
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError('.get_cache_key() must be overridden')
+
+    def allow_request(self, request, view):
+        self.wait_time = None
+        num, period = parse_rate(self.get_rate())
+        if num is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        allowed, wait = self.store.consume(f'throttle_{self.scope}_{key}', num, num / period)
+        if not allowed:
+            self.wait_time = wait
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class AnonBucketThrottle(TokenBucketThrottle):
+    """Limite por IP para requisições anônimas."""
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    """Limite por usuário autenticado."""
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class ScopedBucketThrottle(TokenBucketThrottle):
+    """
+    Limite por escopo do endpoint. A view define `throttle_scope` ou, em
+    viewsets, `throttle_scopes = {'create': 'proposal', ...}` por action.
+    """
+
+    def allow_request(self, request, view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        self.scope = scopes.get(getattr(view, 'action', None)) or getattr(view, 'throttle_scope', None)
+        if not self.scope:
+            return True
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'user_{request.user.pk}'
+        return f'ip_{self.get_ident(request)}'
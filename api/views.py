@@ -1,18 +1,32 @@
 from django.shortcuts import render
 from rest_framework.permissions import AllowAny
 from rest_framework import viewsets
-from .models import Notification, Product, ProductImage, Proposal, User, UserRating
-from .serializers import NotificationSerializer, ProductImageSerializer, ProductSerializer, ProposalSerializer, UserSerializer, UserRatingSerializer
+from .models import Category, FeedEntry, Notification, Product, ProductImage, ProductImport, Proposal, User, UserRating
+from .serializers import CategoryCatalogSerializer, UserStatsSerializer, NotificationSerializer, ProductImportSerializer, ProductImageSerializer, ProductSerializer, ProposalSerializer, UserSerializer, UserRatingSerializer
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.decorators import action
 from rest_framework import viewsets, filters
+from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q
+from datetime import timezone as dt_timezone
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .categories import category_cache
+from .feed import get_user_feed
+from .idempotency import IdempotentMixin
+from .inbox import etag_for, removed_since, sync_horizon
+from .stats import get_stats
+from .imports import enqueue_import
+from .throttling import AnonBucketThrottle, ScopedBucketThrottle
+from .writes import group_commit
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(IdempotentMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
@@ -24,9 +38,36 @@ class ProductViewSet(viewsets.ModelViewSet):
     search_fields = ['title']
     # para ?category=1 — filtra product__category_id=1
     filterset_fields = ['category', 'user']
+    throttle_scopes = {'import_products': 'upload'}
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['post'], url_path='import',
+            parser_classes=[MultiPartParser, FormParser])
+    def import_products(self, request):
+        """
+        POST /products/import/ com `file` (CSV ou JSON lines; `format`
+        opcional, senão pela extensão). Responde 202 com o job na fila: a
+        importação roda em segundo plano e o progresso e os erros por
+        linha ficam em /products/import/{id}/.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['Envie o arquivo no campo "file".']})
+        fmt = request.data.get('format') or ('csv' if upload.name.lower().endswith('.csv') else 'jsonl')
+        if fmt not in ('csv', 'jsonl'):
+            raise ValidationError({'format': ['Use "csv" ou "jsonl".']})
+
+        job = enqueue_import(request.user, upload, fmt)
+        return Response(ProductImportSerializer(job).data, status=202)
+
+    @action(detail=False, methods=['get'], url_path=r'import/(?P<job_id>\d+)')
+    def import_status(self, request, job_id=None):
+        job = ProductImport.objects.filter(pk=job_id, user=request.user).first()
+        if job is None:
+            raise NotFound()
+        return Response(ProductImportSerializer(job).data)
         
     def perform_update(self, serializer):
         product = serializer.save(user=self.request.user)
@@ -34,27 +75,65 @@ class ProductViewSet(viewsets.ModelViewSet):
         product.images.all().delete()
     
     
+class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Endpoint para /categories/
+    Catálogo de categorias com a quantidade de produtos disponíveis.
+    Servido do cache em memória: não consulta o banco a cada chamada.
+    """
+    queryset = Category.objects.all()
+    serializer_class = CategoryCatalogSerializer
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        return Response(category_cache.all())
+
+    def retrieve(self, request, *args, **kwargs):
+        data = category_cache.get(int(kwargs['pk']), with_count=True) if kwargs['pk'].isdigit() else None
+        if data is None:
+            raise NotFound()
+        return Response(data)
+
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
     parser_classes = (MultiPartParser, FormParser)
+    throttle_scopes = {'create': 'signup', 'update': 'upload', 'partial_update': 'upload'}
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Endpoint para /users/{id}/stats/
+        Contadores do perfil numa leitura só (tabela UserStats).
+        """
+        stats = get_stats(pk) if str(pk).isdigit() else None
+        if stats is None:
+            raise NotFound()
+        return Response(UserStatsSerializer(stats).data)
     
     
-class ProductImageViewSet(viewsets.ModelViewSet):
+class ProductImageViewSet(IdempotentMixin, viewsets.ModelViewSet):
     """
     Endpoint para /products/{product_pk}/images/
     GET, POST, PUT, DELETE das imagens de um produto.
     """
     serializer_class = ProductImageSerializer
     parser_classes = (MultiPartParser, FormParser)
+    throttle_scopes = {'create': 'upload', 'update': 'upload', 'partial_update': 'upload'}
 
     def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ProductImage.objects.none()
         return ProductImage.objects.filter(product_id=self.kwargs['product_pk'])
 
     def get_serializer_context(self):
         # passa o product para o serializer
         context = super().get_serializer_context()
+        # na geração do schema (drf_yasg) não há product_pk
+        if getattr(self, 'swagger_fake_view', False):
+            return context
         context['product'] = Product.objects.get(pk=self.kwargs['product_pk'])
         return context
 
@@ -68,6 +147,10 @@ class ProductImageViewSet(viewsets.ModelViewSet):
 
 class CustomAuthToken(ObtainAuthToken):
     """Gera o token e retorna também os dados do usuário."""
+    # cada tentativa custa um hash PBKDF2: limita por IP
+    throttle_classes = [AnonBucketThrottle, ScopedBucketThrottle]
+    throttle_scope = 'login'
+
     def post(self, request, *args, **kwargs):
         # valida username+password
         serializer = self.serializer_class(
@@ -91,29 +174,84 @@ class CustomAuthToken(ObtainAuthToken):
         })
         
 
-class ProposalViewSet(viewsets.ModelViewSet):
+class ProposalViewSet(IdempotentMixin, viewsets.ModelViewSet):
     serializer_class = ProposalSerializer
     queryset = Proposal.objects.all()
+    throttle_scopes = {'create': 'proposal'}
 
     def get_queryset(self):
+        # geração do schema do swagger não tem usuário
+        if getattr(self, 'swagger_fake_view', False):
+            return Proposal.objects.none()
         user = self.request.user
         tab  = self.request.query_params.get('tab')
+        # usuários e produtos aparecem na resposta e nas notificações; os
+        # produtos são serializados direto das linhas (ver ProposalSerializer)
+        proposals = Proposal.objects.select_related(
+            'from_user__stats', 'to_user__stats',
+            'product_offered__user__stats', 'product_offered__category',
+            'product_requested__user__stats', 'product_requested__category',
+        ).prefetch_related('product_offered__images', 'product_requested__images')
 
         if self.action in ('retrieve', 'update', 'partial_update', 'destroy'):
-            return Proposal.objects.filter(Q(from_user=user) | Q(to_user=user))
+            return proposals.filter(Q(from_user=user) | Q(to_user=user))
 
         if tab == 'recebidas':
-            return Proposal.objects.filter(to_user=user).order_by('-id')
+            return proposals.filter(to_user=user).order_by('-id')
         if tab == 'enviadas':
-            return Proposal.objects.filter(from_user=user).order_by('-id')
+            return proposals.filter(from_user=user).order_by('-id')
 
         return Proposal.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        """
+        Listagem das abas com ETag (versão da caixa do usuário) e sync
+        incremental via ?updated_since=<ISO 8601>.
+        """
+        tab = request.query_params.get('tab')
+        updated_since = request.query_params.get('updated_since')
+        etag = etag_for(request.user, tab, updated_since)
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')]:
+            # nada mudou: nenhuma query nas propostas
+            return Response(status=304, headers={'ETag': etag})
+
+        if updated_since is None:
+            response = super().list(request, *args, **kwargs)
+        else:
+            since = parse_datetime(updated_since)
+            if since is None:
+                raise ValidationError({'updated_since': ['Data inválida; use ISO 8601.']})
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, dt_timezone.utc)
+            if since < sync_horizon():
+                return Response({'detail': 'updated_since muito antigo; faça o sync completo.'}, status=410)
+
+            # marca o instante antes das consultas: é o próximo updated_since
+            server_time = timezone.now()
+            changed = (
+                self.get_queryset()
+                .filter(updated_at__gt=since)
+                .exclude(status=Proposal.Status.CANCELED)
+            )
+            response = Response({
+                'results': self.get_serializer(changed, many=True).data,
+                'removed': removed_since(request.user, tab, since) if tab in ('recebidas', 'enviadas') else [],
+                'server_time': server_time,
+            })
+        response['ETag'] = etag
+        return response
+
     def perform_create(self, serializer):
+        # proposta + notificação numa transação (agrupada sob carga, ver api/writes.py)
+        group_commit.run(lambda: self._create_with_notification(serializer))
+
+    def _create_with_notification(self, serializer):
         # 1) Salva a proposta
         proposal = serializer.save(from_user=self.request.user)
 
         # 2) Cria a notificação para quem vai receber a proposta
+        # (from_user é o request.user: já carregado)
         Notification.objects.create(
             user=proposal.to_user,
             type=Notification.Type.NEW_PROPOSAL,
@@ -122,62 +260,70 @@ class ProposalViewSet(viewsets.ModelViewSet):
             related_id=proposal.id,
             link_to=f"/proposals"
         )
-        
+        return proposal
+
     def perform_update(self, serializer):
-        # 1) pega status antes de atualizar
-        proposal = self.get_object()
-        old_status = proposal.status
+        # 1) pega status antes de atualizar: a instância já veio do get_object
+        # (com usuários e produtos), sem buscar de novo
+        old_status = serializer.instance.status
+        group_commit.run(lambda: self._update_with_notification(serializer, old_status))
 
+    def _update_with_notification(self, serializer, old_status):
         # 2) salva mudanças
         updated = serializer.save()
         new_status = updated.status
 
         # 3) se mudou, cria notificação com link_to adequado
         if new_status != old_status:
-            # tradutores
-            status_map = {
-                Proposal.Status.PENDING:   "Pendente",
-                Proposal.Status.ACCEPTED:  "Aceita!",
-                Proposal.Status.REJECTED:  "Rejeitada",
-                Proposal.Status.COMPLETED: "Concluída",
-                Proposal.Status.CANCELED:  "Cancelada",
-            }
-            traduzido = status_map[new_status]
-
-            # define tipo e link_to
-            if new_status == Proposal.Status.ACCEPTED:
-                notif_type = Notification.Type.PROPOSAL_ACCEPTED
-                # quem aceitou é o to_user do objeto
-                contato = updated.to_user
-                # monta whatsapp: assume número em formato E.164 sem '+'
-                whatsapp_url = f"https://wa.me/{contato.phone}"
-                link = whatsapp_url
-            elif new_status == Proposal.Status.REJECTED:
-                notif_type = Notification.Type.PROPOSAL_REJECTED
-                link = "/proposals"
-            else:
-                # para outros status, reutilize GENERAL
-                notif_type = Notification.Type.GENERAL
-                link = "/proposals"
-                
-            responsavel  = updated.to_user.fullName or updated.to_user.username
-
-            # nome do produto (aqui o solicitado; ajuste se quiser o oferecido)
-            nome_produto = updated.product_requested.title
-            action = ''
-            if traduzido == 'Aceita!':
-                action = 'aceitou'
-            elif traduzido == 'Rejeitada':
-                action = 'recusou'
-
-            Notification.objects.create(
-                user=updated.from_user,         # quem recebe a notificação
-                type=notif_type,
-                title=f"Sua proposta foi {traduzido}",
-                message=f"{responsavel} {action} sua proposta para o produto {nome_produto}",
-                related_id=updated.id,
-                link_to=link
-            )
+            Notification.objects.create(**self._status_notification(updated))
+        return updated
+
+    def _status_notification(self, updated):
+        new_status = updated.status
+        # tradutores
+        status_map = {
+            Proposal.Status.PENDING:   "Pendente",
+            Proposal.Status.ACCEPTED:  "Aceita!",
+            Proposal.Status.REJECTED:  "Rejeitada",
+            Proposal.Status.COMPLETED: "Concluída",
+            Proposal.Status.CANCELED:  "Cancelada",
+        }
+        traduzido = status_map[new_status]
+
+        # define tipo e link_to
+        if new_status == Proposal.Status.ACCEPTED:
+            notif_type = Notification.Type.PROPOSAL_ACCEPTED
+            # quem aceitou é o to_user do objeto
+            contato = updated.to_user
+            # monta whatsapp: assume número em formato E.164 sem '+'
+            whatsapp_url = f"https://wa.me/{contato.phone}"
+            link = whatsapp_url
+        elif new_status == Proposal.Status.REJECTED:
+            notif_type = Notification.Type.PROPOSAL_REJECTED
+            link = "/proposals"
+        else:
+            # para outros status, reutilize GENERAL
+            notif_type = Notification.Type.GENERAL
+            link = "/proposals"
+
+        responsavel  = updated.to_user.fullName or updated.to_user.username
+
+        # nome do produto (aqui o solicitado; ajuste se quiser o oferecido)
+        nome_produto = updated.product_requested.title
+        action = ''
+        if traduzido == 'Aceita!':
+            action = 'aceitou'
+        elif traduzido == 'Rejeitada':
+            action = 'recusou'
+
+        return dict(
+            user=updated.from_user,         # quem recebe a notificação
+            type=notif_type,
+            title=f"Sua proposta foi {traduzido}",
+            message=f"{responsavel} {action} sua proposta para o produto {nome_produto}",
+            related_id=updated.id,
+            link_to=link
+        )
 
 
 class NotificationViewSet(viewsets.ModelViewSet):
@@ -186,11 +332,40 @@ class NotificationViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'patch', 'head', 'options']
 
     def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Notification.objects.none()
         return Notification.objects.filter(user=self.request.user).order_by('-created_at')
     
     
-class UserRatingViewSet(viewsets.ModelViewSet):
+class UserRatingViewSet(IdempotentMixin, viewsets.ModelViewSet):
     serializer_class = UserRatingSerializer
     queryset = UserRating.objects.all()
     http_method_names = ['get', 'post', 'patch', 'head', 'options']
-    
\ No newline at end of file
+
+
+class FeedPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class FeedViewSet(viewsets.GenericViewSet):
+    """
+    Endpoint para /feed/
+    Produtos disponíveis ranqueados para o usuário logado.
+    """
+    serializer_class = ProductSerializer
+    pagination_class = FeedPagination
+
+    def get_queryset(self):
+        # geração do schema do swagger não tem usuário
+        if getattr(self, 'swagger_fake_view', False):
+            return FeedEntry.objects.none()
+        return get_user_feed(self.request.user).select_related(
+            'product__user', 'product__category'
+        ).prefetch_related('product__images')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer([entry.product for entry in page], many=True)
+        return self.get_paginated_response(serializer.data)
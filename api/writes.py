@@ -0,0 +1,138 @@
+# api/writes.py
+"""
+Caminho de escrita de propostas e notificações.
+
+Cada escrita (proposta + notificação + o que os signals atualizam) roda
+numa transação só. Sob carga as transações de requisições concorrentes
+são agrupadas (group commit): quem chega enquanto outra leva está sendo
+gravada entra na fila, e a thread líder seguinte grava a fila inteira numa
+transação, cada escrita no seu savepoint, com um único commit (um fsync
+no SQLite) para todas. Sem concorrência a líder grava só a própria
+escrita, sem esperar nada.
+
+O commit único exige uma conexão só: as escritas de outras threads rodam
+na transação da líder, cada uma isolada no seu savepoint (o erro de uma
+volta só para a requisição dela). Os callbacks de `on_commit` registrados
+por cada escrita são tirados da conexão da líder e rodam depois do commit
+na thread dona, com a conexão dela: o trabalho pós-commit (e os erros
+dele) de uma requisição não atrasa nem derruba as outras. O lote é
+limitado por WRITE_GROUP_COMMIT_MAX. Quem já está dentro de uma transação
+(ex.: testes) grava direto, sem fila.
+
+Vem desligado (WRITE_GROUP_COMMIT): com uma transação IMMEDIATE por
+requisição o SQLite já serializa as escritas, e nas medições com
+`manage.py bench_proposals` o lote não aumentou a vazão e subiu a
+latência. Ligue só com números do próprio ambiente.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+GROUP_COMMIT = getattr(settings, 'WRITE_GROUP_COMMIT', False)
+MAX_BATCH = getattr(settings, 'WRITE_GROUP_COMMIT_MAX', 64)
+
+
+class _Write:
+    __slots__ = ('fn', 'done', 'promoted', 'result', 'error', 'callbacks')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = threading.Event()
+        self.promoted = False
+        self.result = None
+        self.error = None
+        self.callbacks = []
+
+    def finish(self):
+        """Na thread dona: levanta o erro da escrita ou roda os seus on_commit."""
+        if self.error is not None:
+            raise self.error
+        # como o Django faz com os on_commit: robust só registra o erro
+        for _sids, func, robust in self.callbacks:
+            if not robust:
+                func()
+                continue
+            try:
+                func()
+            except Exception:
+                logger.exception('Erro num callback on_commit robusto (%s)', func)
+        return self.result
+
+
+class GroupCommitter:
+    def __init__(self, enabled=GROUP_COMMIT, max_batch=MAX_BATCH):
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self._queue = []
+        self._leading = False
+        self._lock = threading.Lock()
+        self.stats = {'writes': 0, 'commits': 0}
+
+    def run(self, fn):
+        """Executa `fn()` numa transação e devolve o resultado (ou levanta o erro)."""
+        if not self.enabled or connection.in_atomic_block:
+            with transaction.atomic():
+                return fn()
+
+        write = _Write(fn)
+        with self._lock:
+            self._queue.append(write)
+            lead = not self._leading
+            self._leading = True
+        if not lead:
+            write.done.wait()
+            # a líder anterior terminou e passou a vez para esta escrita
+            lead = write.promoted
+        if lead:
+            self._lead()
+        return write.finish()
+
+    def _lead(self):
+        with self._lock:
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+        try:
+            self._commit(batch)
+        finally:
+            with self._lock:
+                if self._queue:
+                    following = self._queue[0]
+                    following.promoted = True
+                    following.done.set()
+                else:
+                    self._leading = False
+            for write in batch:
+                write.done.set()
+
+    def _commit(self, batch):
+        try:
+            with transaction.atomic():
+                for write in batch:
+                    pending = len(connection.run_on_commit)
+                    try:
+                        # erro numa escrita não derruba as outras do lote
+                        with transaction.atomic():
+                            write.result = write.fn()
+                    except Exception as exc:
+                        write.error = exc
+                    # os on_commit da escrita rodam na thread dona (write.finish);
+                    # os de um savepoint desfeito o Django já descartou
+                    write.callbacks = connection.run_on_commit[pending:]
+                    del connection.run_on_commit[pending:]
+        except Exception as exc:
+            # o commit falhou: nada do lote foi gravado
+            for write in batch:
+                write.result = None
+                write.callbacks = []
+                write.error = write.error or exc
+        self.stats['writes'] += len(batch)
+        self.stats['commits'] += 1
+
+
+group_commit = GroupCommitter()
@@ -1,7 +1,2 @@
 # core/__init__.py
-
-import cloudinary
-from django.conf import settings
-
-# Só aqui, depois de o settings já estarem carregados:
-cloudinary.config(**settings.CLOUDINARY)
\ No newline at end of file
+# O Cloudinary é configurado sob demanda, no primeiro upload (api/cloud.py).
@@ -0,0 +1,122 @@
+# core/schema.py
+"""
+Documentação OpenAPI (Swagger/ReDoc).
+
+O schema é gerado uma vez por processo, na primeira requisição
+(OPENAPI_SCHEMA_SOURCE = 'generate'), ou lido do arquivo pré-gerado no
+deploy com `manage.py generate_schema` ('file', perfil de produção), e
+fica memorizado com um ETag do hash do conteúdo: clientes e geradores de
+código revalidam com If-None-Match e recebem 304. As páginas do Swagger UI
+e do ReDoc buscam o spec nessa mesma rota.
+
+O drf_yasg só é importado quando o schema é gerado ou uma página de
+documentação é chamada, e não no boot de cada worker.
+"""
+import hashlib
+import threading
+from functools import cache
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import condition
+from rest_framework import permissions
+
+
+INFO = {
+    'title': "Trokaí API",
+    'default_version': 'v1',
+    'description': "Documentação Swagger da API do Trokaí",
+}
+
+CONTENT_TYPES = {
+    '.json': 'application/json',
+    '.yaml': 'application/yaml',
+}
+
+
+class CachedSchema:
+    def __init__(self, content, content_type):
+        self.content = content
+        self.content_type = content_type
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+_cached = {}
+_lock = threading.Lock()
+
+
+@cache
+def schema_view():
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view
+
+    return get_schema_view(
+        openapi.Info(**INFO),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+
+
+@cache
+def _ui_view(ui):
+    # sem schema: a página busca o spec em schema-json (SPEC_URL)
+    return schema_view().with_ui(ui, cache_timeout=0)
+
+
+def swagger_ui(request):
+    return _ui_view('swagger')(request)
+
+
+def redoc_ui(request):
+    return _ui_view('redoc')(request)
+
+
+def generate(format='.json'):
+    """Schema serializado (bytes), sem depender de uma requisição."""
+    from drf_yasg import openapi
+    from drf_yasg.app_settings import swagger_settings
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+
+    generator = swagger_settings.DEFAULT_GENERATOR_CLASS(openapi.Info(**INFO))
+    if format == '.yaml':
+        codec = OpenAPICodecYaml(validators=[])
+    else:
+        codec = OpenAPICodecJson(validators=[], pretty=True)
+    return codec.encode(generator.get_schema(request=None, public=True))
+
+
+def _load(format):
+    if settings.OPENAPI_SCHEMA_SOURCE == 'file':
+        if format != '.json':
+            raise Http404('Só swagger.json é pré-gerado.')
+        try:
+            content = settings.OPENAPI_SCHEMA_FILE.read_bytes()
+        except FileNotFoundError:
+            raise Http404('Schema não gerado; rode `manage.py generate_schema` no deploy.')
+    else:
+        content = generate(format)
+    return CachedSchema(content, CONTENT_TYPES[format])
+
+
+def cached(format='.json'):
+    entry = _cached.get(format)
+    if entry is None:
+        # requisições simultâneas no primeiro acesso geram uma vez só
+        with _lock:
+            entry = _cached.get(format)
+            if entry is None:
+                entry = _cached[format] = _load(format)
+    return entry
+
+
+def reset():
+    _cached.clear()
+
+
+@condition(etag_func=lambda request, format='.json': cached(format).etag)
+def schema(request, format='.json'):
+    entry = cached(format)
+    response = HttpResponse(entry.content, content_type=entry.content_type)
+    # sempre revalida: o ETag muda a cada deploy que altera a API
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -66,6 +66,21 @@ CLOUDINARY = {
     'api_secret': os.getenv('CLOUDINARY_API_SECRET'),
 }
 
+# Documentação (Swagger/ReDoc) gerada pelo drf_yasg. Desligada no perfil
+# de produção, que serve o schema pré-gerado em OPENAPI_SCHEMA_FILE.
+SWAGGER_ENABLED = True
+OPENAPI_SCHEMA_FILE = BASE_DIR / 'openapi.json'
+# 'generate': gera na primeira requisição; 'file': lê OPENAPI_SCHEMA_FILE
+OPENAPI_SCHEMA_SOURCE = 'generate'
+
+# as páginas do Swagger UI/ReDoc buscam o spec memorizado
+SWAGGER_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
 CORS_ALLOW_ALL_ORIGINS = True   # ou defina uma lista em CORS_ALLOWED_ORIGINS
 
 ROOT_URLCONF = 'core.urls'
@@ -97,8 +112,47 @@ REST_FRAMEWORK = {
     'django_filters.rest_framework.DjangoFilterBackend',
     'rest_framework.filters.SearchFilter',
   ],
+  'DEFAULT_THROTTLE_CLASSES': [
+    'api.throttling.AnonBucketThrottle',
+    'api.throttling.UserBucketThrottle',
+    'api.throttling.ScopedBucketThrottle',
+  ],
+  'DEFAULT_THROTTLE_RATES': {
+    'anon':     '120/min',
+    'user':     '600/min',
+    'login':    '10/min',
+    'signup':   '20/hour',
+    'proposal': '60/hour',
+    'upload':   '120/hour',
+  },
+  # proxies reversos na frente da aplicação: o IP do throttling é o
+  # X-Forwarded-For informado pelo último deles (0: REMOTE_ADDR, ignora o cabeçalho)
+  'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
 }
 
+# Throttling: sem alias os baldes ficam em memória em cada processo;
+# com um alias (ex.: 'default' apontando para Redis) são compartilhados.
+THROTTLE_CACHE_ALIAS = os.getenv('THROTTLE_CACHE_ALIAS') or None
+THROTTLE_MAX_ENTRIES = 10000
+
+# Cache em dois níveis (api/cache.py): sem alias cada processo só tem o
+# próprio L1; com um alias o L2 e as invalidações são compartilhados entre
+# os workers. 'shared' (em disco) serve para vários workers num host só;
+# em mais de um host aponte para Redis/Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('SHARED_CACHE_LOCATION') or BASE_DIR / '.cache' / 'shared',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+SHARED_CACHE_ALIAS = os.getenv('SHARED_CACHE_ALIAS') or None
+CACHE_LOCAL_TTL = 10
+CACHE_INVALIDATION_POLL = 1.0
+
 WSGI_APPLICATION = 'core.wsgi.application'
 
 
@@ -109,9 +163,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # transações de escrita pegam o lock já no BEGIN: sob concorrência
+            # esperam a vez (timeout) em vez de falhar com "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+# Importação em massa (api/imports.py): cópia dos arquivos na fila, se o
+# próprio worker web processa os jobs e quando um job sem sinal é dado como
+# perdido. O `process_imports` processa a fila fora dos workers.
+IMPORT_SPOOL_DIR = Path(os.getenv('IMPORT_SPOOL_DIR') or BASE_DIR / '.imports')
+IMPORT_RUN_IN_PROCESS = os.getenv('IMPORT_RUN_IN_PROCESS', '1') == '1'
+IMPORT_STALE_SECONDS = 600
+
+# Escritas de propostas/notificações concorrentes num único commit (api/writes.py).
+# Desligado: no SQLite o ganho não se reproduz; meça com bench_proposals antes de ligar
+WRITE_GROUP_COMMIT = False
+WRITE_GROUP_COMMIT_MAX = 64
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
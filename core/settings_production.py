@@ -0,0 +1,36 @@
+"""
+Perfil de produção: DJANGO_SETTINGS_MODULE=core.settings_production.
+
+Sem DEBUG e sem Swagger/ReDoc. O drf_yasg e o app do Cloudinary (não
+usamos seus templates nem campos) ficam fora do INSTALLED_APPS para não
+pesarem no boot dos workers; o `swagger.json` sai do arquivo gerado no
+deploy com `python manage.py generate_schema`.
+"""
+
+import copy
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, INSTALLED_APPS
+
+DEBUG = False
+
+# nunca cai na chave de desenvolvimento versionada em core/settings.py
+SECRET_KEY = os.getenv('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Defina DJANGO_SECRET_KEY para o perfil de produção.')
+
+# WAL: leituras não esperam o commit de quem está escrevendo. O modo fica
+# gravado no arquivo do banco, por isso só aqui: em desenvolvimento o
+# db.sqlite3 versionado não é reescrito
+DATABASES = copy.deepcopy(DATABASES)
+DATABASES['default']['OPTIONS']['init_command'] = 'PRAGMA journal_mode=WAL;'
+
+ALLOWED_HOSTS = [host.strip() for host in os.getenv('ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in ('drf_yasg', 'cloudinary')]
+
+SWAGGER_ENABLED = False
+OPENAPI_SCHEMA_SOURCE = 'file'
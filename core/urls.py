@@ -1,13 +1,13 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.views.generic import RedirectView
-from rest_framework import routers, permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from rest_framework import routers
 from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework_nested import routers as nested_routers
 
-from api.views import CustomAuthToken, NotificationViewSet, ProductImageViewSet, ProductViewSet, ProposalViewSet, UserViewSet, UserRatingViewSet
+from core import schema
+from api.views import CategoryViewSet, CustomAuthToken, FeedViewSet, NotificationViewSet, ProductImageViewSet, ProductViewSet, ProposalViewSet, UserViewSet, UserRatingViewSet
 
 router = routers.DefaultRouter()
 router.register(r'users',    UserViewSet)
@@ -15,22 +15,14 @@ router.register(r'products', ProductViewSet)
 router.register(r'proposal', ProposalViewSet)
 router.register(r'notifications', NotificationViewSet)
 router.register(r'rating', UserRatingViewSet)
+router.register(r'feed', FeedViewSet, basename='feed')
+router.register(r'categories', CategoryViewSet)
 
 # cria um router aninhado para /products/{product_pk}/images
 products_router = nested_routers.NestedSimpleRouter(router, r'products', lookup='product')
 products_router.register(r'images', ProductImageViewSet, basename='product-images')
 
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Trokaí API",
-      default_version='v1',
-      description="Documentação Swagger da API do Trokaí",
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
-
 urlpatterns = [
     path('admin/', admin.site.urls),
 
@@ -39,30 +31,38 @@ urlpatterns = [
     path('api/', include(products_router.urls)),
     
     path('api-token-auth/', CustomAuthToken.as_view(), name='api_token_auth'),
+]
 
-    # JSON/YAML schema
-    re_path(
-        r'^swagger(?P<format>\.json|\.yaml)$',
-        schema_view.without_ui(cache_timeout=0),
-        name='schema-json'
-    ),
+if settings.SWAGGER_ENABLED:
+    urlpatterns += [
+        # JSON/YAML schema (memorizado, com ETag)
+        re_path(
+            r'^swagger(?P<format>\.json|\.yaml)$',
+            schema.schema,
+            name='schema-json'
+        ),
 
-    # Swagger UI
-    path(
-        'swagger/',
-        schema_view.with_ui('swagger', cache_timeout=0),
-        name='schema-swagger-ui'
-    ),
-    # ReDoc UI
-    path(
-        'redoc/',
-        schema_view.with_ui('redoc', cache_timeout=0),
-        name='schema-redoc'
-    ),
+        # Swagger UI
+        path(
+            'swagger/',
+            schema.swagger_ui,
+            name='schema-swagger-ui'
+        ),
+        # ReDoc UI
+        path(
+            'redoc/',
+            schema.redoc_ui,
+            name='schema-redoc'
+        ),
 
-    # redirect raiz para Swagger UI
-    path(
-        '',
-        RedirectView.as_view(pattern_name='schema-swagger-ui', permanent=False)
-    ),
-]
+        # redirect raiz para Swagger UI
+        path(
+            '',
+            RedirectView.as_view(pattern_name='schema-swagger-ui', permanent=False)
+        ),
+    ]
+else:
+    # produção: só o schema pré-gerado (manage.py generate_schema), sem drf_yasg
+    urlpatterns += [
+        path('swagger.json', schema.schema, name='schema-json'),
+    ]